@@ -0,0 +1,290 @@
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import instrumentation
+import line_apis
+
+
+# canonical competition -> TAB's (sport, competition) names from its tab-info-service urls
+TAB_COMPETITIONS = {
+    'NBA': ('Basketball', 'NBA'),
+    'NFL': ('American Football', 'NFL'),
+    'AFL': ('AFL Football', 'AFL'),
+    'NRL': ('Rugby League', 'NRL'),
+}
+
+# normalized name -> canonical normalized name, for names the bookmakers disagree on beyond a dropped word
+TEAM_ALIASES = {
+    'la clippers': 'los angeles clippers',
+    'la lakers': 'los angeles lakers',
+    'gws giants': 'greater western sydney giants',
+    'gws': 'greater western sydney giants',
+}
+
+
+def _timestamp(value):
+    """Seconds since the epoch from an ISO 8601 string, a {'seconds': ...} dict or a number"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return float(value['seconds'])
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone(timezone.utc).timestamp()
+
+
+def _event(book, event_id, competition, home, away, start_time):
+    return {
+        'book': book,
+        'event_id': event_id,
+        'competition': competition,
+        'home': home,
+        'away': away,
+        'start_time': _timestamp(start_time),
+    }
+
+
+class BookmakerAdapter:
+    """Line fetching, and event discovery where the bookmaker supports it, for one bookmaker.
+
+    Subclasses provide get_lines(event_id, session, timeout) -> (teams, lines) as the line_apis getters.
+    Those with discovers = True also provide discovery_request(identifier) -> (url, headers) and
+    parse_discovery(response_dict, competition) -> event dicts, where identifier is the bookmaker's id for a
+    canonical competition from the competitions the adapter was built with. An event dict has keys 'book',
+    'event_id', 'competition', 'home', 'away' and 'start_time' (seconds since the epoch, None if unknown).
+    """
+
+    name = None
+    discovers = False
+
+    def __init__(self, competitions=None):
+        self.competitions = dict(competitions or {})
+
+    def discovery_request(self, identifier):
+        raise NotImplementedError
+
+    def parse_discovery(self, response_dict, competition):
+        raise NotImplementedError
+
+    def get_lines(self, event_id, session=None, timeout=None):
+        raise NotImplementedError
+
+    def discover(self, competition, session=None, timeout=None):
+        """Upcoming events of a canonical competition. Raises NotImplementedError if the bookmaker has no
+        discovery and KeyError if it has no identifier for the competition."""
+        if not self.discovers:
+            raise NotImplementedError(f'{self.name} has no event discovery, pass its event ids directly')
+        if competition not in self.competitions:
+            raise KeyError(f'{self.name} has no identifier for competition {competition!r}')
+        url, headers = self.discovery_request(self.competitions[competition])
+        response = line_apis._get(session, url, headers, timeout)
+        response_dict = line_apis.loads_json(response.content)
+        with instrumentation.timer('parse_discovery', book=self.name):
+            return self.parse_discovery(response_dict, competition)
+
+
+class TabAdapter(BookmakerAdapter):
+    """Competition responses list matches named '<home> v <away>'. Event ids are line_apis.tab_request's
+    '<sport>/<competition>/<match>' form, so they fetch lines for any competition"""
+
+    name = 'tab'
+    discovers = True
+
+    def __init__(self, competitions=TAB_COMPETITIONS):
+        super().__init__(competitions)
+
+    def discovery_request(self, identifier, jurisdiction='NSW'):
+        sport, competition = identifier
+        url = f'https://api.beta.tab.com.au/v1/tab-info-service/sports/{quote(sport)}/competitions/{quote(competition)}?jurisdiction={jurisdiction}'
+        return url, {'User-Agent': line_apis.USER_AGENT}
+
+    def parse_discovery(self, response_dict, competition):
+        sport, tab_competition = self.competitions[competition]
+        events = []
+        for match_dict in response_dict.get('matches', []):
+            home, _, away = match_dict['name'].partition(' v ')
+            event_id = '/'.join(quote(part, safe='') for part in (sport, tab_competition, match_dict['name']))
+            events.append(_event(self.name, event_id, competition, home, away, match_dict.get('startTime')))
+        return events
+
+    def get_lines(self, event_id, session=None, timeout=None):
+        return line_apis.tab_get_lines(event_id, session=session, timeout=timeout)
+
+
+class PointsbetAdapter(BookmakerAdapter):
+    """Lines only, event ids are PointsBet event keys. There is no discovery until it can be built against
+    recorded competition responses; ids found elsewhere join canonical events with EventMatcher.add"""
+
+    name = 'pointsbet'
+
+    def get_lines(self, event_id, session=None, timeout=None):
+        return line_apis.pointsbet_get_lines(event_id, session=session, timeout=timeout)
+
+
+class NedsAdapter(BookmakerAdapter):
+    """Lines only, event ids are Neds event uuids. As with PointsBet, ids found elsewhere join canonical events
+    with EventMatcher.add"""
+
+    name = 'neds'
+
+    def get_lines(self, event_id, session=None, timeout=None):
+        return line_apis.neds_get_lines(event_id, session=session, timeout=timeout)
+
+
+ADAPTERS = {}
+
+
+def register_adapter(adapter):
+    """Adds or replaces the adapter for adapter.name, returns the adapter"""
+    ADAPTERS[adapter.name] = adapter
+    return adapter
+
+
+for _adapter in (TabAdapter(), PointsbetAdapter(), NedsAdapter()):
+    register_adapter(_adapter)
+
+
+def discover_events(competitions, books=None, sessions=None, executor=None, max_workers=16, timeout=5, registry=None):
+    """Discovers every (competition, bookmaker) pair concurrently.
+    registry maps bookmaker to adapter (ADAPTERS if None), books defaults to those of its adapters that
+    discover. sessions maps bookmaker to a session, executor is an optional shared ThreadPoolExecutor.
+    Returns (events, errors) where errors maps (competition, book) to the exception it raised, including
+    bookmakers asked for that can't discover or have no identifier for the competition."""
+    registry = ADAPTERS if registry is None else registry
+    books = [book for book, adapter in registry.items() if adapter.discovers] if books is None else books
+    sessions = {} if sessions is None else sessions
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {(competition, book): executor.submit(registry[book].discover, competition,
+                                                         session=sessions.get(book), timeout=timeout)
+                   for competition in competitions for book in books}
+        events, errors = [], {}
+        for key, future in futures.items():
+            try:
+                events.extend(future.result())
+            except Exception as e:
+                errors[key] = e
+        return events, errors
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+def normalize_team_name(name):
+    """Lowercase ascii words with punctuation dropped and TEAM_ALIASES applied"""
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    name = ' '.join(re.sub(r'[^a-z0-9 ]+', ' ', name.lower().replace('&', ' and ')).split())
+    return TEAM_ALIASES.get(name, name)
+
+
+def team_names_match(a, b):
+    """Normalized names are the same team if one's words are a leading or trailing run of the other's,
+    e.g. 'golden state' and 'golden state warriors', or 'warriors' and 'golden state warriors'"""
+    if a == b:
+        return True
+    words_a, words_b = a.split(), b.split()
+    short, long = sorted((words_a, words_b), key=len)
+    return bool(short) and (long[:len(short)] == short or long[-len(short):] == short)
+
+
+class EventMatcher:
+    """Maps each bookmaker's events to canonical events: same competition, start times within time_tolerance
+    seconds (or either unknown) and both teams matching, with the same home and away sides.
+
+    Canonical events keep their key across calls, so match() can be run on every scheduled discovery and
+    new bookmaker ids join the event they belong to. A canonical event is a dict with
+        'key': '<competition>:<YYYYMMDD or tbc>:<home> v <away>' from the first bookmaker to list it, with a
+            ':<n>' suffix if an earlier event has that key
+        'competition', 'home', 'away', 'start_time'
+        'ids': {bookmaker: event id}, the event dict fetcher.LineFetcher takes
+    """
+
+    def __init__(self, time_tolerance=2*3600):
+        self.time_tolerance = time_tolerance
+        self.events = {}
+        # competition -> sorted [(start_time, key)]
+        self._by_start = {}
+        self._by_book_id = {}
+
+    def _candidates(self, competition, start_time):
+        """Keys of events that could match: those within time_tolerance, and those with an unknown start,
+        which _insert sorts to the front"""
+        starts = self._by_start.get(competition, [])
+        if start_time is None:
+            return [key for _, key in starts]
+        n_unknown = bisect_right(starts, (float('-inf'), '\uffff'))
+        low = bisect_left(starts, (start_time - self.time_tolerance, ''))
+        high = bisect_right(starts, (start_time + self.time_tolerance, '\uffff'))
+        return [key for _, key in starts[:n_unknown] + starts[low:high]]
+
+    def _insert(self, event):
+        start = event['start_time'] if event['start_time'] is not None else float('-inf')
+        starts = self._by_start.setdefault(event['competition'], [])
+        starts.insert(bisect_left(starts, (start, event['key'])), (start, event['key']))
+
+    def _remove(self, event):
+        start = event['start_time'] if event['start_time'] is not None else float('-inf')
+        starts = self._by_start[event['competition']]
+        del starts[bisect_left(starts, (start, event['key']))]
+
+    def _unique_key(self, key):
+        """key, or key with the first free ':<n>' suffix when another event already has it, e.g. two
+        unmatched events of the same teams with unknown start times"""
+        n = 2
+        unique_key = key
+        while unique_key in self.events:
+            unique_key = f'{key}:{n}'
+            n += 1
+        return unique_key
+
+    def add(self, book_event):
+        """Canonical event of one bookmaker event, created if nothing matches"""
+        book_key = (book_event['book'], book_event['event_id'])
+        key = self._by_book_id.get(book_key)
+        if key is not None:
+            return self.events[key]
+        home, away = normalize_team_name(book_event['home']), normalize_team_name(book_event['away'])
+        for key in self._candidates(book_event['competition'], book_event['start_time']):
+            event = self.events[key]
+            if book_event['book'] in event['ids']:
+                continue
+            if team_names_match(home, event['home']) and team_names_match(away, event['away']):
+                break
+        else:
+            start_time = book_event['start_time']
+            day = datetime.fromtimestamp(start_time, timezone.utc).strftime('%Y%m%d') if start_time is not None else 'tbc'
+            key = self._unique_key(f'{book_event["competition"]}:{day}:{home} v {away}')
+            event = {
+                'key': key,
+                'competition': book_event['competition'],
+                'home': home,
+                'away': away,
+                'start_time': start_time,
+                'ids': {},
+            }
+            self.events[key] = event
+            self._insert(event)
+        event['ids'][book_event['book']] = book_event['event_id']
+        if event['start_time'] is None and book_event['start_time'] is not None:
+            # move it out of the unknown start entries, so it is only a candidate near its start
+            self._remove(event)
+            event['start_time'] = book_event['start_time']
+            self._insert(event)
+        self._by_book_id[book_key] = event['key']
+        return event
+
+    def match(self, book_events):
+        """Canonical events of book_events, in order of first appearance. Events are added in ADAPTERS
+        order, so which bookmaker names an event doesn't depend on discovery timing."""
+        order = {book: k for k, book in enumerate(ADAPTERS)}
+        matched = {}
+        for book_event in sorted(book_events, key=lambda book_event: order.get(book_event['book'], len(order))):
+            event = self.add(book_event)
+            matched[event['key']] = event
+        return list(matched.values())
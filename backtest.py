@@ -0,0 +1,280 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import tools
+from line_store import LineStore
+from lines_book import LinesBook
+from pricing import MarginPricer, normal_margin_cdf
+
+
+DEFAULT_GRID = {
+    'tail_penalty': [0.0],
+    'weight_power': [1.0],
+}
+PRICE_COLUMNS = ['line_levels', 'home_prices', 'away_prices']
+
+
+def parameter_grid(grid):
+    """Every combination of a {parameter: values} grid, as a list of {parameter: value} dicts"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def sample_snapshots(store, event, book, start=None, end=None, sample_interval=None):
+    """LinesBooks of an event and book to backtest: only the last one in [start, end] (the closing line)
+    if sample_interval is None, otherwise the first snapshot of every sample_interval seconds"""
+    data = store.read(event, book, start, end, PRICE_COLUMNS)
+    timestamps, offsets = data['timestamps'], data['offsets']
+    if len(timestamps) == 0:
+        return []
+    if sample_interval is None:
+        picks = [len(timestamps) - 1]
+    else:
+        grid = np.arange(timestamps[0], timestamps[-1] + sample_interval, sample_interval)
+        picks = np.unique(np.minimum(np.searchsorted(timestamps, grid), len(timestamps) - 1))
+    return [LinesBook(*(np.asarray(data[column][offsets[s]:offsets[s + 1]], dtype=float) for column in PRICE_COLUMNS))
+            for s in picks]
+
+
+def spread_outcomes(line_levels, home_margin):
+    """(won, pushed) of home bets at line_levels given the final home margin (home minus away points)"""
+    d = -home_margin
+    return d < line_levels, d == line_levels
+
+
+def _new_stats(n_bins):
+    return {
+        'snapshots': 0,
+        'fit_failures': 0,
+        'lines': 0,
+        'log_loss_midpoint': 0.0,
+        'log_loss_fit': 0.0,
+        # per probability bin: count, sum of predictions, sum of outcomes
+        'calibration_midpoint': np.zeros((n_bins, 3)),
+        'calibration_fit': np.zeros((n_bins, 3)),
+        'bets': 0,
+        'predicted_ev': 0.0,
+        'realized_pnl': 0.0,
+    }
+
+
+def _merge_stats(stats, other):
+    for key, value in other.items():
+        stats[key] = stats[key] + value
+    return stats
+
+
+class _RowNormalPricer(MarginPricer):
+    """NormalPricer with its own (mu, sigma) for every element priced"""
+
+    def __init__(self, mu, sigma):
+        self.mu = mu
+        self.sigma = sigma
+
+    def margin_cdf(self, d):
+        return normal_margin_cdf(d, self.mu, self.sigma)
+
+
+def _score(stats, name, probs, won, book_index):
+    """Adds the log-loss and calibration of probs against outcomes won to each book's stats"""
+    probs = np.clip(probs, 1e-12, 1 - 1e-12)
+    log_likelihood = np.where(won, np.log(probs), np.log1p(-probs))
+    n_bins = len(stats[0]['calibration_' + name])
+    bins = np.minimum((probs * n_bins).astype(int), n_bins - 1)
+    for b, book_stats in enumerate(stats):
+        rows = book_index == b
+        book_stats['log_loss_' + name] -= float(log_likelihood[rows].sum())
+        calibration = book_stats['calibration_' + name]
+        calibration[:, 0] += np.bincount(bins[rows], minlength=n_bins)
+        calibration[:, 1] += np.bincount(bins[rows], probs[rows], minlength=n_bins)
+        calibration[:, 2] += np.bincount(bins[rows], won[rows], minlength=n_bins)
+
+
+def _fit_snapshots(books, weight_power):
+    """fit_normal_cdf_gauss_newton_batch over every snapshot, with the fit_normal_cdf width weights raised
+    to weight_power (0 weights every point equally, 1 is fit_normal_cdf)"""
+    x, y, sigma, mask = tools.pad_fit_data(books)
+    sigma = np.where(mask, sigma, 1)**weight_power
+    popt, _, _, _ = tools.fit_normal_cdf_gauss_newton_batch(x, y, sigma, mask)
+    return popt
+
+
+def load_samples(store, event, home_margin, books=None, start=None, end=None, sample_interval=None, min_width=1):
+    """Every sampled snapshot of an event, per bookmaker, with what scoring needs that doesn't depend on
+    the grid: (book, LinesBook of complete levels, home margin, (won, pushed), (i, j, theo odds) of its sweep pairs)"""
+    samples = []
+    for book_name in store.books(event) if books is None else books:
+        for snapshot in sample_snapshots(store, event, book_name, start, end, sample_interval):
+            snapshot = snapshot.complete()
+            if len(snapshot) == 0:
+                continue
+            _, odds_theo, _ = tools.opposing_lines_margin_matrix(snapshot, min_width)
+            i, j = np.nonzero(~np.ma.getmaskarray(odds_theo))
+            samples.append((book_name, snapshot, home_margin, spread_outcomes(snapshot.line_levels, home_margin),
+                            (i, j, odds_theo.data[i, j])))
+    return samples
+
+
+PUSH_RULES = ('reduce', 'void')
+
+
+def score_samples(samples, grid_points, min_ev=0.0, price_ratio=1.0, n_bins=10, push='reduce'):
+    """{(grid index, book): stats} over samples from load_samples.
+
+    All the samples are fitted in one batch per weight_power. Their settled lines and sweep pairs are
+    concatenated, so each grid point is scored in a few array operations whatever the number of events.
+    Sweep pairs are bet when their SGM, priced at price_ratio x the legs' theo odds, has at least min_ev under
+    the fit, as distribution.main's sweep would. A pair whose leg pushes while the other leg wins is settled
+    by push: 'reduce' pays the other leg at its own price, as same game multis usually settle, and 'void'
+    refunds the stake. The EV a pair is bet on counts its push settlement the same way."""
+    if push not in PUSH_RULES:
+        raise ValueError(f'push must be one of {PUSH_RULES}, not {push!r}')
+    if not samples:
+        return {}
+    book_names = sorted({sample[0] for sample in samples})
+    sample_books = np.array([book_names.index(sample[0]) for sample in samples])
+    snapshots = [snapshot for _, snapshot, _, _, _ in samples]
+    margins = np.array([home_margin for _, _, home_margin, _, _ in samples], dtype=float)
+
+    settled = [~pushed for _, _, _, (_, pushed), _ in samples]
+    line_sample = np.repeat(np.arange(len(samples)), [rows.sum() for rows in settled])
+    line_books = sample_books[line_sample]
+    line_levels = np.concatenate([snapshot.line_levels[rows] for snapshot, rows in zip(snapshots, settled)])
+    won = np.concatenate([won[rows] for (_, _, _, (won, _), _), rows in zip(samples, settled)]).astype(float)
+    upperbound_probs = np.concatenate([snapshot.upperbound_probs[rows] for snapshot, rows in zip(snapshots, settled)])
+    lowerbound_probs = np.concatenate([snapshot.lowerbound_probs[rows] for snapshot, rows in zip(snapshots, settled)])
+    theo_probs = (upperbound_probs + lowerbound_probs) / 2
+    width = upperbound_probs - lowerbound_probs
+
+    sweeps = [sweep for _, _, _, _, sweep in samples]
+    pair_sample = np.repeat(np.arange(len(samples)), [len(i) for i, _, _ in sweeps])
+    pair_books = sample_books[pair_sample]
+    lower = np.concatenate([snapshot.line_levels[i] for snapshot, (i, _, _) in zip(snapshots, sweeps)])
+    upper = np.concatenate([snapshot.line_levels[j] for snapshot, (_, j, _) in zip(snapshots, sweeps)])
+    prices = price_ratio * np.concatenate([odds_theo for _, _, odds_theo in sweeps])
+    # what a pair pays when its away leg at lower pushes (the home leg wins) or its home leg at upper does
+    if push == 'reduce':
+        lower_push_odds = np.concatenate([snapshot.home_prices[j] for snapshot, (_, j, _) in zip(snapshots, sweeps)])
+        upper_push_odds = np.concatenate([snapshot.away_prices[i] for snapshot, (i, _, _) in zip(snapshots, sweeps)])
+    else:
+        lower_push_odds = upper_push_odds = np.ones(len(prices))
+    d = -margins[pair_sample]
+    pair_pnl = np.select([(d > lower) & (d < upper), d == lower, d == upper],
+                         [prices - 1, lower_push_odds - 1, upper_push_odds - 1], -1.0)
+
+    fits = {power: _fit_snapshots(snapshots, power) for power in {point.get('weight_power', 1.0) for point in grid_points}}
+    results = {}
+    for g, point in enumerate(grid_points):
+        stats = [_new_stats(n_bins) for _ in book_names]
+        # LinesBook.midpoint_probs of every line at once
+        midpoint_probs = theo_probs + (theo_probs - 0.5) * point.get('tail_penalty', 0.0) * width / 2
+        _score(stats, 'midpoint', midpoint_probs, won, line_books)
+
+        popt = fits[point.get('weight_power', 1.0)]
+        fitted = np.isfinite(popt).all(axis=1) & (popt[:, 1] > 0)
+        mu, sigma = np.where(fitted, popt[:, 0], 0), np.where(fitted, popt[:, 1], 1)
+        rows = fitted[line_sample]
+        fit_win, _, fit_lose = _RowNormalPricer(mu[line_sample[rows]], sigma[line_sample[rows]]).spread_probs(line_levels[rows])
+        _score(stats, 'fit', fit_win / (fit_win + fit_lose), won[rows], line_books[rows])
+
+        pair_pricer = _RowNormalPricer(mu[pair_sample], sigma[pair_sample])
+        model_probs, _ = pair_pricer.band_probs(lower, upper)
+        # P(D == level) is zero at half points, where legs can't push
+        lower_push = np.where(lower == np.floor(lower), pair_pricer.margin_probs(np.floor(lower)), 0)
+        upper_push = np.where(upper == np.floor(upper), pair_pricer.margin_probs(np.floor(upper)), 0)
+        expected_ev = prices*model_probs + lower_push_odds*lower_push + upper_push_odds*upper_push - 1
+        bet = fitted[pair_sample] & (expected_ev >= min_ev)
+        for b, book_stats in enumerate(stats):
+            book_samples = sample_books == b
+            book_bets = bet & (pair_books == b)
+            book_stats['snapshots'] = int(book_samples.sum())
+            book_stats['fit_failures'] = int((book_samples & ~fitted).sum())
+            book_stats['lines'] = int((line_books == b).sum())
+            book_stats['bets'] = int(book_bets.sum())
+            book_stats['predicted_ev'] = float(expected_ev[book_bets].sum())
+            book_stats['realized_pnl'] = float(pair_pnl[book_bets].sum())
+            results[(g, book_names[b])] = book_stats
+    return results
+
+
+def _backtest_shard(args):
+    root, events, outcomes, grid_points, load_kwargs, score_kwargs = args
+    store = LineStore(root)
+    samples = [sample for event in events for sample in load_samples(store, event, outcomes[event], **load_kwargs)]
+    return score_samples(samples, grid_points, **score_kwargs)
+
+
+def summarise(stats):
+    """Per line log-losses, calibration tables of (mean prediction, observed rate, count) per bin,
+    and the predicted and realized EV per unit bet of the sweep signals"""
+    lines = stats['lines']
+    summary = {
+        'snapshots': stats['snapshots'],
+        'fit_failures': stats['fit_failures'],
+        'lines': lines,
+        'log_loss_midpoint': stats['log_loss_midpoint'] / lines if lines else np.nan,
+        'log_loss_fit': stats['log_loss_fit'] / lines if lines else np.nan,
+        'bets': stats['bets'],
+        'predicted_ev': stats['predicted_ev'] / stats['bets'] if stats['bets'] else np.nan,
+        'realized_ev': stats['realized_pnl'] / stats['bets'] if stats['bets'] else np.nan,
+    }
+    for name in ('midpoint', 'fit'):
+        calibration = stats['calibration_' + name]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            summary['calibration_' + name] = [(float(total_pred / count), float(total_won / count), int(count))
+                                              for count, total_pred, total_won in calibration if count]
+    return summary
+
+
+def run_backtest(root, outcomes, grid=None, events=None, books=None, processes=None, shards_per_process=4,
+                 start=None, end=None, sample_interval=None, min_ev=0.0, price_ratio=1.0, min_width=1, n_bins=10,
+                 push='reduce'):
+    """Replays a LineStore through fit_normal_cdf, midpoint_odds and the sweep EV logic for every point of a
+    parameter grid, and aggregates calibration, log-loss and realized EV per bookmaker.
+
+    outcomes maps each store event key to its final home margin (home minus away points); only events in
+    outcomes (and in events, if given) are run. grid maps 'tail_penalty' and/or 'weight_power' to lists of
+    values, see DEFAULT_GRID. Events are sharded across a process pool of processes workers; with processes
+    None or 1 everything runs in this process. Sweep bets are priced at price_ratio x the legs' theo odds,
+    as no SGM quotes are stored, and pairs with a pushed leg are settled by push as in score_samples.
+    Returns one row per (grid point, book): the grid point's parameters, 'book', and the summarise stats.
+    """
+    grid_points = parameter_grid(DEFAULT_GRID if grid is None else grid)
+    store = LineStore(root)
+    events = [event for event in (store.events() if events is None else events) if event in outcomes]
+    load_kwargs = {
+        'books': books,
+        'start': start,
+        'end': end,
+        'sample_interval': sample_interval,
+        'min_width': min_width,
+    }
+    score_kwargs = {
+        'min_ev': min_ev,
+        'price_ratio': price_ratio,
+        'n_bins': n_bins,
+        'push': push,
+    }
+    n_shards = max(1, min(len(events), (processes or 1) * shards_per_process))
+    shards = [(root, events[k::n_shards], {event: outcomes[event] for event in events[k::n_shards]}, grid_points,
+               load_kwargs, score_kwargs) for k in range(n_shards)]
+    if processes is not None and processes > 1 and len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            shard_results = list(executor.map(_backtest_shard, shards))
+    else:
+        shard_results = [_backtest_shard(shard) for shard in shards]
+
+    totals = {}
+    for shard_result in shard_results:
+        for key, stats in shard_result.items():
+            totals[key] = _merge_stats(totals[key], stats) if key in totals else stats
+    return [{**grid_points[g], 'book': book_name, **summarise(stats)} for (g, book_name), stats in sorted(totals.items())]
+
+
+def grid_search(root, outcomes, grid, metric='log_loss_fit', **kwargs):
+    """run_backtest over grid, rows sorted best first by metric (lowest for log-losses, highest otherwise)"""
+    rows = run_backtest(root, outcomes, grid, **kwargs)
+    sign = 1 if metric.startswith('log_loss') else -1
+    return sorted(rows, key=lambda row: (np.isnan(row[metric]), sign*row[metric]))
@@ -0,0 +1,57 @@
+"""Cross-book consensus fit and arb/middle/off-consensus scan of a whole tick.
+
+    python -m benchmarks.bench_consensus --events 15 100 300 --books 3
+"""
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+
+import consensus
+from line_apis import make_lines_book
+from benchmarks.fixtures import make_lines
+
+
+def random_events(n, n_books=3, seed=0):
+    """Events whose books agree on sigma but each shade mu a little and charge their own overround"""
+    rng = np.random.default_rng(seed)
+    events = {}
+    for k in range(n):
+        mu = rng.normal(0, 8)
+        events[k] = {}
+        for b in range(n_books):
+            _, lines = make_lines(int(rng.integers(20, 60)), mu=mu + rng.normal(0, 0.5), sigma=12,
+                                  overround=rng.uniform(0.03, 0.07))
+            events[k][f'book{b}'] = make_lines_book(lines)
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, nargs='+', default=[15, 100, 300])
+    parser.add_argument('--books', type=int, default=3)
+    parser.add_argument('--min-ev', type=float, default=0.0)
+    parser.add_argument('--max-width', type=float, default=20)
+    args = parser.parse_args()
+
+    print(f'{"events":>7} {"levels":>7} {"fit s":>7} {"top s":>7} {"scan s":>7} {"arbs":>6} {"middles":>8} {"off":>6}')
+    for n in args.events:
+        events = random_events(n, args.books)
+        n_levels = sum(len(book) for books in events.values() for book in books.values())
+        start = time.perf_counter()
+        models = consensus.consensus_models(events)
+        fit_time = time.perf_counter() - start
+        start = time.perf_counter()
+        next(consensus.scan(events, models, min_ev=args.min_ev, max_width=args.max_width), None)
+        top_time = time.perf_counter() - start
+        start = time.perf_counter()
+        found = list(consensus.scan(events, models, min_ev=args.min_ev, max_width=args.max_width))
+        scan_time = time.perf_counter() - start
+        counts = Counter(opportunity['kind'] for opportunity in found)
+        print(f'{n:>7} {n_levels:>7} {fit_time:>7.3f} {top_time:>7.3f} {scan_time:>7.3f} {counts["arb"]:>6} '
+              f'{counts["middle"]:>8} {counts["off_consensus"]:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Per-fit cost of fit_normal_cdf: scipy curve_fit vs analytic Gauss-Newton, cold and warm started.
+
+    python -m benchmarks.bench_fit --levels 10 40 --repeats 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+import tools
+from line_apis import make_lines_book
+from benchmarks.fixtures import make_lines
+
+
+def time_per_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', type=int, nargs='+', default=[10, 20, 40])
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'{"levels":>6} {"curve_fit us":>13} {"cold us":>9} {"warm us":>9} {"speedup":>8} {"max |dmu|":>10} {"max |dsigma|":>12} {"pcov rel":>9}')
+    for n_levels in args.levels:
+        _, lines = make_lines(n_levels)
+        book = make_lines_book(lines)
+        # a tick later: every price has moved slightly
+        _, moved_lines = make_lines(n_levels, mu=-3.8, sigma=12.1)
+        moved_book = make_lines_book(moved_lines)
+
+        reference = tools.fit_normal_cdf(book, method='curve_fit')
+        fast = tools.fit_normal_cdf(book)
+        fitter = tools.NormalCdfFitter()
+        fitter.fit('event', book)
+
+        curve_fit_time = time_per_call(lambda: tools.fit_normal_cdf(moved_book, method='curve_fit'), args.repeats)
+        cold_time = time_per_call(lambda: tools.fit_normal_cdf(moved_book), args.repeats)
+        warm_time = time_per_call(lambda: tools.fit_normal_cdf(moved_book, p0=fitter.previous['event']), args.repeats)
+
+        pcov_rel = np.abs(reference['pcov'] - fast['pcov']).max() / np.abs(reference['pcov']).max()
+        print(f'{n_levels:>6} {curve_fit_time*1e6:>13.0f} {cold_time*1e6:>9.0f} {warm_time*1e6:>9.0f} '
+              f'{curve_fit_time/warm_time:>7.1f}x {abs(reference["mu"] - fast["mu"]):>10.2e} '
+              f'{abs(reference["sigma"] - fast["sigma"]):>12.2e} {pcov_rel:>9.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Slate fitting: fit_normal_cdf per ladder vs fit_normal_cdf_batch, optionally over a process pool.
+
+    python -m benchmarks.bench_fit_batch --ladders 45 300 3000 --processes 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+import tools
+from line_apis import make_lines_book
+from benchmarks.fixtures import make_lines
+
+
+def random_books(n, seed=0):
+    rng = np.random.default_rng(seed)
+    books = []
+    for _ in range(n):
+        _, lines = make_lines(int(rng.integers(3, 45)), mu=rng.normal(0, 8), sigma=rng.uniform(9, 15),
+                              overround=rng.uniform(0.02, 0.08))
+        books.append(make_lines_book(lines))
+    return books
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ladders', type=int, nargs='+', default=[45, 300, 3000],
+                        help='45 is a 15 game slate across three books')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f'{"ladders":>8} {"loop s":>8} {"batch s":>8} {"speedup":>8} {"max |dmu|":>10}')
+    for n in args.ladders:
+        books = random_books(n)
+        start = time.perf_counter()
+        looped = [tools.fit_normal_cdf(book) for book in books]
+        loop_time = time.perf_counter() - start
+        start = time.perf_counter()
+        batch = tools.fit_normal_cdf_batch(books, processes=args.processes, chunk_size=args.chunk_size)
+        batch_time = time.perf_counter() - start
+        dmu = np.nanmax(np.abs(np.array([model['mu'] for model in looped]) - batch['mu']))
+        print(f'{n:>8} {loop_time:>8.3f} {batch_time:>8.3f} {loop_time/batch_time:>7.1f}x {dmu:>10.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Decode + parse time and peak Python heap per bookmaker over generated fixtures, per JSON backend.
+
+    python -m benchmarks.bench_parse --levels 40 --repeats 50
+
+'text' is the old json.loads(response.text) path. orjson and simdjson rows only appear when installed;
+simdjson's own parse buffer is allocated outside the Python heap, so tracemalloc does not see it.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import line_apis
+from benchmarks.fixtures import load_fixture
+
+
+PARSERS = {
+    'tab': line_apis.tab_parse_lines,
+    'pointsbet': line_apis.pointsbet_parse_lines,
+    'neds': line_apis.neds_parse_lines,
+}
+
+
+def backends(book):
+    rows = {
+        'text': lambda content: json.loads(content.decode()),
+        'json bytes': json.loads,
+    }
+    if line_apis.orjson is not None:
+        rows['orjson'] = line_apis.orjson.loads
+    if line_apis.simdjson is not None and book == 'neds':
+        rows['simdjson lazy'] = lambda content: line_apis.simdjson.Parser().parse(content)
+    return rows
+
+
+def measure(parse, decode, content, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        parse(decode(content))
+    elapsed = (time.perf_counter() - start) / repeats
+    tracemalloc.start()
+    parse(decode(content))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', type=int, default=40)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f'{"book":>10} {"backend":>14} {"KB":>6} {"parse ms":>9} {"peak KB":>8}')
+    for book, parse in PARSERS.items():
+        content = load_fixture(book, args.levels)
+        for name, decode in backends(book).items():
+            elapsed, peak = measure(parse, decode, content, args.repeats)
+            print(f'{book:>10} {name:>14} {len(content)/1024:>6.0f} {elapsed*1000:>9.2f} {peak/1024:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Cold start of each cli.py subcommand in a fresh interpreter: wall time and time spent importing.
+
+    python -m benchmarks.bench_startup --repeat 5
+
+fit and render read a fixture snapshot with --input, sweep also queries the stub TAB enquiry server. fetch
+goes through a proxy address nothing listens on, so its wall time is startup plus the retried refused
+connections.
+Rows for a bare interpreter and for importing distribution.py (the old all-in-one entry point) are baselines.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import make_lines
+from benchmarks.stub_tab_server import StubTabServer
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_snapshot(path, n_levels=40):
+    teams, lines = make_lines(n_levels)
+    snapshot = {
+        'event': {'tab': 'Home%20v%20Away'},
+        'timestamp': time.time(),
+        'teams': teams,
+        'lines': {book: make_lines(n_levels, mu=mu, overround=overround, first_id=first_id)[1]
+                  for book, mu, overround, first_id in (('tab', -4, 0.05, 1000), ('pointsbet', -3.5, 0.04, 5000),
+                                                        ('neds', -4.5, 0.06, 9000))},
+        'latency': {},
+        'errors': {},
+    }
+    with open(path, 'w') as f:
+        json.dump(snapshot, f)
+
+
+def import_seconds(stderr):
+    """Total cumulative time of the top level imports in -X importtime output"""
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit() and name.startswith(' ') and not name.startswith('  '):
+            total += int(cumulative)
+    return total / 1e6
+
+
+REFUSING_PROXY = {'HTTPS_PROXY': 'http://127.0.0.1:9', 'HTTP_PROXY': 'http://127.0.0.1:9', 'NO_PROXY': ''}
+
+
+def run(args, env=None):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=ROOT, capture_output=True, text=True,
+                               env={**os.environ, 'MPLBACKEND': 'Agg', **(env or {})})
+    return time.perf_counter() - start, import_seconds(completed.stderr), completed.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, StubTabServer() as server:
+        snapshot = os.path.join(directory, 'snapshot.json')
+        write_snapshot(snapshot)
+        commands = {
+            'python (baseline)': (['-c', 'pass'], None),
+            'import distribution': (['-c', 'import distribution'], None),
+            'fetch': (['cli.py', 'fetch', '--tab', 'x', '--pointsbet', '1', '--neds', 'x', '--timeout', '1',
+                       '-o', os.path.join(directory, 'fetched.json')], REFUSING_PROXY),
+            'fit': (['cli.py', 'fit', '--input', snapshot, '--consensus', '-o', os.path.join(directory, 'fit.json')], None),
+            'sweep': (['cli.py', 'sweep', '--input', snapshot, '--top-k', '16', '--url', server.url], None),
+            'render': (['cli.py', 'render', '--input', snapshot, '-o', os.path.join(directory, 'chart.png')], None),
+        }
+        if args.repeat > 1:
+            for command, env in commands.values():
+                run(command, env)
+
+        print(f'{"command":>20} {"wall s":>8} {"import s":>9} {"exit":>5}')
+        for name, (command, env) in commands.items():
+            results = [run(command, env) for _ in range(args.repeat)]
+            wall = statistics.median(result[0] for result in results)
+            imports = statistics.median(result[1] for result in results)
+            print(f'{name:>20} {wall:>8.3f} {imports:>9.3f} {results[-1][2]:>5}')
+
+
+if __name__ == '__main__':
+    main()
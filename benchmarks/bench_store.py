@@ -0,0 +1,56 @@
+"""LineStore append rate and read time of a season of ticks, all columns vs only line levels and prices.
+
+    python -m benchmarks.bench_store --events 20 --snapshots 5000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from line_apis import make_lines_book
+from line_store import LineStore
+from benchmarks.fixtures import make_lines
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--snapshots', type=int, default=5000, help='per event')
+    parser.add_argument('--levels', type=int, default=40)
+    parser.add_argument('--interval', type=float, default=30.0, help='seconds between snapshots')
+    args = parser.parse_args()
+
+    books = [make_lines_book(make_lines(args.levels, mu=mu)[1]) for mu in (-4, -3.5, -3)]
+    root = tempfile.mkdtemp()
+    try:
+        start_time = 1.7e9
+        start = time.perf_counter()
+        with LineStore(root) as store:
+            for k in range(args.snapshots):
+                for event in range(args.events):
+                    store.append(f'event-{event}', 'tab', books[k % len(books)], start_time + k*args.interval)
+        append_time = time.perf_counter() - start
+        appended = args.events * args.snapshots
+        print(f'append: {appended/append_time:,.0f} snapshots/s, {directory_size(root)/appended:.0f} bytes/snapshot')
+
+        store = LineStore(root)
+        for label, columns in (('all columns', None), ('levels + prices', ['line_levels', 'home_prices', 'away_prices'])):
+            start = time.perf_counter()
+            rows = 0
+            for event in store.events():
+                data = store.read(event, 'tab', columns=columns)
+                # touch the prices so the memory maps are actually paged in
+                data['home_prices'].sum()
+                rows += len(data['home_prices'])
+            print(f'read {label:>16}: {time.perf_counter() - start:.3f}s for {rows:,} rows')
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
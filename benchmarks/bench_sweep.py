@@ -0,0 +1,56 @@
+"""Latency/throughput of tab_multi_margin_sweep against the local stub enquiry server.
+
+    python -m benchmarks.bench_sweep --levels 20 --latency 0.02 --workers 1 8 16
+"""
+import argparse
+import time
+
+from line_apis import make_lines_dict
+from multi_query_apis import make_tab_session, margin_sweep_pairs, tab_multi_margin_sweep_stream
+from benchmarks.fixtures import make_lines
+from benchmarks.stub_tab_server import StubTabServer
+
+
+def run_sweep(lines_dict, url, max_workers):
+    session = make_tab_session(pool_size=max_workers)
+    start = time.perf_counter()
+    first_result = None
+    count = 0
+    for _ in tab_multi_margin_sweep_stream(lines_dict, max_workers=max_workers, session=session, url=url):
+        if first_result is None:
+            first_result = time.perf_counter() - start
+        count += 1
+    elapsed = time.perf_counter() - start
+    session.close()
+    return {
+        'workers': max_workers,
+        'results': count,
+        'elapsed': elapsed,
+        'first_result': first_result,
+        'throughput': count / elapsed if elapsed > 0 else float('inf'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help='stub server latency per enquiry (s)')
+    parser.add_argument('--fail-every', type=int, default=0, help='stub returns 503 on every n-th enquiry')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    _, lines = make_lines(args.levels)
+    lines_dict = make_lines_dict(lines)
+    n_pairs = len(margin_sweep_pairs(lines_dict))
+
+    print(f'{args.levels} levels, {n_pairs} pairs, {args.latency*1000:.0f}ms stub latency')
+    print(f'{"workers":>8} {"results":>8} {"elapsed s":>10} {"first s":>8} {"req/s":>8}')
+    with StubTabServer(latency=args.latency, fail_every=args.fail_every) as server:
+        for max_workers in args.workers:
+            stats = run_sweep(lines_dict, server.url, max_workers)
+            print(f'{stats["workers"]:>8} {stats["results"]:>8} {stats["elapsed"]:>10.3f} '
+                  f'{stats["first_result"] or 0:>8.3f} {stats["throughput"]:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
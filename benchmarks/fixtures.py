@@ -0,0 +1,167 @@
+"""Synthetic bookmaker data shaped like the live API responses, for benchmarks and the stub servers."""
+import hashlib
+import json
+from functools import lru_cache
+
+import numpy as np
+from scipy import special
+
+
+def home_cover_prob(home_line, mu=0, sigma=12):
+    """Probability of the home side covering home_line, on the same shifted axis as tools.line_transfrom"""
+    home_line = np.asarray(home_line, dtype=float)
+    x = home_line - 0.5*np.sign(home_line)
+    return special.ndtr((x - mu) / sigma)
+
+
+def make_lines(n_levels=40, mu=-4, sigma=12, overround=0.05, first_id=1000):
+    """TAB style lines list (as returned by line_apis.tab_get_lines) for a ladder of n_levels half point lines"""
+    start = np.floor(mu - n_levels/2) + 0.5
+    line_levels = start + np.arange(n_levels)
+    home_probs = np.clip(home_cover_prob(line_levels, mu, sigma), 0.01, 0.99)
+    lines = []
+    next_id = first_id
+    for line_level, home_prob in zip(line_levels, home_probs):
+        for home_side, prob in ((True, home_prob), (False, 1 - home_prob)):
+            price = max(round(1 / (prob * (1 + overround)), 2), 1.01)
+            lines.append({
+                'home_line': float(line_level),
+                'home_side': home_side,
+                'price': price,
+                'id': next_id,
+                'market_type': 'Pick Your Own Line',
+            })
+            next_id += 1
+    return ('Home', 'Away'), lines
+
+
+def _split_sides(lines):
+    by_level = {}
+    for line in lines:
+        by_level.setdefault(line['home_line'], [None, None])[0 if line['home_side'] else 1] = line
+    return sorted(by_level.items())
+
+
+def tab_payload(n_levels=40, n_other_markets=60, teams=('Indiana', 'Golden State')):
+    """TAB tab-info-service match response with a Line, Head To Head and Pick Your Own Line ladder,
+    padded with player markets the parser skips"""
+    _, lines = make_lines(n_levels)
+    propositions = []
+    for home_line, (home, away) in _split_sides(lines):
+        propositions.append({'name': f'{teams[0]} {home_line:+g}', 'returnWin': home['price'], 'id': home['id']})
+        propositions.append({'name': f'{teams[1]} {-home_line:+g}', 'returnWin': away['price'], 'id': away['id']})
+    middle = len(propositions) // 2 & ~1
+    markets = [
+        {'betOption': 'Head To Head', 'propositions': [
+            {'name': teams[0], 'returnWin': 1.5, 'id': 1},
+            {'name': teams[1], 'returnWin': 2.6, 'id': 2},
+        ]},
+        {'betOption': 'Line', 'propositions': propositions[middle:middle + 2]},
+        {'betOption': 'Pick Your Own Line', 'propositions': propositions},
+    ]
+    for i in range(n_other_markets):
+        markets.append({'betOption': f'Player Points {i}', 'propositions': [
+            {'name': f'Player {i} Over {j}.5', 'returnWin': 1.87, 'id': 10_000 + 100*i + j,
+             'bettingStatus': 'Open', 'allowPlace': False, 'isOpen': True} for j in range(10)
+        ]})
+    return {'name': f'{teams[0]} v {teams[1]}', 'competitors': list(teams), 'markets': markets}
+
+
+def pointsbet_payload(n_levels=40, n_other_markets=60, teams=('Indiana', 'Golden State')):
+    """PointsBet mes/v3 event response shaped like tab_payload"""
+    _, lines = make_lines(n_levels)
+    outcomes = []
+    for home_line, (home, away) in _split_sides(lines):
+        outcomes.append({'side': 'Home', 'points': home_line, 'price': home['price'], 'outcomeId': home['id']})
+        outcomes.append({'side': 'Away', 'points': -home_line, 'price': away['price'], 'outcomeId': away['id']})
+    markets = [
+        {'eventClass': 'Moneyline', 'outcomes': [
+            {'side': 'Home', 'points': 0, 'price': 1.5, 'outcomeId': 1},
+            {'side': 'Away', 'points': 0, 'price': 2.6, 'outcomeId': 2},
+        ]},
+        {'eventClass': 'Pick Your Own Line', 'outcomes': outcomes},
+    ]
+    for i in range(n_other_markets):
+        markets.append({'eventClass': f'Player Points {i}', 'outcomes': [
+            {'side': None, 'points': j + 0.5, 'price': 1.87, 'outcomeId': 10_000 + 100*i + j,
+             'name': f'Player {i} Over {j}.5', 'groupByHeader': 'Over'} for j in range(10)
+        ]})
+    return {'homeTeam': teams[0], 'awayTeam': teams[1], 'fixedOddsMarkets': markets}
+
+
+def neds_payload(n_levels=40, n_other_markets=300, teams=('Indiana', 'Golden State')):
+    """Neds event-card response. Alternate lines sit in their own market type group, and the bulk of the
+    payload is other markets, entrants and prices that the parser never needs"""
+    _, lines = make_lines(n_levels)
+    event_id = 'event-0'
+    entrants = {}
+    markets = {}
+    prices = {}
+
+    def add_market(market_id, name, entrant_rows, **extra):
+        entrant_ids = []
+        for entrant_name, home_away, price in entrant_rows:
+            entrant_id = f'{market_id}-e{len(entrant_ids)}'
+            entrants[entrant_id] = {'id': entrant_id, 'name': entrant_name, 'home_away': home_away,
+                                    'market_id': market_id, 'visible': True, 'position': len(entrant_ids)}
+            prices[f'{entrant_id}:{market_id}:'] = {'odds': {'numerator': round((price - 1) * 100), 'denominator': 100}}
+            entrant_ids.append(entrant_id)
+        markets[market_id] = {'id': market_id, 'name': name, 'entrant_ids': entrant_ids, 'event_id': event_id, **extra}
+
+    add_market('h2h', 'Head To Head', [(teams[0], 'HOME', 1.5), (teams[1], 'AWAY', 2.6)])
+    add_market('line', 'Line', [(teams[0], 'HOME', 1.9), (teams[1], 'AWAY', 1.9)], handicap=4.5)
+    alt_market_ids = []
+    for home_line, (home, away) in _split_sides(lines):
+        market_id = f'alt{len(alt_market_ids)}'
+        add_market(market_id, f'Alternate Line {home_line:+g}', [
+            (f'{teams[0]} {home_line:+g}', 'HOME', home['price']),
+            (f'{teams[1]} {-home_line:+g}', 'AWAY', away['price']),
+        ])
+        alt_market_ids.append(market_id)
+    other_market_ids = []
+    for i in range(n_other_markets):
+        market_id = f'other{i}'
+        add_market(market_id, f'Player {i} Points', [(f'Player {i} Over {j}.5', None, 1.87) for j in range(8)])
+        other_market_ids.append(market_id)
+
+    return {
+        'event_participants': {
+            'p0': {'name': teams[0], 'home_away': 'HOME'},
+            'p1': {'name': teams[1], 'home_away': 'AWAY'},
+        },
+        'market_type_groups': {
+            'g0': {'id': 'g0', 'name': 'Alternate Lines'},
+            'g1': {'id': 'g1', 'name': 'Player Points'},
+        },
+        'events': {event_id: {'id': event_id, 'name': f'{teams[0]} vs {teams[1]}', 'market_type_group_markets': [
+            {'market_type_group_id': 'g0', 'market_ids': alt_market_ids},
+            {'market_type_group_id': 'g1', 'market_ids': other_market_ids},
+        ]}},
+        'markets': markets,
+        'entrants': entrants,
+        'prices': prices,
+        'media': {f'm{i}': {'url': f'https://example.invalid/{i}', 'kind': 'stream'} for i in range(50)},
+    }
+
+
+PAYLOADS = {
+    'tab': tab_payload,
+    'pointsbet': pointsbet_payload,
+    'neds': neds_payload,
+}
+
+
+@lru_cache(maxsize=None)
+def load_fixture(book, n_levels=40):
+    """Response body bytes for a bookmaker. Built from the payload functions in every process rather than
+    stored, so runs on the same version of this module always see the same bytes"""
+    return json.dumps(PAYLOADS[book](n_levels)).encode()
+
+
+def fixtures_digest(levels, books=PAYLOADS):
+    """sha256 of every fixture a run at these ladder sizes reads, to tell whether two runs timed the same payloads"""
+    digest = hashlib.sha256()
+    for n_levels in sorted(levels):
+        for book in sorted(books):
+            digest.update(load_fixture(book, n_levels))
+    return digest.hexdigest()
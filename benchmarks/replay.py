@@ -0,0 +1,48 @@
+"""requests transport adapter that answers bookmaker requests from generated fixtures instead of the network."""
+import requests
+from requests.adapters import BaseAdapter
+
+from benchmarks.fixtures import load_fixture
+
+
+BOOKMAKER_HOSTS = {
+    'tab': 'https://api.beta.tab.com.au/',
+    'pointsbet': 'https://api.au.pointsbet.com/',
+    'neds': 'https://api.neds.com.au/',
+}
+
+
+class ReplayAdapter(BaseAdapter):
+    """Serves a fixed response body for every request, with optional ETag so conditional requests get 304s"""
+
+    def __init__(self, content, etag=None):
+        super().__init__()
+        self.content = content
+        self.etag = etag
+        self.request_count = 0
+
+    def send(self, request, **kwargs):
+        self.request_count += 1
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.headers['Content-Type'] = 'application/json'
+        if self.etag is not None:
+            response.headers['ETag'] = self.etag
+        if self.etag is not None and request.headers.get('If-None-Match') == self.etag:
+            response.status_code = 304
+            response._content = b''
+        else:
+            response.status_code = 200
+            response._content = self.content
+        return response
+
+    def close(self):
+        pass
+
+
+def replay_session(book, n_levels=40, etag=None):
+    """Session whose requests to book's API are answered with its generated fixture"""
+    session = requests.session()
+    session.mount(BOOKMAKER_HOSTS[book], ReplayAdapter(load_fixture(book, n_levels), etag=etag))
+    return session
@@ -0,0 +1,144 @@
+"""Times every stage of fetch -> parse -> fit -> EV over generated fixtures and a stub enquiry server,
+at several ladder sizes, and writes machine-readable results.
+
+    python -m benchmarks.run --levels 10 20 40 --output bench.json
+    python -m benchmarks.run --compare bench.json --tolerance 1.25
+
+With --compare, stages whose best time is slower than tolerance x the baseline's best are reported and the exit status is 1.
+The baseline is read before the run, so --output bench.json --compare bench.json checks against the old
+baseline and then replaces it. A baseline whose fixtures digest differs was timed on other payloads and
+is refused.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import line_apis
+import tools
+from multi_query_apis import make_tab_session, margin_sweep_pairs, tab_multi_margin_sweep
+from benchmarks.fixtures import fixtures_digest, load_fixture
+from benchmarks.replay import replay_session
+from benchmarks.stub_tab_server import StubTabServer
+
+
+GETTERS = {
+    'tab': (line_apis.tab_get_lines, line_apis.tab_parse_lines, 'Indiana%20v%20Golden%20State'),
+    'pointsbet': (line_apis.pointsbet_get_lines, line_apis.pointsbet_parse_lines, '1764984'),
+    'neds': (line_apis.neds_get_lines, line_apis.neds_parse_lines, 'event-0'),
+}
+
+
+def timeit(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        'mean': statistics.fmean(times),
+        'min': min(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'repeats': repeats,
+    }
+
+
+def all_margins(book):
+    for lower, upper in margin_sweep_pairs(book):
+        i = book.index(lower)
+        j = book.index(upper)
+        try:
+            tools.opposing_lines_margin(float(book.home_prices[j]), float(book.away_prices[j]),
+                                        float(book.away_prices[i]), float(book.home_prices[i]))
+        except ZeroDivisionError:
+            pass
+
+
+def run(levels, repeats, sweep_levels, sweep_workers, stub_latency):
+    results = []
+
+    def record(stage, book, n_levels, stats):
+        results.append({'stage': stage, 'book': book, 'levels': n_levels, **stats})
+        print(f'{stage:>22} {book:>10} {n_levels:>6} {stats["mean"]*1000:>10.3f} {stats["min"]*1000:>10.3f}')
+
+    print(f'{"stage":>22} {"book":>10} {"levels":>6} {"mean ms":>10} {"min ms":>10}')
+    for n_levels in levels:
+        for book, (get_lines, parse_lines, event_id) in GETTERS.items():
+            content = load_fixture(book, n_levels)
+            session = replay_session(book, n_levels)
+            record('fetch', book, n_levels, timeit(lambda: get_lines(event_id, session=session), repeats))
+            lazy = book == 'neds'
+            record('parse', book, n_levels, timeit(lambda: parse_lines(line_apis.loads_json(content, lazy=lazy)), repeats))
+
+            _, lines = parse_lines(line_apis.loads_json(content))
+            record('make_lines_dict', book, n_levels, timeit(lambda: line_apis.make_lines_dict(lines), repeats))
+            record('make_lines_book', book, n_levels, timeit(lambda: line_apis.make_lines_book(lines), repeats))
+            lines_book = line_apis.make_lines_book(lines)
+            record('fit_normal_cdf', book, n_levels, timeit(lambda: tools.fit_normal_cdf(lines_book), repeats))
+            record('opposing_lines_margin', book, n_levels, timeit(lambda: all_margins(lines_book), repeats))
+            record('opposing_margin_matrix', book, n_levels, timeit(lambda: tools.opposing_lines_margin_matrix(lines_book), repeats))
+
+    with StubTabServer(latency=stub_latency) as server:
+        for n_levels in sweep_levels:
+            _, lines = line_apis.tab_parse_lines(line_apis.loads_json(load_fixture('tab', n_levels)))
+            lines_book = line_apis.make_lines_book(lines)
+            session = make_tab_session(pool_size=sweep_workers)
+            stats = timeit(lambda: tab_multi_margin_sweep(lines_book, max_workers=sweep_workers, session=session, url=server.url), 1)
+            stats['pairs'] = len(margin_sweep_pairs(lines_book))
+            record('sweep', 'tab', n_levels, stats)
+            session.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # min is far less noisy than mean on a shared machine
+    baseline_mins = {(row['stage'], row['book'], row['levels']): row['min'] for row in baseline['results']}
+    regressions = []
+    for row in results:
+        base_min = baseline_mins.get((row['stage'], row['book'], row['levels']))
+        if base_min and row['min'] > tolerance * base_min:
+            regressions.append((row, base_min))
+    for row, base_min in regressions:
+        print(f'REGRESSION {row["stage"]} {row["book"]} {row["levels"]}: {base_min*1000:.3f}ms -> {row["min"]*1000:.3f}ms')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', type=int, nargs='+', default=[10, 20, 40])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--sweep-levels', type=int, nargs='+', default=[10, 20])
+    parser.add_argument('--sweep-workers', type=int, default=8)
+    parser.add_argument('--stub-latency', type=float, default=0.005)
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='baseline JSON from an earlier --output')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args()
+
+    # read before running, so --output can overwrite the same file with the new baseline
+    baseline = None
+    digest = fixtures_digest(set(args.levels) | set(args.sweep_levels))
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('fixtures') != digest:
+            sys.exit(f'{args.compare} was run on different fixtures, rerun it with this version and these --levels')
+    results = run(args.levels, args.repeats, args.sweep_levels, args.sweep_workers, args.stub_latency)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created': time.time(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'fixtures': digest,
+                'results': results,
+            }, f, indent=1)
+    if baseline is not None:
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Local HTTP server standing in for the TAB pricing-service enquiry endpoint."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ENQUIRY_PATH = '/v1/pricing-service/enquiry'
+
+
+def default_price(proposition_ids):
+    return 2 + (sum(proposition_ids) % 300) / 100
+
+
+class _EnquiryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        with server.lock:
+            server.request_count += 1
+            request_count = server.request_count
+        if server.latency:
+            server.sleep(server.latency)
+        if self.path.split('?')[0] != ENQUIRY_PATH:
+            self._send(404, {'error': 'not found'})
+            return
+        if server.fail_every and request_count % server.fail_every == 0:
+            self._send(503, {'error': 'unavailable'})
+            return
+        payload = json.loads(body)
+        propositions = payload['bets'][0]['legs'][0]['propositions']
+        odds = server.price_fn([proposition['propositionId'] for proposition in propositions])
+        self._send(200, {'bets': [{'legs': [{'odds': {'decimal': f'{odds:.2f}'}}]}]})
+
+    def _send(self, status, response_dict):
+        body = json.dumps(response_dict).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubTabServer:
+    """Serves SGM enquiries on localhost from a background thread.
+    latency is added to every request, and every fail_every-th request returns a 503."""
+
+    def __init__(self, latency=0.0, fail_every=0, price_fn=default_price):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), _EnquiryHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.fail_every = fail_every
+        self.httpd.price_fn = price_fn
+        self.httpd.sleep = time.sleep
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_count = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}{ENQUIRY_PATH}'
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,195 @@
+"""Command line entry point for cron jobs and services.
+
+    python cli.py fetch --tab 'Indiana%20v%20Golden%20State' --pointsbet 1764984 --neds adb6e940-... -o snapshot.json
+    python cli.py fit --input snapshot.json --consensus
+    python cli.py sweep --input snapshot.json --min-ev 0.02
+    python cli.py render --input snapshot.json -o chart.png
+
+Each subcommand imports only what it uses when it runs (fetch never loads scipy or matplotlib), so keep
+module level imports here to the standard library.
+"""
+import argparse
+import json
+import sys
+
+
+BOOKS = ('tab', 'pointsbet', 'neds')
+
+
+def add_event_arguments(parser):
+    """--tab/--pointsbet/--neds bookmaker event ids and the request timeout"""
+    for book in BOOKS:
+        parser.add_argument(f'--{book}', metavar='ID', help=f'{book} event id')
+    parser.add_argument('--timeout', type=float, default=5, help='per request timeout in seconds')
+
+
+def event_ids(args):
+    return {book: getattr(args, book) for book in BOOKS if getattr(args, book) is not None}
+
+
+def _snapshot_json(snapshot):
+    return {**snapshot, 'errors': {book: repr(e) for book, e in snapshot['errors'].items()}}
+
+
+def _fetch_snapshot(args):
+    from fetcher import LineFetcher
+
+    event = event_ids(args)
+    if not event:
+        sys.exit('no event ids given, pass --tab, --pointsbet and/or --neds, or --input')
+    with LineFetcher(timeout=args.timeout) as fetcher:
+        return fetcher.fetch_event(event)
+
+
+def _report_errors(snapshot):
+    """Reports the bookmakers that failed on stderr, returns whether any returned lines"""
+    for book, error in snapshot['errors'].items():
+        print(f'{book} fetch failed: {error!r}', file=sys.stderr)
+    return bool(snapshot['lines'])
+
+
+def load_snapshot(args):
+    """Snapshot from --input (a fetch -o file, - for stdin), or fetched from the event id arguments.
+    Bookmakers that failed are reported on stderr; exits if none succeeded."""
+    if getattr(args, 'input', None) is not None:
+        if args.input == '-':
+            snapshot = json.load(sys.stdin)
+        else:
+            with open(args.input) as f:
+                snapshot = json.load(f)
+    else:
+        snapshot = _fetch_snapshot(args)
+    if not _report_errors(snapshot):
+        sys.exit('no bookmaker returned lines')
+    return snapshot
+
+
+def _write_json(value, path):
+    text = json.dumps(value, default=float)
+    if path is None or path == '-':
+        print(text)
+    else:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+
+
+def run_fetch(args):
+    snapshot = _fetch_snapshot(args)
+    if not _report_errors(snapshot):
+        print('no bookmaker returned lines, no snapshot written', file=sys.stderr)
+        return 1
+    _write_json(_snapshot_json(snapshot), args.output)
+    return 0
+
+
+def _model_json(model):
+    return {key: model[key] for key in ('mu', 'sigma', 'iterations', 'converged') if key in model}
+
+
+def run_fit(args):
+    import tools
+    from lines_book import LinesBook
+
+    snapshot = load_snapshot(args)
+    books = {book: LinesBook.from_lines(lines) for book, lines in snapshot['lines'].items()}
+    result = {'teams': snapshot['teams'], 'models': {}}
+    for book, lines_book in books.items():
+        if len(lines_book.complete()) >= 2:
+            result['models'][book] = _model_json(tools.fit_normal_cdf(lines_book, method=args.method))
+    if args.consensus:
+        import consensus
+
+        model = consensus.consensus_model(books)
+        result['consensus'] = {'mu': model['mu'], 'sigma': model['sigma'], 'weights': model['weights']}
+    _write_json(result, args.output)
+    return 0
+
+
+def run_sweep(args):
+    import tools
+    from lines_book import LinesBook
+    from sweep_planner import planned_margin_sweep_stream
+
+    snapshot = load_snapshot(args)
+    if args.book not in snapshot['lines']:
+        sys.exit(f'no {args.book} lines to sweep')
+    lines_book = LinesBook.from_lines(snapshot['lines'][args.book])
+    model = tools.fit_normal_cdf(lines_book)
+    kwargs = {} if args.url is None else {'url': args.url}
+    for result in planned_margin_sweep_stream(lines_book, model, min_ev=args.min_ev, top_k=args.top_k,
+                                              max_workers=args.max_workers, timeout=args.timeout, **kwargs):
+        print(json.dumps({
+            'upper': result['home_line']['home_line'],
+            'lower': result['away_line']['home_line'],
+            'price': result['price'],
+            'odds_theo': result['odds_theo'],
+            'ev': result['ev'],
+        }, default=float), flush=True)
+    return 0
+
+
+def run_render(args):
+    snapshot = load_snapshot(args)
+    event = {'books': snapshot['lines'], 'teams': snapshot['teams']}
+    if args.output is not None:
+        import render
+
+        render.render_event(event, args.output, dpi=args.dpi, figsize=tuple(args.figsize))
+        return 0
+
+    import matplotlib.pyplot as plt
+    import plotting
+    import render
+
+    fig, ax = plt.subplots(figsize=tuple(args.figsize))
+    render.draw_event(ax, event['books'], teams=event['teams'])
+    ruler = plotting.Ruler(ax)
+    fig.tight_layout()
+    plt.show()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Bookmaker handicap line fetching, fitting, SGM sweeps and charts')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fetch_parser = subparsers.add_parser('fetch', help='fetch every bookmaker\'s lines for one event as JSON')
+    add_event_arguments(fetch_parser)
+    fetch_parser.add_argument('-o', '--output', help='snapshot JSON path, stdout if omitted')
+    fetch_parser.set_defaults(handler=run_fetch)
+
+    fit_parser = subparsers.add_parser('fit', help='fit a normal margin model to each bookmaker')
+    add_event_arguments(fit_parser)
+    fit_parser.add_argument('--input', help='snapshot JSON from fetch -o instead of fetching, - for stdin')
+    fit_parser.add_argument('--method', default='gauss_newton', choices=('gauss_newton', 'curve_fit'))
+    fit_parser.add_argument('--consensus', action='store_true', help='also fit the cross-book consensus')
+    fit_parser.add_argument('-o', '--output', help='JSON path, stdout if omitted')
+    fit_parser.set_defaults(handler=run_fit)
+
+    sweep_parser = subparsers.add_parser('sweep', help='query SGM prices for the margin bands most likely to be +EV')
+    add_event_arguments(sweep_parser)
+    sweep_parser.add_argument('--input', help='snapshot JSON from fetch -o instead of fetching, - for stdin')
+    sweep_parser.add_argument('--book', default='tab', help='bookmaker whose ladder and SGM pricing to sweep')
+    sweep_parser.add_argument('--min-ev', type=float, default=0.0)
+    sweep_parser.add_argument('--top-k', type=int, default=None, help='query at most this many pairs')
+    sweep_parser.add_argument('--max-workers', type=int, default=8)
+    sweep_parser.add_argument('--url', default=None, help='SGM enquiry endpoint, TAB\'s if omitted')
+    sweep_parser.set_defaults(handler=run_sweep)
+
+    render_parser = subparsers.add_parser('render', help='draw the line CDF chart, to a file or an interactive window')
+    add_event_arguments(render_parser)
+    render_parser.add_argument('--input', help='snapshot JSON from fetch -o instead of fetching, - for stdin')
+    render_parser.add_argument('-o', '--output', help='PNG or SVG path, opens a window with a ruler if omitted')
+    render_parser.add_argument('--dpi', type=int, default=100)
+    render_parser.add_argument('--figsize', type=float, nargs=2, default=(12, 8), metavar=('WIDTH', 'HEIGHT'))
+    render_parser.set_defaults(handler=run_render)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+import numpy as np
+
+import tools
+from lines_book import as_lines_book
+from pricing import normal_margin_cdf
+
+
+KINDS = ('arb', 'middle', 'off_consensus')
+
+
+def book_overround(lines):
+    """Median overround of the levels quoted on both sides, nan if there are none"""
+    book = as_lines_book(lines).complete()
+    return float(np.median(book.overround)) if len(book) else np.nan
+
+
+def _ladders(events):
+    """Flattens {event: {bookmaker: lines}} into event keys, and per ladder its LinesBook, event index and
+    bookmaker"""
+    keys = list(events)
+    ladders, event_index, book_names = [], [], []
+    for k, key in enumerate(keys):
+        for book_name, lines in events[key].items():
+            ladders.append(as_lines_book(lines))
+            event_index.append(k)
+            book_names.append(book_name)
+    return keys, ladders, np.array(event_index, dtype=np.int64), book_names
+
+
+def _combine(popt, pcov, overround, event_index, n_events):
+    """Per event precision weighted average of its ladders' (mu, sigma).
+
+    A ladder's weight is its fit's precision, inv(pcov), scaled by the lowest overround in the event over its
+    own, so a book charging twice the margin of the sharpest one counts half as much for the same fit
+    quality. Ladders with an unusable pcov only count when no ladder of the event has one, averaged by the
+    overround factor alone, and the consensus pcov is then inf.
+    Returns popt (E, 2), pcov (E, 2, 2) and each ladder's share of the weight on mu (L,)."""
+    fitted = np.isfinite(popt).all(axis=1) & np.isfinite(overround)
+    a, b, c = pcov[:, 0, 0], pcov[:, 0, 1], pcov[:, 1, 1]
+    with np.errstate(invalid='ignore', over='ignore'):
+        det = a*c - b*b
+        precise = fitted & np.isfinite(pcov).all(axis=(1, 2)) & (det > 0)
+    overround = np.maximum(overround, 1e-3)
+    sharpest = np.full(n_events, np.inf)
+    np.minimum.at(sharpest, event_index[fitted], overround[fitted])
+    factor = np.where(fitted, sharpest[event_index] / overround, 0)
+
+    precision = np.zeros((len(popt), 2, 2))
+    safe_det = np.where(precise, det, 1)
+    precision[:, 0, 0] = np.where(precise, c / safe_det, 0)
+    precision[:, 0, 1] = precision[:, 1, 0] = np.where(precise, -b / safe_det, 0)
+    precision[:, 1, 1] = np.where(precise, a / safe_det, 0)
+    weight = precision * factor[:, None, None]
+    weighted_popt = np.einsum('lij,lj->li', weight, np.where(fitted[:, None], popt, 0))
+
+    total = np.zeros((n_events, 2, 2))
+    np.add.at(total, event_index, weight)
+    total_popt = np.zeros((n_events, 2))
+    np.add.at(total_popt, event_index, weighted_popt)
+    a, b, c = total[:, 0, 0], total[:, 0, 1], total[:, 1, 1]
+    det = a*c - b*b
+    solvable = det > 0
+    safe_det = np.where(solvable, det, 1)
+    consensus = np.full((n_events, 2), np.nan)
+    consensus[solvable, 0] = ((c*total_popt[:, 0] - b*total_popt[:, 1]) / safe_det)[solvable]
+    consensus[solvable, 1] = ((a*total_popt[:, 1] - b*total_popt[:, 0]) / safe_det)[solvable]
+    consensus_pcov = np.full((n_events, 2, 2), np.inf)
+    consensus_pcov[solvable, 0, 0] = (c / safe_det)[solvable]
+    consensus_pcov[solvable, 0, 1] = consensus_pcov[solvable, 1, 0] = (-b / safe_det)[solvable]
+    consensus_pcov[solvable, 1, 1] = (a / safe_det)[solvable]
+    share = np.where(solvable[event_index], weight[:, 0, 0] / np.where(solvable, a, 1)[event_index], 0)
+
+    # events with fits but no usable covariance fall back to the overround weighted mean
+    fallback = ~solvable & (np.bincount(event_index[fitted], minlength=n_events) > 0)
+    if fallback.any():
+        factor_total = np.bincount(event_index, weights=factor, minlength=n_events)
+        for column in (0, 1):
+            sums = np.bincount(event_index, weights=factor*np.where(fitted, popt[:, column], 0), minlength=n_events)
+            consensus[fallback, column] = sums[fallback] / factor_total[fallback]
+        share = np.where(fallback[event_index], factor / np.where(factor_total > 0, factor_total, 1)[event_index], share)
+    return consensus, consensus_pcov, share
+
+
+def consensus_models(events, processes=None):
+    """Weighted consensus fit of every event from all its bookmakers' ladders.
+
+    events maps an event key to {bookmaker: lines} (LinesBooks, make_lines_dict dicts or lines lists).
+    Every ladder of every event is fitted in one fit_normal_cdf_batch call and combined per event as in
+    _combine. Returns {event: model} where model has fit_normal_cdf's 'mu', 'sigma', 'popt' and 'pcov' plus
+    'weights' ({bookmaker: share of the weight on mu}). Events no ladder could be fitted for get nan mu
+    and sigma."""
+    keys, ladders, event_index, book_names = _ladders(events)
+    if not ladders:
+        return {key: _empty_model() for key in keys}
+    fits = tools.fit_normal_cdf_batch(ladders, processes=processes)
+    overround = np.array([book_overround(ladder) for ladder in ladders])
+    popt, pcov, share = _combine(fits['popt'], fits['pcov'], overround, event_index, len(keys))
+    models = {}
+    for k, key in enumerate(keys):
+        models[key] = {
+            'mu': popt[k, 0],
+            'sigma': popt[k, 1],
+            'popt': popt[k],
+            'pcov': pcov[k],
+            'weights': {},
+        }
+    for l, k in enumerate(event_index.tolist()):
+        models[keys[k]]['weights'][book_names[l]] = float(share[l])
+    return models
+
+
+def _empty_model():
+    return {'mu': np.nan, 'sigma': np.nan, 'popt': np.full(2, np.nan), 'pcov': np.full((2, 2), np.inf), 'weights': {}}
+
+
+def consensus_model(books, processes=None):
+    """consensus_models of one event's {bookmaker: lines}"""
+    return consensus_models({None: books}, processes=processes)[None]
+
+
+def _quote_table(ladders, event_index):
+    """Every level of every ladder as flat columns, sorted by (event, line level)"""
+    sizes = np.array([len(ladder) for ladder in ladders], dtype=np.int64)
+    table = {
+        'event': np.repeat(event_index, sizes),
+        'ladder': np.repeat(np.arange(len(ladders)), sizes),
+        'row': np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes),
+        'level': np.concatenate([ladder.line_levels for ladder in ladders] or [np.empty(0)]),
+        'home': np.concatenate([ladder.home_prices for ladder in ladders] or [np.empty(0)]),
+        'away': np.concatenate([ladder.away_prices for ladder in ladders] or [np.empty(0)]),
+    }
+    order = np.lexsort((table['level'], table['event']))
+    return {name: column[order] for name, column in table.items()}
+
+
+def _spread_probs(home_lines, mu, sigma):
+    """(win, push, lose) of home bets at home_lines under per-row normal models, as MarginPricer.spread_probs"""
+    win = normal_margin_cdf(np.ceil(home_lines) - 1, mu, sigma)
+    push = normal_margin_cdf(np.floor(home_lines), mu, sigma) - win
+    return win, push, 1 - win - push
+
+
+def _best_by_level(quotes, price_column):
+    """Sorted (event, level) groups of the quote table, and the quote index of each group's best price"""
+    prices = np.where(np.isnan(quotes[price_column]), -np.inf, quotes[price_column])
+    order = np.lexsort((prices, quotes['level'], quotes['event']))
+    event, level = quotes['event'][order], quotes['level'][order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (event[1:] != event[:-1]) | (level[1:] != level[:-1])
+    return event[last], level[last], order[last]
+
+
+def _level_pairs(event, level, max_width):
+    """(i, j) index pairs of sorted (event, level) groups in the same event with 0 <= level[j] - level[i] <=
+    max_width. Groups are placed on one sorted key so each i's range of j is a single searchsorted."""
+    if len(level) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    span = 2*np.abs(level).max() + max_width + 1
+    key = event*span + level
+    end = np.searchsorted(key, key + max_width, side='right')
+    counts = end - np.arange(len(key))
+    i = np.repeat(np.arange(len(key)), counts)
+    j = i + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return i, j
+
+
+def scan(events, models=None, min_ev=0.0, max_width=20, kinds=KINDS, processes=None):
+    """Ranked stream of cross-book opportunities over every line of every event.
+
+    events maps an event key to {bookmaker: lines}, models optionally maps it to a consensus model (fitted
+    with consensus_models when missing). Quotes from all books are merged into one table sorted by (event,
+    line level), which gives each level's best home and away price; pairing the best away price at a lower
+    level with the best home price at each level up to max_width points above is a searchsorted range per
+    level, so the scan is vectorized over all events at once.
+        'arb': home at the upper level and away at the lower one (or the same half point level) cost less
+            than 1 in implied probability, so staking proportionally to 1/price returns at least 'return'
+            whatever the margin. Both legs at the same whole level push together and only refund the stake,
+            so those pairs are never arbs.
+        'middle': the away leg's level is below the home leg's, so both legs win inside the band, and the
+            pair's EV under the consensus model is above min_ev
+        'off_consensus': a single quote whose EV under the consensus model is above min_ev
+    Yields dicts with 'kind', 'event', 'ev' (expected return per unit staked under the consensus model),
+    'legs' (line_apis style line dicts with a 'book' key), plus 'return', 'stakes' and 'prob' (the band's
+    consensus probability) for pairs and 'fair_odds' for single quotes. Arbs come first by 'return',
+    then the rest by 'ev'. Dicts are built as they are consumed, so taking the top few is cheap.
+    """
+    keys, ladders, event_index, book_names = _ladders(events)
+    models = {} if models is None else dict(models)
+    missing = [key for key in keys if key not in models]
+    if missing:
+        models.update(consensus_models({key: events[key] for key in missing}, processes=processes))
+    mu = np.array([models[key]['mu'] for key in keys], dtype=float)
+    sigma = np.array([models[key]['sigma'] for key in keys], dtype=float)
+    if not ladders:
+        return
+    quotes = _quote_table(ladders, event_index)
+
+    found = []
+    if 'off_consensus' in kinds:
+        win, push, lose = _spread_probs(quotes['level'], mu[quotes['event']], sigma[quotes['event']])
+        for home_side, prices, prob in ((True, quotes['home'], win), (False, quotes['away'], lose)):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ev = prob*prices + push - 1
+                fair_odds = (1 - push) / prob
+            index = np.flatnonzero(ev > min_ev)
+            found.append(('off_consensus', index, home_side, ev[index], fair_odds[index]))
+
+    if 'arb' in kinds or 'middle' in kinds:
+        group_event, group_level, best_home = _best_by_level(quotes, 'home')
+        _, _, best_away = _best_by_level(quotes, 'away')
+        i, j = _level_pairs(group_event, group_level, max_width)
+        home_quote, away_quote = best_home[j], best_away[i]
+        home_price, away_price = quotes['home'][home_quote], quotes['away'][away_quote]
+        upper, lower = group_level[j], group_level[i]
+        pair_event = group_event[i]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cost = 1/home_price + 1/away_price
+            home_stake, away_stake = 1/home_price/cost, 1/away_price/cost
+            home_win, home_push, _ = _spread_probs(upper, mu[pair_event], sigma[pair_event])
+            lower_win, lower_push, lower_lose = _spread_probs(lower, mu[pair_event], sigma[pair_event])
+            ev = home_stake*(home_win*home_price + home_push) + away_stake*(lower_lose*away_price + lower_push) - 1
+            band_prob = home_win - lower_win - lower_push
+        both_push = (upper == lower) & (np.floor(lower) == lower)
+        arb = (cost < 1) & ~both_push
+        middle = ~arb & (upper > lower) & (ev > min_ev)
+        for kind, selected in (('arb', arb), ('middle', middle)):
+            if kind in kinds:
+                index = np.flatnonzero(selected)
+                found.append((kind, index, (home_quote[index], away_quote[index], home_stake[index],
+                                            away_stake[index], 1/cost[index] - 1, band_prob[index]), ev[index], None))
+
+    if not found:
+        return
+    rank_kind = np.concatenate([np.full(len(index), kind != 'arb') for kind, index, *_ in found])
+    rank_value = np.concatenate([extra[4] if kind == 'arb' else ev for kind, _, extra, ev, _ in found])
+    order = np.lexsort((-rank_value, rank_kind))
+    offsets = np.cumsum([0] + [len(index) for _, index, *_ in found])
+
+    def leg(quote, home_side):
+        ladder = int(quotes['ladder'][quote])
+        return {**ladders[ladder].line(int(quotes['row'][quote]), home_side), 'book': book_names[ladder]}
+
+    for position in order.tolist():
+        part = np.searchsorted(offsets, position, side='right') - 1
+        kind, index, extra, ev, fair_odds = found[part]
+        k = position - offsets[part]
+        if kind == 'off_consensus':
+            quote = index[k]
+            yield {
+                'kind': kind,
+                'event': keys[quotes['event'][quote]],
+                'ev': float(ev[k]),
+                'fair_odds': float(fair_odds[k]),
+                'legs': [leg(quote, extra)],
+            }
+        else:
+            home_quote, away_quote, home_stake, away_stake, guaranteed, band_prob = extra
+            yield {
+                'kind': kind,
+                'event': keys[quotes['event'][home_quote[k]]],
+                'ev': float(ev[k]),
+                'return': float(guaranteed[k]),
+                'prob': float(band_prob[k]),
+                'stakes': (float(home_stake[k]), float(away_stake[k])),
+                'legs': [leg(home_quote[k], True), leg(away_quote[k], False)],
+            }
+
+
+class ConsensusScanner:
+    """Latest ladder of every (event, bookmaker) from a pipeline.PollingScheduler delta stream, with the
+    event's consensus model refitted only when one of its ladders moves."""
+
+    def __init__(self, min_ev=0.0, max_width=20, kinds=KINDS):
+        self.min_ev = min_ev
+        self.max_width = max_width
+        self.kinds = kinds
+        self.books = {}
+        self.models = {}
+
+    def update(self, event, book_name, lines):
+        """Applies a new ladder, returns the event's refitted consensus model"""
+        self.books.setdefault(event, {})[book_name] = as_lines_book(lines)
+        self.models[event] = consensus_model(self.books[event])
+        return self.models[event]
+
+    def update_delta(self, delta):
+        return self.update(delta['event'], delta['book'], delta['lines'])
+
+    def finish(self, event):
+        """Drops a finished event"""
+        self.books.pop(event, None)
+        self.models.pop(event, None)
+
+    def scan(self, events=None):
+        """scan of the given events, every live event if None"""
+        events = self.books if events is None else {event: self.books[event] for event in events}
+        return scan(events, self.models, min_ev=self.min_ev, max_width=self.max_width, kinds=self.kinds)
+
+
+def consensus_stream(deltas, scanner=None):
+    """Consensus and scan stage over a delta stream. Each delta refits its event's consensus and rescans
+    only that event. Yields the delta with 'consensus' (the model) and 'opportunities' (its ranked scan)."""
+    scanner = ConsensusScanner() if scanner is None else scanner
+    for delta in deltas:
+        model = scanner.update_delta(delta)
+        yield {**delta, 'consensus': model, 'opportunities': list(scanner.scan([delta['event']]))}
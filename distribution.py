@@ -1,86 +1,69 @@
-import tools
-import line_apis
-from multi_query_apis import tab_multi_margin_sweep
-import matplotlib.pyplot as plt
-import numpy as np
-
-
-SWEEPS = False
-
-TAB_EVENT_ID_STR = 'Indiana%20v%20Golden%20State'
-POINTSBET_EVENT_ID_STR = '1764984'
-NEDS_EVENT_ID_STR = 'adb6e940-d90c-435b-a61f-ada4df3daa4e'
-
-# TAB_EVENT_ID_STR = 'Washington%20v%20Cleveland'
-# POINTSBET_EVENT_ID_STR = '1764153'
-# NEDS_EVENT_ID_STR = '811713c7-f570-4efa-8bd9-d957f73e7e11'
+"""Interactive line CDF chart of one event across bookmakers, with an optional TAB SGM sweep.
 
-# TAB_EVENT_ID_STR = 'Boston%20v%20Atlanta'
-# POINTSBET_EVENT_ID_STR = '1764154'
-# NEDS_EVENT_ID_STR = '03bde8a1-f27c-4f7b-8222-1287a41408fa'
+    python distribution.py --tab 'Indiana%20v%20Golden%20State' --pointsbet 1764984 --neds adb6e940-d90c-435b-a61f-ada4df3daa4e --sweeps
 
-# TAB_EVENT_ID_STR = 'Miami%20v%20San%20Antonio'
-# POINTSBET_EVENT_ID_STR = '1764155'
-# NEDS_EVENT_ID_STR = 'aa98af98-05cb-4f0c-aeb1-3d143fe3327f'
+cli.py has the same chart as `render`, plus fetch, fit and sweep subcommands that skip the plotting imports.
+"""
+import argparse
 
-# TAB_EVENT_ID_STR = 'Philadelphia%20v%20Golden%20State'
-# POINTSBET_EVENT_ID_STR = '1764152'
-# NEDS_EVENT_ID_STR = 'c463bb8f-bea3-4c0b-b69b-3a4dec1eae12'
-
-# TAB_EVENT_ID_STR = 'LA%20Clippers%20v%20New%20Orleans'
-# POINTSBET_EVENT_ID_STR = '1764240'
-# NEDS_EVENT_ID_STR = '366313b5-5cfe-4603-95a2-80a5348bda29'
-
-# TAB_EVENT_ID_STR = 'Sacramento%20v%20Detroit'
-# POINTSBET_EVENT_ID_STR = '1764241'
-# NEDS_EVENT_ID_STR = '35570099-47af-418b-b2f3-138f38445cf0'
+import matplotlib.pyplot as plt
+import numpy as np
 
+import cli
+import line_apis
+import plotting
+import render
+import tools
+from fetcher import LineFetcher
+from sweep_planner import planned_margin_sweep_stream
 
 
-def main():
+def main(event, sweeps=False, timeout=5):
+    """event maps bookmaker to event id, e.g. {'tab': ..., 'pointsbet': ..., 'neds': ...}"""
 
     fig, ax = plt.subplots(figsize=(12,8))
 
-    teams, tab_lines = line_apis.tab_get_lines(TAB_EVENT_ID_STR)
-    _, pb_lines = line_apis.pointsbet_get_lines(POINTSBET_EVENT_ID_STR)
-    _, neds_lines = line_apis.neds_get_lines(NEDS_EVENT_ID_STR)
+    with LineFetcher(timeout=timeout) as fetcher:
+        snapshot = fetcher.fetch_event(event)
+    if snapshot['errors']:
+        book, error = next(iter(snapshot['errors'].items()))
+        raise RuntimeError(f'{book} fetch failed') from error
+    teams = snapshot['teams']
 
-    tab_lines_dict = line_apis.make_lines_dict(tab_lines)
-    pb_lines_dict = line_apis.make_lines_dict(pb_lines)
-    neds_lines_dict = line_apis.make_lines_dict(neds_lines)
+    tab_book = line_apis.make_lines_book(snapshot['lines']['tab'])
+    pb_book = line_apis.make_lines_book(snapshot['lines']['pointsbet'])
+    neds_book = line_apis.make_lines_book(snapshot['lines']['neds'])
 
-    tools.plot_lines(ax, pb_lines_dict, color='red')
-    tools.plot_lines(ax, neds_lines_dict, color='orange')
-    tools.plot_lines(ax, tab_lines_dict, color='green')
+    plotting.plot_lines(ax, pb_book, color='red')
+    plotting.plot_lines(ax, neds_book, color='orange')
+    plotting.plot_lines(ax, tab_book, color='green')
 
     ax.set_autoscale_on(False)
 
-    tab_model = tools.fit_normal_cdf(tab_lines_dict)
-    pb_model = tools.fit_normal_cdf(pb_lines_dict)
-    neds_model = tools.fit_normal_cdf(neds_lines_dict)
+    tab_model = tools.fit_normal_cdf(tab_book)
+    pb_model = tools.fit_normal_cdf(pb_book)
+    neds_model = tools.fit_normal_cdf(neds_book)
 
-    tools.plot_normal_cdf(ax, pb_model, color='red', label='PointsBet')
-    tools.plot_normal_cdf(ax, neds_model, color='orange', label='Neds')
-    tools.plot_normal_cdf(ax, tab_model, color='green', label='TAB')
+    plotting.plot_normal_cdf(ax, pb_model, color='red', label='PointsBet')
+    plotting.plot_normal_cdf(ax, neds_model, color='orange', label='Neds')
+    plotting.plot_normal_cdf(ax, tab_model, color='green', label='TAB')
     # print(pb_model['mu'], pb_model['sigma'])
 
-    if SWEEPS:
-        sweeps = tab_multi_margin_sweep(tab_lines_dict)
-        # print(sweeps) 
-
-        for sweep in sweeps:
+    if sweeps:
+        lb_matrix, theo_matrix, ub_matrix = tools.opposing_lines_margin_matrix(tab_book)
+        for sweep in planned_margin_sweep_stream(tab_book, tab_model):
             price = sweep['price']
             line1 = sweep['home_line']['home_line']
             line2 = sweep['away_line']['home_line']
             print('lines', line1, line2)
 
-            try:
-                lb, tab_theo, ub = tools.opposing_lines_margin(tab_lines_dict[line1][0]['price'], tab_lines_dict[line1][1]['price'],
-                                                            tab_lines_dict[line2][1]['price'], tab_lines_dict[line2][0]['price'])
-            except:
-                print("SOMETHING MESSED")
+            i1 = tab_book.index(line1)
+            i2 = tab_book.index(line2)
+            lb, tab_theo, ub = lb_matrix[i2, i1], theo_matrix[i2, i1], ub_matrix[i2, i1]
+            if np.ma.is_masked(lb) or np.ma.is_masked(ub):
+                print('Invalid margin bounds')
                 continue
-            print(tab_lines_dict[line1][0]['price'], tab_lines_dict[line1][1]['price'],tab_lines_dict[line2][1]['price'], tab_lines_dict[line2][0]['price'] )
+            print(tab_book.home_prices[i1], tab_book.away_prices[i1], tab_book.away_prices[i2], tab_book.home_prices[i2])
             print(round(tab_theo, 2), price)
             print('EV bound: ',  100*round(price / ub, 3)-100, ' - ', 100*round(price / lb, 3)-100)
             print('EV:', 100*round(price / tab_theo, 3)-100)
@@ -89,35 +72,17 @@ def main():
 
             print()
 
-    def custom_formatter(x, pos):
-        if x > 0:
-            return '{:.1f}'.format(x + 0.5)
-        elif x < 0:
-            return '{:.1f}'.format(x - 0.5)
-        else:
-            return '{:.1f}'.format(x)
-
-    ax.xaxis.set_major_formatter(plt.FuncFormatter(custom_formatter))
-
-    current_xlim = ax.get_xlim()
-    min_tick = np.floor(current_xlim[0] / 1.5) * 1.5 - 0.5
-    max_tick = np.ceil(current_xlim[1] / 1.5) * 1.5 + 0.5
-    # print(min_tick, max_tick)
-    ax.set_xticks(np.arange(min_tick, max_tick + 0.1, 1))
-    # print(np.arange(min_tick, max_tick + 0.1, 1))
-    ax.set_yticks(np.arange(0, 1+0.01, 0.05))
-    ax.set_xlabel(f'Home Side Handicap')
-    ax.set_ylabel('Probability')
-    ax.set_title(f'Handicap Line CDF: {teams[0]} (Home) vs {teams[1]} (Away)')
-    ax.minorticks_on()
-    ax.legend(loc='upper left')
-    ax.grid()
-
-    ruler = tools.Ruler(ax)
+    render.style_axes(ax, teams)
+
+    ruler = plotting.Ruler(ax)
     fig.tight_layout()
     plt.show()
 
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Line CDF chart of one event across bookmakers')
+    cli.add_event_arguments(parser)
+    parser.add_argument('--sweeps', action='store_true', help='also run a planned TAB SGM margin sweep')
+    args = parser.parse_args()
+    main(cli.event_ids(args), sweeps=args.sweeps, timeout=args.timeout)
\ No newline at end of file
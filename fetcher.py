@@ -0,0 +1,104 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import adapters
+import instrumentation
+import line_apis
+
+
+BOOKMAKERS = {book: adapter.get_lines for book, adapter in adapters.ADAPTERS.items()}
+
+
+class LineFetcher:
+    """Fetches lines from every bookmaker for many events at once.
+
+    Each bookmaker keeps one long-lived pooled session, and every (event, bookmaker) request runs
+    concurrently, so a snapshot takes as long as its slowest bookmaker rather than the sum of them.
+    An event is a dict mapping bookmaker name to that bookmaker's event id, e.g.
+    {'tab': 'Indiana%20v%20Golden%20State', 'pointsbet': '1764984', 'neds': 'adb6e940-...'}.
+    """
+
+    def __init__(self, bookmakers=None, max_workers=16, pool_size=8, timeout=5):
+        self.bookmakers = dict(BOOKMAKERS if bookmakers is None else bookmakers)
+        self.timeout = timeout
+        self.sessions = {book: line_apis.make_session(pool_size=pool_size) for book in self.bookmakers}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _fetch_book(self, book, event_id):
+        start = time.time()
+        teams, lines = self.bookmakers[book](event_id, session=self.sessions[book], timeout=self.timeout)
+        return teams, lines, start, time.time()
+
+    def fetch(self, events):
+        """Returns one snapshot per event, in the same order as events.
+
+        A snapshot is a dict with keys
+            'event': the event dict passed in
+            'timestamp': time the last bookmaker response for the event arrived
+            'teams': (home, away) as named by the first bookmaker in the event that succeeded, None if all failed
+            'lines': bookmaker -> lines list in the line_apis format
+            'latency': bookmaker -> request + parse time in seconds
+            'errors': bookmaker -> exception, for bookmakers that failed
+        """
+        futures = []
+        for event in events:
+            event_futures = {}
+            for book, event_id in event.items():
+                if book in self.bookmakers and event_id is not None:
+                    event_futures[book] = self.executor.submit(self._fetch_book, book, event_id)
+            futures.append(event_futures)
+        wait([future for event_futures in futures for future in event_futures.values()])
+
+        snapshots = []
+        for event, event_futures in zip(events, futures):
+            snapshot = {
+                'event': event,
+                'timestamp': None,
+                'teams': None,
+                'lines': {},
+                'latency': {},
+                'errors': {},
+            }
+            for book, future in event_futures.items():
+                try:
+                    teams, lines, start, end = future.result()
+                except Exception as e:
+                    snapshot['errors'][book] = e
+                    instrumentation.record_error('fetch', e, book=book)
+                    continue
+                if snapshot['teams'] is None:
+                    snapshot['teams'] = tuple(teams)
+                snapshot['lines'][book] = lines
+                snapshot['latency'][book] = end - start
+                instrumentation.observe('fetch_seconds', end - start, book=book)
+                snapshot['timestamp'] = max(end, snapshot['timestamp'] or end)
+            if snapshot['timestamp'] is None:
+                snapshot['timestamp'] = time.time()
+            snapshots.append(snapshot)
+        return snapshots
+
+    def discover(self, competitions, matcher=None):
+        """Canonical events of competitions (e.g. ['NBA', 'NFL', 'AFL', 'NRL']) across every bookmaker whose
+        registered adapter discovers events (TAB), discovered concurrently on this fetcher's sessions.
+        Bookmakers without discovery join an event by adding their id to its 'ids'.
+        Returns (events, errors) as adapters.EventMatcher.match and adapters.discover_events; pass the same
+        matcher on every call to keep event keys stable. fetch([event['ids'] for event in events]) fetches them."""
+        matcher = adapters.EventMatcher() if matcher is None else matcher
+        books = [book for book in self.bookmakers if book in adapters.ADAPTERS and adapters.ADAPTERS[book].discovers]
+        book_events, errors = adapters.discover_events(competitions, books=books, sessions=self.sessions,
+                                                       executor=self.executor, timeout=self.timeout)
+        return matcher.match(book_events), errors
+
+    def fetch_event(self, event):
+        return self.fetch([event])[0]
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for session in self.sessions.values():
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
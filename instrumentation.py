@@ -0,0 +1,287 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+
+
+ENABLED = False
+
+PREFIX = 'sports_distribution_'
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ITERATION_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 50, 100)
+
+
+class Metrics:
+    """Thread-safe counters and histograms keyed by (name, sorted label items)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        # (name, labels) -> [bucket bounds, bucket counts, count, sum, min, max]
+        self.histograms = {}
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, labels=()):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [tuple(buckets), [0]*(len(buckets) + 1), 0, 0.0, value, value]
+            histogram[1][bisect_left(histogram[0], value)] += 1
+            histogram[2] += 1
+            histogram[3] += value
+            histogram[4] = min(histogram[4], value)
+            histogram[5] = max(histogram[5], value)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """Every metric as a list of JSON-serializable dicts"""
+        with self.lock:
+            rows = [{'name': name, 'labels': dict(labels), 'type': 'counter', 'value': value}
+                    for (name, labels), value in self.counters.items()]
+            for (name, labels), (bounds, counts, count, total, low, high) in self.histograms.items():
+                rows.append({
+                    'name': name,
+                    'labels': dict(labels),
+                    'type': 'histogram',
+                    'count': count,
+                    'sum': total,
+                    'min': low,
+                    'max': high,
+                    'buckets': dict(zip([*map(str, bounds), '+Inf'], counts)),
+                })
+        return rows
+
+
+METRICS = Metrics()
+
+
+def enable(reset=False):
+    global ENABLED
+    if reset:
+        METRICS.reset()
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def inc(name, value=1, **labels):
+    if ENABLED:
+        METRICS.inc(name, value, tuple(sorted(labels.items())))
+
+
+def observe(name, value, buckets=SECONDS_BUCKETS, **labels):
+    if ENABLED:
+        METRICS.observe(name, value, buckets, tuple(sorted(labels.items())))
+
+
+def classify_error(e):
+    """Coarse error kind for the errors_total counters"""
+    import requests
+    if isinstance(e, requests.Timeout):
+        return 'timeout'
+    if isinstance(e, requests.ConnectionError):
+        return 'connection'
+    if isinstance(e, requests.HTTPError):
+        status = getattr(e.response, 'status_code', None)
+        if status == 429:
+            return 'rate_limited'
+        if status is not None:
+            return f'http_{status // 100}xx'
+        return 'http'
+    if isinstance(e, requests.RequestException):
+        return 'request'
+    if isinstance(e, (json.JSONDecodeError, UnicodeDecodeError)):
+        return 'decode'
+    if isinstance(e, (KeyError, IndexError, TypeError, AttributeError)):
+        return 'schema'
+    if isinstance(e, ValueError):
+        return 'value'
+    return 'other'
+
+
+def record_error(stage, e, **labels):
+    if ENABLED:
+        METRICS.inc('errors_total', 1, tuple(sorted({**labels, 'stage': stage, 'kind': classify_error(e)}.items())))
+
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        METRICS.observe(self.name + '_seconds', time.perf_counter() - self.start, SECONDS_BUCKETS, self.labels)
+        if exc is not None:
+            METRICS.inc('errors_total', 1, tuple(sorted({**dict(self.labels), 'stage': self.name,
+                                                        'kind': classify_error(exc)}.items())))
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """Context manager timing its block into the histogram name_seconds, and counting an errors_total with
+    stage=name if the block raises. A shared no-op when instrumentation is disabled."""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, tuple(sorted(labels.items())))
+
+
+def record_fit(method, iterations, converged):
+    if ENABLED:
+        labels = (('method', method),)
+        METRICS.inc('fits_total', 1, labels + (('converged', str(bool(converged)).lower()),))
+        if iterations is not None:
+            METRICS.observe('fit_iterations', iterations, ITERATION_BUCKETS, labels)
+
+
+def _label_str(labels, extra=()):
+    items = [*labels, *extra]
+    if not items:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in items) + '}'
+
+
+def prometheus_text(metrics=METRICS):
+    """Metrics in the Prometheus text exposition format"""
+    lines = []
+    with metrics.lock:
+        counters = sorted(metrics.counters.items())
+        histograms = sorted((key, (bounds, list(counts), count, total)) for key, (bounds, counts, count, total, _, _)
+                            in metrics.histograms.items())
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {PREFIX}{name} counter')
+        lines.append(f'{PREFIX}{name}{_label_str(labels)} {value}')
+    for (name, labels), (bounds, counts, count, total) in histograms:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+        cumulative = 0
+        for bound, bucket_count in zip([*map(str, bounds), '+Inf'], counts):
+            cumulative += bucket_count
+            lines.append(f'{PREFIX}{name}_bucket{_label_str(labels, (("le", bound),))} {cumulative}')
+        lines.append(f'{PREFIX}{name}_sum{_label_str(labels)} {total}')
+        lines.append(f'{PREFIX}{name}_count{_label_str(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _metrics_handler():
+    """Request handler class serving prometheus_text, built on first use so http.server is only imported by
+    processes that export metrics"""
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = prometheus_text(self.server.metrics).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+class MetricsServer:
+    """Serves prometheus_text at http://host:port/metrics from a daemon thread. port=0 picks a free port."""
+
+    def __init__(self, host='127.0.0.1', port=9108, metrics=METRICS):
+        from http.server import ThreadingHTTPServer
+        self.server = ThreadingHTTPServer((host, port), _metrics_handler())
+        self.server.daemon_threads = True
+        self.server.metrics = metrics
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/metrics'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class JsonLogExporter:
+    """Appends {'timestamp', 'metrics': Metrics.snapshot()} as a JSON line to path every interval seconds,
+    and once more on stop"""
+
+    def __init__(self, path, interval=10.0, metrics=METRICS):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def write(self):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'timestamp': time.time(), 'metrics': self.metrics.snapshot()}) + '\n')
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
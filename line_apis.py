@@ -1,5 +1,94 @@
 import requests
 import json
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+from lines_book import LinesBook
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+
+
+def make_session(pool_size=8, retries=2, backoff_factor=0.25, retry_methods=('GET',)):
+    """Long-lived keep-alive session with a connection pool of pool_size and retry/backoff on 429/5xx"""
+    session = requests.session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(retry_methods),
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _loads_json(content, lazy):
+    if lazy and simdjson is not None:
+        return simdjson.Parser().parse(content)
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def loads_json(content, lazy=False):
+    """Decodes a response body straight from bytes, with orjson when it is installed.
+    lazy=True returns a pysimdjson document when it is installed: objects are only materialised when
+    indexed with [], so subtrees a parser never indexes are never built. Parsers of lazy documents use
+    keys() and [] only, since values() and items() materialise every child."""
+    if not instrumentation.ENABLED:
+        return _loads_json(content, lazy)
+    decoder = 'simdjson' if lazy and simdjson is not None else 'orjson' if orjson is not None else 'json'
+    instrumentation.inc('json_decode_bytes_total', len(content), decoder=decoder)
+    with instrumentation.timer('json_decode', decoder=decoder):
+        return _loads_json(content, lazy)
+
+
+_TEAM_LINE_RE = re.compile(r'^(.*) ([+-]?\d+(?:\.\d+)?)$')
+
+
+@lru_cache(maxsize=8192)
+def split_team_line(team_line):
+    """'Golden State +4.5' -> ('Golden State', 4.5). Cached, since the same names come back every poll"""
+    match = _TEAM_LINE_RE.match(team_line)
+    if match is None:
+        raise ValueError(f'No line in {team_line!r}')
+    return match.group(1), float(match.group(2))
+
+
+def _request_get(session, url, headers, timeout):
+    if session is None:
+        response = requests.request("GET", url, headers=headers, data={}, timeout=timeout)
+    else:
+        response = session.request("GET", url, headers=headers, data={}, timeout=timeout)
+    if response.status_code != 304:
+        response.raise_for_status()
+    return response
+
+
+def _get(session, url, headers, timeout):
+    if not instrumentation.ENABLED:
+        return _request_get(session, url, headers, timeout)
+    host = urlsplit(url).hostname
+    with instrumentation.timer('http_request', host=host):
+        response = _request_get(session, url, headers, timeout)
+    instrumentation.inc('http_responses_total', host=host, status=response.status_code)
+    return response
 
 
 def make_lines_dict(lines):
@@ -15,16 +104,31 @@ def make_lines_dict(lines):
     return lines_dict
 
 
-def pointsbet_get_lines(market_id_str):
-    session = requests.session()
+def make_lines_book(lines):
+    """Columnar replacement for make_lines_dict"""
+    return LinesBook.from_lines(lines)
+
+
+def pointsbet_request(market_id_str):
     url = f'https://api.au.pointsbet.com/api/mes/v3/events/{market_id_str}'
-    payload = {}
     headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+        'User-Agent': USER_AGENT,
     }
-    response = session.request("GET", url, headers=headers, data=payload)
-    response_dict = json.loads(response.text)
+    return url, headers
 
+
+def pointsbet_get_lines(market_id_str, session=None, timeout=None):
+    url, headers = pointsbet_request(market_id_str)
+    response = _get(session, url, headers, timeout)
+    response_dict = loads_json(response.content)
+    with instrumentation.timer('parse', book='pointsbet'):
+        return pointsbet_parse_lines(response_dict)
+
+
+POINTSBET_MARKET_TYPES = frozenset(['Moneyline', 'Point Spread', 'Pick Your Own Line'])
+
+
+def pointsbet_parse_lines(response_dict):
     market_dicts = response_dict['fixedOddsMarkets']
 
     home_team = response_dict['homeTeam']
@@ -32,7 +136,7 @@ def pointsbet_get_lines(market_id_str):
 
     lines = []
     for market_dict in market_dicts:
-        if market_dict['eventClass'] == 'Moneyline' or market_dict['eventClass'] == 'Point Spread' or market_dict['eventClass'] == 'Pick Your Own Line':
+        if market_dict['eventClass'] in POINTSBET_MARKET_TYPES:
             outcome_dicts = market_dict['outcomes']
             for outcome_dict in outcome_dicts:
                 home_side = outcome_dict['side'] == 'Home'
@@ -41,36 +145,50 @@ def pointsbet_get_lines(market_id_str):
                     'home_line': home_line,
                     'home_side': home_side,
                     'price': outcome_dict['price'],
+                    'id': outcome_dict.get('outcomeId'),
                     'market_type': market_dict['eventClass'],
                 })
 
     return (home_team, away_team), lines
 
 
-def tab_get_lines(match_str, jurisdiction='NSW'):
-    url = f'https://api.beta.tab.com.au/v1/tab-info-service/sports/Basketball/competitions/NBA/matches/{match_str}?jurisdiction={jurisdiction}'
-    payload = {}
+def tab_request(match_str, jurisdiction='NSW'):
+    """match_str is a url-quoted match name, e.g. 'Indiana%20v%20Golden%20State' for an NBA match,
+    or '<sport>/<competition>/<match>' with each part url-quoted for any other competition"""
+    sport, competition, match = match_str.split('/') if '/' in match_str else ('Basketball', 'NBA', match_str)
+    url = f'https://api.beta.tab.com.au/v1/tab-info-service/sports/{sport}/competitions/{competition}/matches/{match}?jurisdiction={jurisdiction}'
     headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+        'User-Agent': USER_AGENT,
     }
-    response = requests.request("GET", url, headers=headers, data=payload)
-    response_dict = json.loads(response.text)
+    return url, headers
+
+
+def tab_get_lines(match_str, jurisdiction='NSW', session=None, timeout=None):
+    url, headers = tab_request(match_str, jurisdiction)
+    response = _get(session, url, headers, timeout)
+    response_dict = loads_json(response.content)
+    with instrumentation.timer('parse', book='tab'):
+        return tab_parse_lines(response_dict)
+
+
+TAB_MARKET_TYPES = frozenset(['Head To Head', 'Line', 'Pick Your Own Line'])
+
+
+def tab_parse_lines(response_dict):
     teams = response_dict['competitors']
     market_dicts = response_dict['markets']
 
     lines = []
     for market_dict in market_dicts:
-        if market_dict['betOption'] == 'Head To Head' or market_dict['betOption'] == 'Line' or market_dict['betOption'] == 'Pick Your Own Line':
+        if market_dict['betOption'] in TAB_MARKET_TYPES:
             outcome_dicts = market_dict['propositions']
             for outcome_dict in outcome_dicts:
                 team_line = outcome_dict['name']
-                split = team_line.split(' ')
                 if market_dict['betOption'] == 'Head To Head':
                     line = 0
                     team = team_line
                 else:
-                    line = float(split[-1])
-                    team = ' '.join(split[0:-1])
+                    team, line = split_team_line(team_line)
                 home_line = line if team == teams[0] else -line
 
                 lines.append({
@@ -84,112 +202,179 @@ def tab_get_lines(match_str, jurisdiction='NSW'):
     return (teams[0], teams[1]), lines
 
 
-def neds_get_lines(event_id_str):
-    session = requests.session()
+NEDS_HEADERS = {
+    'authority': 'api.neds.com.au',
+    'accept': '*/*',
+    'accept-language': 'en-GB,en-US;q=0.9,en;q=0.8',
+    'content-type': 'application/json',
+    'if-modified-since': 'Sun, 04 Feb 2024 09:49:08 GMT',
+    'origin': 'https://www.neds.com.au',
+    'referer': 'https://www.neds.com.au/',
+    'sec-ch-ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"',
+    'sec-fetch-dest': 'empty',
+    'sec-fetch-mode': 'cors',
+    'sec-fetch-site': 'same-site',
+    'user-agent': USER_AGENT,
+}
+
+
+def neds_request(event_id_str):
     url = f'https://api.neds.com.au/v2/sport/event-card?id={event_id_str}'
-    payload = {}
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-    }
-    headers = {
-        'authority': 'api.neds.com.au',
-        'accept': '*/*',
-        'accept-language': 'en-GB,en-US;q=0.9,en;q=0.8',
-        'content-type': 'application/json',
-        'if-modified-since': 'Sun, 04 Feb 2024 09:49:08 GMT',
-        'origin': 'https://www.neds.com.au',
-        'referer': 'https://www.neds.com.au/',
-        'sec-ch-ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': '"Windows"',
-        'sec-fetch-dest': 'empty',
-        'sec-fetch-mode': 'cors',
-        'sec-fetch-site': 'same-site',
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-    }
-    response = session.request("GET", url, headers=headers, data=payload)
-    response_dict = json.loads(response.text)
-
-    teams = [None, None]
-    assert len(response_dict['event_participants'].values()) == 2
-    for team_dict in response_dict['event_participants'].values():
-        if team_dict['home_away'] == 'HOME':
-            teams[0] = team_dict['name']
-        else:
-            teams[1] = team_dict['name']
-    assert None not in teams
-
-    market_type_mapping = {}
-    market_types = set(['Alternate Lines'])
-
-    for market_type_dict in response_dict['market_type_groups'].values():
-        if market_type_dict['name'] in market_types:
-            market_type_mapping[market_type_dict['id']] = market_type_dict['name']
-
-    event_ids = response_dict['events'].keys()
-    assert len(event_ids) == 1
-    event_id = list(event_ids)[0]
+    return url, NEDS_HEADERS
+
+
+def neds_get_lines(event_id_str, session=None, timeout=None):
+    url, headers = neds_request(event_id_str)
+    response = _get(session, url, headers, timeout)
+    response_dict = loads_json(response.content, lazy=True)
+    with instrumentation.timer('parse', book='neds'):
+        return neds_parse_lines(response_dict)
+
+
+def _neds_odds(odds_dict):
+    odds = odds_dict['odds']
+    return (odds['numerator'] + odds['denominator']) / odds['denominator']
+
+
+class NedsEventCard:
+    """One-pass indexes over a Neds event-card response: market name -> market ids, market type group name
+    -> market ids and entrant id -> price key. Extracting a market family is then a dictionary lookup
+    rather than another scan of the response. response_dict may be a dict or a lazy loads_json document,
+    so objects are only walked with keys() and [], and prices are decoded on demand."""
+
+    def __init__(self, response_dict):
+        self.response_dict = response_dict
+        self.markets = response_dict['markets']
+        self.entrants = response_dict['entrants']
+        self.prices = response_dict['prices']
+
+        participants = response_dict['event_participants']
+        teams = [None, None]
+        assert len(participants) == 2
+        for participant_id in participants.keys():
+            team_dict = participants[participant_id]
+            if team_dict['home_away'] == 'HOME':
+                teams[0] = team_dict['name']
+            else:
+                teams[1] = team_dict['name']
+        assert None not in teams
+        self.teams = teams
+
+        event_ids = list(response_dict['events'].keys())
+        assert len(event_ids) == 1
+        self.event_id = event_ids[0]
+
+        self.market_ids_by_name = {}
+        for market_id in self.markets.keys():
+            self.market_ids_by_name.setdefault(self.markets[market_id]['name'], []).append(market_id)
+
+        market_type_groups = response_dict['market_type_groups']
+        group_names = {}
+        for market_type_group_id in market_type_groups.keys():
+            market_type_dict = market_type_groups[market_type_group_id]
+            group_names[market_type_dict['id']] = market_type_dict['name']
+        self.market_ids_by_group = {}
+        for market_group in response_dict['events'][self.event_id]['market_type_group_markets']:
+            group_name = group_names.get(market_group['market_type_group_id'])
+            if group_name is not None:
+                self.market_ids_by_group.setdefault(group_name, []).extend(market_group['market_ids'])
+
+        # Price keys are '<entrant id>:<market id>:...'
+        self.price_keys = {}
+        for key in self.prices.keys():
+            self.price_keys[key.partition(':')[0]] = key
+
+    def price(self, entrant_id):
+        return _neds_odds(self.prices[self.price_keys[entrant_id]])
+
+    def market_ids(self, name=None, group=None):
+        """Ids of the markets called name, or in the market type group called group"""
+        if group is not None:
+            return self.market_ids_by_group.get(group, [])
+        return self.market_ids_by_name.get(name, [])
+
+    def entrants_of(self, market_ids):
+        """(market_id, entrant_id, entrant_dict, price) for every entrant of the given markets"""
+        rows = []
+        for market_id in market_ids:
+            for entrant_id in self.markets[market_id]['entrant_ids']:
+                rows.append((market_id, entrant_id, self.entrants[entrant_id], self.price(entrant_id)))
+        return rows
+
+
+def neds_parse_lines(response_dict):
+    card = NedsEventCard(response_dict)
+    teams = card.teams
 
     lines = []
 
-    price_map = {}
-    for key, odds_dict in response_dict['prices'].items():
-        odds = (odds_dict['odds']['numerator'] + odds_dict['odds']['denominator']) / odds_dict['odds']['denominator']
-        entrant_id = key.split(':')[0]
-        price_map[entrant_id] = odds
-
-    for market_group in response_dict['events'][event_id]['market_type_group_markets']:
-        if market_group['market_type_group_id'] in market_type_mapping:
-            for market_id in market_group['market_ids']:
-                entrant_ids = response_dict['markets'][market_id]['entrant_ids']
-                for entrant_id in entrant_ids:
-                    entrant_dict = response_dict['entrants'][entrant_id]
-                    odds = price_map[entrant_id]
-                    team_line = entrant_dict['name']
-                    split = team_line.split(' ')
-                    line = float(split[-1])
-                    team = ' '.join(split[:-1])
-                    home_side = team == teams[0]
-                    lines.append({
-                        'home_line': line if home_side else -line,
-                        'home_side': home_side,
-                        'price': odds,
-                    })
-
-
-    remaining_market_types = set(['Head To Head', 'Line'])
-
-    for market_dict in response_dict['markets'].values():
-        if market_dict['name'] == 'Head To Head':
-            for entrant_id in market_dict['entrant_ids']:
-                entrant_dict = response_dict['entrants'][entrant_id]
-                odds = price_map[entrant_id]
-                home_side = entrant_dict['home_away'] == 'HOME'
-                lines.append({
-                    'home_line': 0,
-                    'home_side': home_side,
-                    'price': odds,
-                })
-            remaining_market_types.remove('Head To Head')
-
-        if market_dict['name'] == 'Line':
-            home_line = -market_dict['handicap']
-            for entrant_id in market_dict['entrant_ids']:
-                entrant_dict = response_dict['entrants'][entrant_id]
-                odds = price_map[entrant_id]
-                home_side = entrant_dict['home_away'] == 'HOME'
-                lines.append({
-                    'home_line': home_line,
-                    'home_side': home_side,
-                    'price': odds,
-                })
-            remaining_market_types.remove('Line')
-
-        if len(remaining_market_types) == 0:
-            break
+    for market_type in ['Alternate Lines']:
+        for _, entrant_id, entrant_dict, odds in card.entrants_of(card.market_ids(group=market_type)):
+            team, line = split_team_line(entrant_dict['name'])
+            home_side = team == teams[0]
+            lines.append({
+                'home_line': line if home_side else -line,
+                'home_side': home_side,
+                'price': odds,
+                'id': entrant_id,
+                'market_type': market_type,
+            })
+
+    for _, entrant_id, entrant_dict, odds in card.entrants_of(card.market_ids(name='Head To Head')):
+        lines.append({
+            'home_line': 0,
+            'home_side': entrant_dict['home_away'] == 'HOME',
+            'price': odds,
+            'id': entrant_id,
+            'market_type': 'Head To Head',
+        })
+
+    for market_id, entrant_id, entrant_dict, odds in card.entrants_of(card.market_ids(name='Line')):
+        lines.append({
+            'home_line': -card.markets[market_id]['handicap'],
+            'home_side': entrant_dict['home_away'] == 'HOME',
+            'price': odds,
+            'id': entrant_id,
+            'market_type': 'Line',
+        })
 
     return teams, lines
-    
+
+
+BOOKMAKER_ENDPOINTS = {
+    'tab': (tab_request, tab_parse_lines),
+    'pointsbet': (pointsbet_request, pointsbet_parse_lines),
+    'neds': (neds_request, neds_parse_lines),
+}
+
+
+def get_lines_conditional(book, event_id, validators=None, session=None, timeout=None):
+    """Conditional GET of a bookmaker's lines using the ETag/Last-Modified validators of the previous response.
+    Returns (teams, lines, validators), with teams and lines None when the server answers 304 Not Modified."""
+    request_fn, parse_fn = BOOKMAKER_ENDPOINTS[book]
+    url, headers = request_fn(event_id)
+    # the fixed if-modified-since the Neds headers carry would make the first request conditional too
+    headers = {key: value for key, value in headers.items() if key.lower() not in ('if-modified-since', 'if-none-match')}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    response = _get(session, url, headers, timeout)
+    if response.status_code == 304:
+        instrumentation.inc('conditional_requests_total', book=book, result='not_modified')
+        return None, None, validators
+    instrumentation.inc('conditional_requests_total', book=book, result='modified')
+    new_validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    response_dict = loads_json(response.content, lazy=book == 'neds')
+    with instrumentation.timer('parse', book=book):
+        teams, lines = parse_fn(response_dict)
+    return teams, lines, new_validators
 
 
 
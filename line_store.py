@@ -0,0 +1,326 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from lines_book import LinesBook, as_lines_book, _id_array
+
+
+# column name -> (file name, on-disk dtype)
+COLUMNS = {
+    'line_levels': ('line_level.i2', np.dtype('<i2')),
+    'home_prices': ('home_price.f4', np.dtype('<f4')),
+    'away_prices': ('away_price.f4', np.dtype('<f4')),
+    'home_ids': ('home_id.i4', np.dtype('<i4')),
+    'away_ids': ('away_id.i4', np.dtype('<i4')),
+    'home_market_types': ('home_market_type.i2', np.dtype('<i2')),
+    'away_market_types': ('away_market_type.i2', np.dtype('<i2')),
+}
+# dictionary encoded columns -> symbol table shared by both sides
+SYMBOLS = {
+    'home_ids': 'ids.symbols',
+    'away_ids': 'ids.symbols',
+    'home_market_types': 'market_types.symbols',
+    'away_market_types': 'market_types.symbols',
+}
+INDEX_FILE = 'index.i8'
+INDEX_DTYPE = np.dtype([('timestamp', '<i8'), ('end', '<i8')])
+
+
+def _day(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d')
+
+
+def _read_symbols(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.endswith('\n')]
+
+
+def _memmap(path, dtype, start, stop):
+    """Rows [start, stop) of a column file, memory mapped"""
+    if stop <= start:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=start*dtype.itemsize, shape=(stop - start,))
+
+
+class _PartitionWriter:
+    """Open column files of one (event, book, day) partition.
+
+    A snapshot's rows are appended to every column file and its (timestamp, end row) is kept in memory.
+    flush() writes and fsyncs the columns and symbol tables before the pending index entries, so readers,
+    which only see rows the index covers, never find an entry pointing past rows on disk. A crash loses the
+    unflushed snapshots; reopening cuts the index back to the rows every column holds and truncates the
+    columns to the last indexed row."""
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, INDEX_FILE)
+        index = np.zeros(0, dtype=INDEX_DTYPE)
+        if os.path.exists(index_path):
+            index = np.fromfile(index_path, dtype=INDEX_DTYPE, count=os.path.getsize(index_path) // INDEX_DTYPE.itemsize)
+        column_paths = [(os.path.join(path, file_name), dtype) for file_name, dtype in COLUMNS.values()]
+        # rows every column file holds, entries past them were indexed without their rows reaching disk
+        on_disk = min(os.path.getsize(column_path) // dtype.itemsize if os.path.exists(column_path) else 0
+                      for column_path, dtype in column_paths)
+        index = index[:np.searchsorted(index['end'], on_disk, side='right')]
+        if len(index):
+            self.rows, self.last_timestamp = int(index['end'][-1]), int(index['timestamp'][-1])
+        else:
+            self.rows, self.last_timestamp = 0, None
+        if os.path.exists(index_path):
+            os.truncate(index_path, len(index) * INDEX_DTYPE.itemsize)
+        for column_path, dtype in column_paths:
+            if os.path.exists(column_path):
+                os.truncate(column_path, self.rows * dtype.itemsize)
+
+        self.symbols = {}
+        self.symbol_files = {}
+        for file_name in set(SYMBOLS.values()):
+            symbol_path = os.path.join(path, file_name)
+            symbols = _read_symbols(symbol_path)
+            if os.path.exists(symbol_path):
+                os.truncate(symbol_path, sum(len(json.dumps(symbol)) + 1 for symbol in symbols))
+            self.symbols[file_name] = {symbol: code for code, symbol in enumerate(symbols)}
+            self.symbol_files[file_name] = open(symbol_path, 'a')
+        self.files = {column: open(os.path.join(path, file_name), 'ab') for column, (file_name, _) in COLUMNS.items()}
+        self.index_file = open(index_path, 'ab')
+        self.pending = []
+
+    def _codes(self, column, values, missing):
+        file_name = SYMBOLS[column]
+        table = self.symbols[file_name]
+        codes = np.empty(len(values), dtype=COLUMNS[column][1])
+        for k, value in enumerate(values.tolist()):
+            if value == missing or value is None:
+                codes[k] = -1
+                continue
+            code = table.get(value)
+            if code is None:
+                code = table[value] = len(table)
+                self.symbol_files[file_name].write(json.dumps(value) + '\n')
+            codes[k] = code
+        return codes
+
+    def append(self, timestamp, book):
+        # clamp so timestamps within a partition never decrease, which range queries rely on
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            timestamp = self.last_timestamp
+        self.files['line_levels'].write((2*book.line_levels).astype(COLUMNS['line_levels'][1]).tobytes())
+        for column in ('home_prices', 'away_prices'):
+            self.files[column].write(getattr(book, column).astype(COLUMNS[column][1]).tobytes())
+        for column, missing in (('home_ids', -1), ('away_ids', -1), ('home_market_types', ''), ('away_market_types', '')):
+            self.files[column].write(self._codes(column, getattr(book, column), missing).tobytes())
+        self.rows += len(book.line_levels)
+        self.last_timestamp = timestamp
+        self.pending.append((timestamp, self.rows))
+
+    def flush(self):
+        if not self.pending:
+            return
+        # rows and symbols durable first, the index last so it never points past rows that aren't on disk
+        for f in (*self.symbol_files.values(), *self.files.values()):
+            f.flush()
+            os.fsync(f.fileno())
+        self.index_file.write(np.array(self.pending, dtype=INDEX_DTYPE).tobytes())
+        self.index_file.flush()
+        os.fsync(self.index_file.fileno())
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        for f in (*self.symbol_files.values(), *self.files.values(), self.index_file):
+            f.close()
+
+
+class LineStore:
+    """Append-only columnar history of bookmaker ladders on disk.
+
+    Laid out as root/<event>/<book>/<YYYYMMDD>/ with one file per column: half point line levels as int16,
+    prices as float32 (nan where a side wasn't quoted), and ids and market types as codes into a per-partition
+    symbol table. Each partition's index holds a (timestamp in microseconds, end row) pair per snapshot.
+    Reads memory map only the columns asked for, and find time ranges by binary search of the index.
+
+    Writes go through buffered files kept open per partition; call flush() (or use the store as a context
+    manager) to make them visible to readers. Safe to append from several threads.
+    """
+
+    def __init__(self, root, flush_interval=1.0):
+        self.root = root
+        self.flush_interval = flush_interval
+        self._writers = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def _partition_path(self, event, book, day):
+        return os.path.join(self.root, quote(str(event), safe=''), quote(str(book), safe=''), day)
+
+    def append(self, event, book, lines, timestamp=None):
+        """Appends one snapshot of a ladder: a LinesBook, lines list or make_lines_dict dict.
+        timestamp is seconds since the epoch, now if None."""
+        timestamp = time.time() if timestamp is None else timestamp
+        book_lines = as_lines_book(lines)
+        key = (event, book, _day(timestamp))
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is None:
+                # a new day for this event and book, the previous day's partition is done
+                for old_key in [old_key for old_key in self._writers if old_key[:2] == key[:2]]:
+                    self._writers.pop(old_key).close()
+                writer = self._writers[key] = _PartitionWriter(self._partition_path(*key))
+            writer.append(int(round(timestamp * 1e6)), book_lines)
+            if self.flush_interval is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def append_snapshot(self, event, snapshot):
+        """Appends every bookmaker's lines of a fetcher.LineFetcher snapshot under the event key event"""
+        for book, lines in snapshot['lines'].items():
+            self.append(event, book, lines, snapshot['timestamp'])
+
+    def _flush(self):
+        for writer in self._writers.values():
+            writer.flush()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def events(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(unquote(name) for name in os.listdir(self.root))
+
+    def books(self, event):
+        path = os.path.join(self.root, quote(str(event), safe=''))
+        return sorted(unquote(name) for name in os.listdir(path)) if os.path.isdir(path) else []
+
+    def days(self, event, book, start=None, end=None):
+        """Day partitions of an event and book that can hold snapshots in [start, end]"""
+        path = os.path.join(self.root, quote(str(event), safe=''), quote(str(book), safe=''))
+        days = sorted(os.listdir(path)) if os.path.isdir(path) else []
+        first = _day(start) if start is not None else None
+        last = _day(end) if end is not None else None
+        return [day for day in days if (first is None or day >= first) and (last is None or day <= last)]
+
+    def read(self, event, book, start=None, end=None, columns=None):
+        """Every snapshot of an event and book with start <= timestamp <= end, as columns.
+
+        Returns a dict with
+            'timestamps': (S,) snapshot times in seconds
+            'offsets': (S + 1,) snapshot s is rows offsets[s]:offsets[s + 1] of the columns
+        and, for each of columns (default all of COLUMNS), that LinesBook attribute over all the snapshots' rows.
+        A single day's columns are memory maps, several days are concatenated.
+        """
+        columns = list(COLUMNS) if columns is None else list(columns)
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise KeyError(f'Unknown columns {sorted(unknown)}')
+        start_us = None if start is None else int(round(start * 1e6))
+        end_us = None if end is None else int(round(end * 1e6))
+
+        timestamps, ends, parts = [], [], {column: [] for column in columns}
+        rows = 0
+        for day in self.days(event, book, start, end):
+            path = self._partition_path(event, book, day)
+            index_path = os.path.join(path, INDEX_FILE)
+            count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize if os.path.exists(index_path) else 0
+            if count == 0:
+                continue
+            index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(count,))
+            first = 0 if start_us is None else np.searchsorted(index['timestamp'], start_us, side='left')
+            last = count if end_us is None else np.searchsorted(index['timestamp'], end_us, side='right')
+            if last <= first:
+                continue
+            row_start = int(index['end'][first - 1]) if first > 0 else 0
+            row_stop = int(index['end'][last - 1])
+            timestamps.append(np.asarray(index['timestamp'][first:last]))
+            ends.append(np.asarray(index['end'][first:last]) - row_start + rows)
+            rows += row_stop - row_start
+            for column in columns:
+                parts[column].append(self._read_column(path, column, row_start, row_stop))
+
+        result = {
+            'timestamps': np.concatenate(timestamps) / 1e6 if timestamps else np.zeros(0),
+            'offsets': np.concatenate([[0], *ends]).astype(np.int64),
+        }
+        for column in columns:
+            if len(parts[column]) == 1:
+                result[column] = parts[column][0]
+            elif parts[column]:
+                result[column] = np.concatenate(parts[column])
+            else:
+                result[column] = self._read_column(None, column, 0, 0)
+        return result
+
+    def _read_column(self, path, column, start, stop):
+        file_name, dtype = COLUMNS[column]
+        values = _memmap(os.path.join(path, file_name), dtype, start, stop) if path is not None else np.zeros(0, dtype=dtype)
+        if column == 'line_levels':
+            return values / 2
+        if column not in SYMBOLS:
+            return values
+        symbols = _read_symbols(os.path.join(path, SYMBOLS[column])) if path is not None else []
+        if column.endswith('_ids'):
+            decoded = _id_array(symbols)
+            missing = -1 if decoded.dtype != object else None
+        else:
+            decoded = np.array(symbols, dtype=str)
+            missing = ''
+        # code -1 picks the missing value appended at the end
+        decoded = np.append(decoded, np.array([missing], dtype=decoded.dtype if decoded.dtype != object else object))
+        return decoded[values]
+
+    def snapshots(self, event, book, start=None, end=None, columns=None):
+        """Yields (timestamp, LinesBook) for every snapshot in [start, end].
+        Only line levels and prices are read unless columns asks for ids or market types."""
+        columns = ['line_levels', 'home_prices', 'away_prices'] if columns is None else list(columns)
+        data = self.read(event, book, start, end, columns)
+        offsets = data['offsets']
+        for s, timestamp in enumerate(data['timestamps']):
+            a, b = offsets[s], offsets[s + 1]
+            kwargs = {column: data[column][a:b] for column in columns}
+            n = b - a
+            for column in ('line_levels', 'home_prices', 'away_prices'):
+                kwargs.setdefault(column, np.full(n, np.nan))
+            yield float(timestamp), LinesBook(**kwargs)
+
+    def snapshot_at(self, event, book, timestamp, columns=None):
+        """The latest LinesBook at or before timestamp, None if there isn't one"""
+        timestamp_us = int(round(timestamp * 1e6))
+        for day in reversed(self.days(event, book, end=timestamp)):
+            index_path = os.path.join(self._partition_path(event, book, day), INDEX_FILE)
+            count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize if os.path.exists(index_path) else 0
+            if count == 0:
+                continue
+            index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(count,))
+            position = np.searchsorted(index['timestamp'], timestamp_us, side='right')
+            if position > 0:
+                latest = int(index['timestamp'][position - 1]) / 1e6
+                *_, (_, lines_book) = self.snapshots(event, book, latest, latest, columns)
+                return lines_book
+        return None
+
+
+def record_stream(deltas, store):
+    """Appends the full ladder of each pipeline.PollingScheduler delta to store, yielding the deltas on"""
+    for delta in deltas:
+        store.append(delta['event'], delta['book'], delta['lines'], delta['timestamp'])
+        yield delta
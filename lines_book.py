@@ -0,0 +1,158 @@
+import numpy as np
+
+
+def _id_array(ids):
+    """int64 column when every id is an integer (-1 where missing), object column otherwise"""
+    try:
+        return np.array([-1 if id is None else id for id in ids], dtype=np.int64)
+    except (TypeError, ValueError, OverflowError):
+        return np.array(ids, dtype=object)
+
+
+class LinesBook:
+    """Columnar handicap ladder sorted by home line.
+
+    Index i holds the home and away quotes at line_levels[i]. A side that was not quoted has a nan price.
+    Replaces the {home_line: [home_bet, away_bet]} dict from line_apis.make_lines_dict.
+    """
+
+    __slots__ = ('line_levels', 'home_prices', 'away_prices', 'home_ids', 'away_ids', 'home_market_types', 'away_market_types')
+
+    def __init__(self, line_levels, home_prices, away_prices, home_ids=None, away_ids=None,
+                 home_market_types=None, away_market_types=None):
+        line_levels = np.asarray(line_levels, dtype=np.float64)
+        order = np.argsort(line_levels, kind='stable')
+        n = len(line_levels)
+        self.line_levels = line_levels[order]
+        self.home_prices = np.asarray(home_prices, dtype=np.float64)[order]
+        self.away_prices = np.asarray(away_prices, dtype=np.float64)[order]
+        self.home_ids = (np.full(n, -1, dtype=np.int64) if home_ids is None else np.asarray(home_ids))[order]
+        self.away_ids = (np.full(n, -1, dtype=np.int64) if away_ids is None else np.asarray(away_ids))[order]
+        self.home_market_types = (np.full(n, '', dtype=str) if home_market_types is None else np.asarray(home_market_types, dtype=str))[order]
+        self.away_market_types = (np.full(n, '', dtype=str) if away_market_types is None else np.asarray(away_market_types, dtype=str))[order]
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Builds a book from a lines list as returned by the line_apis getters.
+        As with make_lines_dict, a later quote for the same line and side replaces an earlier one."""
+        home_lines = np.array([line['home_line'] for line in lines], dtype=np.float64)
+        home_sides = np.array([line['home_side'] for line in lines], dtype=bool)
+        prices = np.array([line['price'] for line in lines], dtype=np.float64)
+        ids = _id_array([line.get('id') for line in lines])
+        market_types = np.array([line.get('market_type') or '' for line in lines], dtype=str)
+
+        line_levels, level_index = np.unique(home_lines, return_inverse=True)
+        n = len(line_levels)
+        columns = []
+        for side_mask in (home_sides, ~home_sides):
+            side_index = level_index[side_mask]
+            side_prices = np.full(n, np.nan)
+            side_prices[side_index] = prices[side_mask]
+            side_ids = np.full(n, -1, dtype=ids.dtype) if ids.dtype != object else np.full(n, None, dtype=object)
+            side_ids[side_index] = ids[side_mask]
+            side_market_types = np.full(n, '', dtype=market_types.dtype)
+            side_market_types[side_index] = market_types[side_mask]
+            columns.append((side_prices, side_ids, side_market_types))
+        (home_prices, home_ids, home_market_types), (away_prices, away_ids, away_market_types) = columns
+        return cls(line_levels, home_prices, away_prices, home_ids, away_ids, home_market_types, away_market_types)
+
+    @classmethod
+    def from_lines_dict(cls, lines_dict):
+        lines = [line for pair in lines_dict.values() for line in pair if line is not None]
+        return cls.from_lines(lines)
+
+    def __len__(self):
+        return len(self.line_levels)
+
+    def __repr__(self):
+        return f'LinesBook({len(self)} levels)'
+
+    def take(self, index):
+        """Sub-book of the given indices or boolean mask"""
+        book = LinesBook.__new__(LinesBook)
+        for name in LinesBook.__slots__:
+            setattr(book, name, getattr(self, name)[index])
+        return book
+
+    @property
+    def complete_mask(self):
+        return ~(np.isnan(self.home_prices) | np.isnan(self.away_prices))
+
+    def complete(self):
+        """Sub-book of the line levels quoted on both sides"""
+        mask = self.complete_mask
+        return self if mask.all() else self.take(mask)
+
+    def index(self, line_level):
+        """Position of line_level, KeyError if it is not in the book"""
+        i = np.searchsorted(self.line_levels, line_level)
+        if i == len(self.line_levels) or self.line_levels[i] != line_level:
+            raise KeyError(line_level)
+        return int(i)
+
+    def line(self, index, home_side):
+        """Single quote in the line_apis dict format"""
+        home_line = self.line_levels[index]
+        if home_side:
+            price, id, market_type = self.home_prices[index], self.home_ids[index], self.home_market_types[index]
+        else:
+            price, id, market_type = self.away_prices[index], self.away_ids[index], self.away_market_types[index]
+        return {
+            'home_line': float(home_line),
+            'home_side': home_side,
+            'price': float(price),
+            'id': id.item() if hasattr(id, 'item') else id,
+            'market_type': str(market_type),
+        }
+
+    def to_lines_dict(self):
+        lines_dict = {}
+        for i in range(len(self)):
+            lines_dict[float(self.line_levels[i])] = [
+                None if np.isnan(self.home_prices[i]) else self.line(i, True),
+                None if np.isnan(self.away_prices[i]) else self.line(i, False),
+            ]
+        return lines_dict
+
+    @property
+    def home_probs(self):
+        return 1 / self.home_prices
+
+    @property
+    def away_probs(self):
+        return 1 / self.away_prices
+
+    @property
+    def upperbound_probs(self):
+        """Home cover probability implied by the home price"""
+        return 1 / self.home_prices
+
+    @property
+    def lowerbound_probs(self):
+        """Home cover probability implied by the away price, 1/invert_odds(away_price)"""
+        return 1 - 1 / self.away_prices
+
+    @property
+    def overround(self):
+        return 1 / self.home_prices + 1 / self.away_prices - 1
+
+    def midpoint_probs(self, tail_penalty=0):
+        """Vectorized 1/tools.midpoint_odds(home_price, away_price, tail_penalty)"""
+        upperbound_probs = self.upperbound_probs
+        lowerbound_probs = self.lowerbound_probs
+        theo_probs = (upperbound_probs + lowerbound_probs) / 2
+        width = upperbound_probs - lowerbound_probs
+        lean = (theo_probs - 0.5) * tail_penalty * width / 2
+        return theo_probs + lean
+
+    def midpoint_odds(self, tail_penalty=0):
+        return 1 / self.midpoint_probs(tail_penalty)
+
+
+def as_lines_book(lines):
+    """Accepts a LinesBook, a make_lines_dict dict or a line_apis lines list"""
+    if isinstance(lines, LinesBook):
+        return lines
+    if isinstance(lines, dict):
+        return LinesBook.from_lines_dict(lines)
+    return LinesBook.from_lines(lines)
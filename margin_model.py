@@ -0,0 +1,209 @@
+import numpy as np
+from scipy import special
+
+import tools
+from lines_book import as_lines_book
+from pricing import MarginPricer
+
+
+FAMILY_PARAMS = {
+    'normal': ('mu', 'sigma'),
+    'skewnorm': ('mu', 'sigma', 'alpha'),
+}
+
+
+def _family_cdf(family, x, params):
+    """Continuous cdf of each row's parameters at x, params is (N, n_params) and x (N, K) or (K,)"""
+    z = (x - params[:, 0:1]) / params[:, 1:2]
+    if family == 'normal':
+        return special.ndtr(z)
+    if family == 'skewnorm':
+        return special.ndtr(z) - 2*special.owens_t(z, params[:, 2:3])
+    raise ValueError(f'Unknown family {family}')
+
+
+def margin_pmf_batch(params, family='normal', support=60, draws=False, key_weights=None):
+    """(N, 2*support + 1) probability mass over margins -support..support for each row of params.
+
+    The continuous family is discretized to unit bins centred on each integer, then the mass of each
+    key margin d is multiplied by key_weights[d], D == 0 is removed unless draws, and each row renormalized."""
+    params = np.atleast_2d(np.asarray(params, dtype=float))
+    edges = np.arange(-support - 0.5, support + 1.5)
+    pmf = np.diff(_family_cdf(family, edges[None, :], params), axis=1)
+    if key_weights:
+        weights = np.ones(2*support + 1)
+        for margin, weight in key_weights.items():
+            if -support <= margin <= support:
+                weights[margin + support] = weight
+        pmf = pmf * weights
+    if not draws:
+        pmf[:, support] = 0
+    return pmf / pmf.sum(axis=1, keepdims=True)
+
+
+class DiscreteMarginModel(MarginPricer):
+    """Probability mass over integer margins D, where a home bet at home_line L wins when D < L and pushes
+    when D == L. The cumulative array is precomputed, so every line, band and push price is a lookup.
+    Fit with fit_margin_model / fit_margin_models."""
+
+    def __init__(self, params, family='normal', support=60, draws=False, key_weights=None, pcov=None,
+                 iterations=None, converged=None):
+        self.params = np.asarray(params, dtype=float)
+        self.family = family
+        self.support = support
+        self.draws = draws
+        self.key_weights = key_weights
+        self.pcov = pcov
+        self.iterations = iterations
+        self.converged = converged
+        self.pmf = margin_pmf_batch(self.params, family, support, draws, key_weights)[0]
+        self.cdf_table = np.cumsum(self.pmf)
+
+    def __getattr__(self, name):
+        names = FAMILY_PARAMS.get(self.__dict__.get('family'), ())
+        if name in names:
+            return self.params[names.index(name)]
+        raise AttributeError(name)
+
+    def __repr__(self):
+        params = ', '.join(f'{name}={value:.3f}' for name, value in zip(FAMILY_PARAMS[self.family], self.params))
+        return f'DiscreteMarginModel({self.family}, {params})'
+
+    def margin_cdf(self, d):
+        """P(D <= d) for integer d"""
+        index = np.asarray(d, dtype=np.int64) + self.support
+        return np.where(index < 0, 0.0, self.cdf_table[np.clip(index, 0, 2*self.support)])
+
+
+def margin_fit_data(ladders):
+    """(home_lines, y, sigma) fitted by fit_margin_model, pooling the lower and upper bound probabilities
+    of every ladder of an event, weighted by their width as in fit_normal_cdf"""
+    if not isinstance(ladders, (list, tuple)) or (ladders and isinstance(ladders[0], dict) and 'home_line' in ladders[0]):
+        ladders = [ladders]
+    home_lines, y, sigma = [], [], []
+    for ladder in ladders:
+        book = as_lines_book(ladder).complete()
+        width = np.abs(book.upperbound_probs - book.lowerbound_probs)
+        home_lines += [book.line_levels, book.line_levels]
+        y += [book.lowerbound_probs, book.upperbound_probs]
+        sigma += [width, width]
+    if not home_lines:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    return np.concatenate(home_lines), np.concatenate(y), np.concatenate(sigma)
+
+
+def _predicted_cover_probs(params, home_lines, mask, family, support, draws, key_weights):
+    """Probability of a home bet winning given it doesn't push, for every (event, line) cell"""
+    cdf = np.cumsum(margin_pmf_batch(params, family, support, draws, key_weights), axis=1)
+    cdf = np.concatenate([np.zeros((len(cdf), 1)), cdf], axis=1)
+    # cdf[:, d + support + 1] = P(D <= d)
+    rows = np.arange(len(cdf))[:, None]
+    win = cdf[rows, np.clip(np.ceil(home_lines) - 1 + support + 1, 0, 2*support + 1).astype(int)]
+    no_push = 1 - (cdf[rows, np.clip(np.floor(home_lines) + support + 1, 0, 2*support + 1).astype(int)] - win)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(mask, win / no_push, 0)
+
+
+def fit_margin_models(events, family='normal', support=60, draws=False, key_weights=None, max_iterations=50, xtol=1e-8):
+    """Fits a DiscreteMarginModel to each event in one batch.
+
+    events is a list with one entry per event, each a ladder or a list of ladders (e.g. TAB, PointsBet and
+    Neds) as LinesBooks or make_lines_dict dicts. Events are padded into masked arrays and fitted together
+    by damped Gauss-Newton on the same weighted least squares as fit_normal_cdf, with a central difference
+    Jacobian. Events with fewer points than parameters get None."""
+    n_params = len(FAMILY_PARAMS[family])
+    data = [margin_fit_data(ladders) for ladders in events]
+    width = max([len(x) for x, _, _ in data], default=0) or 1
+    n_events = len(data)
+    home_lines = np.full((n_events, width), 0.5)
+    y = np.full((n_events, width), 0.5)
+    sigma = np.ones((n_events, width))
+    mask = np.zeros((n_events, width), dtype=bool)
+    for i, (x_i, y_i, sigma_i) in enumerate(data):
+        home_lines[i, :len(x_i)] = x_i
+        y[i, :len(x_i)] = y_i
+        sigma[i, :len(x_i)] = sigma_i
+        mask[i, :len(x_i)] = True
+
+    # with draws allowed and no key weights, the cover probability of a half point line L is the
+    # continuous cdf at L, so the probit estimate on the raw lines is a close start
+    params = np.zeros((n_events, n_params))
+    params[:, :2] = tools.probit_initial_estimate_batch(home_lines, y, sigma, mask)
+    fittable = mask.sum(axis=1) > n_params
+    params[~fittable, :2] = [0, 12]
+
+    def residuals(params, rows):
+        predicted = _predicted_cover_probs(params, home_lines[rows], mask[rows], family, support, draws, key_weights)
+        return np.where(mask[rows], (y[rows] - predicted) / sigma[rows], 0)
+
+    def jacobian(params, rows):
+        jac = np.empty((len(rows), width, n_params))
+        for k in range(n_params):
+            step = 1e-6 * np.maximum(1, np.abs(params[:, k]))
+            up, down = params.copy(), params.copy()
+            up[:, k] += step
+            down[:, k] -= step
+            # residuals are y - predicted, so d(model)/dp = -(d residual)/dp
+            jac[:, :, k] = -(residuals(up, rows) - residuals(down, rows)) / (2*step[:, None])
+        return jac
+
+    all_rows = np.arange(n_events)
+    r = residuals(params, all_rows)
+    cost = (r**2).sum(axis=1)
+    damping = np.full(n_events, 1e-6)
+    iterations = np.zeros(n_events, dtype=int)
+    converged = np.zeros(n_events, dtype=bool)
+    active = fittable.copy()
+    for _ in range(max_iterations):
+        rows = np.flatnonzero(active)
+        if len(rows) == 0:
+            break
+        iterations[rows] += 1
+        jac = jacobian(params[rows], rows)
+        jtj = np.einsum('nmi,nmj->nij', jac, jac)
+        gradient = np.einsum('nmi,nm->ni', jac, r[rows])
+        damped = jtj + damping[rows, None, None] * jtj * np.eye(n_params)
+        try:
+            step = np.linalg.solve(damped, gradient[:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            step = np.stack([np.linalg.lstsq(a, b, rcond=None)[0] for a, b in zip(damped, gradient)])
+        new_params = params[rows] + step
+        ok_scale = new_params[:, 1] > 0
+        damping[rows[~ok_scale]] *= 10
+        rows, step, new_params = rows[ok_scale], step[ok_scale], new_params[ok_scale]
+        if len(rows) == 0:
+            continue
+        new_r = residuals(new_params, rows)
+        new_cost = (new_r**2).sum(axis=1)
+        accept = new_cost <= cost[rows]
+        accepted = rows[accept]
+        params[accepted] = new_params[accept]
+        r[accepted] = new_r[accept]
+        cost[accepted] = new_cost[accept]
+        damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+        small_step = np.all(np.abs(step[accept]) <= xtol * (np.abs(new_params[accept]) + xtol), axis=1)
+        converged[accepted[small_step]] = True
+        rejected = rows[~accept]
+        damping[rejected] *= 10
+        converged[rejected[damping[rejected] > 1e12]] = True
+        active &= ~converged & (damping < 1e12)
+
+    models = []
+    jac = jacobian(params, all_rows)
+    for i in range(n_events):
+        if not fittable[i]:
+            models.append(None)
+            continue
+        dof = mask[i].sum() - n_params
+        try:
+            pcov = np.linalg.inv(jac[i].T @ jac[i]) * cost[i] / dof
+        except np.linalg.LinAlgError:
+            pcov = np.full((n_params, n_params), np.inf)
+        models.append(DiscreteMarginModel(params[i], family, support, draws, key_weights, pcov,
+                                          int(iterations[i]), bool(converged[i])))
+    return models
+
+
+def fit_margin_model(ladders, **kwargs):
+    """fit_margin_models for a single event"""
+    return fit_margin_models([ladders], **kwargs)[0]
@@ -1,11 +1,27 @@
 import requests
-import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from line_apis import make_lines_dict
+import instrumentation
+from line_apis import loads_json, make_lines_dict, make_session
+from lines_book import as_lines_book
 
-def tab_multi_query(proposition_ids):
 
-    url = "https://api.beta.tab.com.au/v1/pricing-service/enquiry"
+TAB_ENQUIRY_URL = "https://api.beta.tab.com.au/v1/pricing-service/enquiry"
+
+
+def make_tab_session(pool_size=8, retries=3, backoff_factor=0.25):
+    """Enquiries only quote a price, so POSTs are safe to retry"""
+    return make_session(pool_size=pool_size, retries=retries, backoff_factor=backoff_factor, retry_methods=('GET', 'POST'))
+
+
+def tab_multi_query(proposition_ids, session=None, url=TAB_ENQUIRY_URL, timeout=None):
+    with instrumentation.timer('sgm_enquiry'):
+        return _tab_multi_query(proposition_ids, session, url, timeout)
+
+
+def _tab_multi_query(proposition_ids, session, url, timeout):
+
     propositions = []
     for id in proposition_ids:
         propositions.append({"type": "WIN", "propositionId": int(id)})
@@ -28,34 +44,96 @@ def tab_multi_query(proposition_ids):
         ]
     }
     headers = {}
-    response = requests.request("POST", url, headers=headers, json=payload)
-    response_dict = json.loads(response.text)
+    if session is None:
+        response = requests.request("POST", url, headers=headers, json=payload, timeout=timeout)
+    else:
+        response = session.request("POST", url, headers=headers, json=payload, timeout=timeout)
+    response.raise_for_status()
+    response_dict = loads_json(response.content)
     odds = float(response_dict['bets'][0]['legs'][0]['odds']['decimal'])
 
     return odds
 
 
-def tab_multi_margin_sweep(lines_dict):
-    line_levels = sorted(lines_dict.keys())
-    results = []
+def margin_sweep_pairs(lines, min_width=1):
+    """(lower, upper) line level pairs forming a margin band of at least min_width points"""
+    line_levels = as_lines_book(lines).line_levels.tolist()
+    pairs = []
     for i in range(len(line_levels)-1):
         for j in range(i+1, len(line_levels)):
             line_level_1 = line_levels[i]
             line_level_2 = line_levels[j]
-            # print(line_level_1, line_level_2)
-            if line_level_2 - line_level_1 < 1:
+            if line_level_2 - line_level_1 < min_width:
                 continue
-            line1 = lines_dict[line_level_1][1]
-            line2 = lines_dict[line_level_2][0]
+            pairs.append((line_level_1, line_level_2))
+    return pairs
+
+
+def _sweep_legs(book, pairs):
+    """(away leg at the lower level, home leg at the upper level) line dicts of every pair whose legs are both
+    quoted with an id. Pairs with a level missing from the book, a nan price or no id (-1 or None) are skipped."""
+    legs = []
+    for line_level_1, line_level_2 in pairs:
+        try:
+            line1 = book.line(book.index(line_level_1), home_side=False)
+            line2 = book.line(book.index(line_level_2), home_side=True)
+        except KeyError:
+            continue
+        if any(np.isnan(line['price']) or line['id'] in (-1, None) for line in (line1, line2)):
+            continue
+        legs.append((line1, line2))
+    return legs
+
+
+def tab_multi_margin_sweep_stream(lines, pairs=None, max_workers=8, session=None, url=TAB_ENQUIRY_URL, timeout=5):
+    """Queries SGM prices for every sweep pair concurrently, yielding each result as its enquiry finishes.
+    At most max_workers enquiries are in flight, sharing one pooled keep-alive session, which is created
+    and closed here if session is None. Pairs with a leg that isn't quoted are never enquired.
+    Closing the generator early cancels enquiries that have not started.
+    lines is a LinesBook or a make_lines_dict dict."""
+    if session is None:
+        with make_tab_session(pool_size=max_workers) as session:
+            yield from tab_multi_margin_sweep_stream(lines, pairs, max_workers, session, url, timeout)
+        return
+    book = as_lines_book(lines)
+    if pairs is None:
+        pairs = margin_sweep_pairs(book)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {}
+        for line1, line2 in _sweep_legs(book, pairs):
             # if (line1['market_type'] == line2['market_type']):
             #     continue    # TAB doesn't allow multiple legs from same market group
+            future = executor.submit(tab_multi_query, [line1['id'], line2['id']], session=session, url=url, timeout=timeout)
+            futures[future] = (line1, line2)
+
+        for future in as_completed(futures):
+            line1, line2 = futures[future]
             try:
-                odds = tab_multi_query([line1['id'], line2['id']])
-            except:
+                odds = future.result()
+            except (requests.RequestException, ValueError, KeyError, IndexError, TypeError):
+                # already counted in errors_total{stage="sgm_enquiry"} when instrumentation is enabled
                 continue
-            results.append({
+            yield {
                 'home_line': line2,
                 'away_line': line1,
                 'price': odds,
-            })
-    return results
+            }
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def sweep_price_matrix(lines, results):
+    """(n, n) matrix of quoted SGM prices from sweep results, indexed like tools.opposing_lines_margin_matrix
+    ([lower level index, upper level index]), nan where a pair has no quote"""
+    book = as_lines_book(lines)
+    prices = np.full((len(book), len(book)), np.nan)
+    for result in results:
+        prices[book.index(result['away_line']['home_line']), book.index(result['home_line']['home_line'])] = result['price']
+    return prices
+
+
+def tab_multi_margin_sweep(lines, **kwargs):
+    """Collects tab_multi_margin_sweep_stream, results are in completion order"""
+    return list(tab_multi_margin_sweep_stream(lines, **kwargs))
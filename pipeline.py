@@ -0,0 +1,179 @@
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+import instrumentation
+import line_apis
+from lines_book import LinesBook
+from repricing import RepricingCache, changed_line_levels
+
+
+DEFAULT_CADENCE = {
+    'tab': 2.0,
+    'pointsbet': 2.0,
+    'neds': 2.0,
+}
+
+DEFAULT_RATE_LIMITS = {
+    'tab': (5.0, 10),
+    'pointsbet': (5.0, 10),
+    'neds': (5.0, 10),
+}
+
+
+class TokenBucket:
+    """rate requests per second on average, with bursts of up to burst requests"""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def next_available(self, now):
+        self._refill(now)
+        return now + max(0, 1 - self.tokens) / self.rate
+
+
+class PollingScheduler:
+    """Polls every bookmaker for every event on a per-bookmaker cadence, within per-bookmaker rate limits,
+    and streams only the lines that changed.
+
+    events maps an event key to {bookmaker: bookmaker event id}, as for fetcher.LineFetcher.
+    cadence maps bookmaker to seconds between polls of the same event, rate_limits maps bookmaker to
+    (requests per second, burst). Requests are conditional on the previous response's ETag/Last-Modified,
+    so an unchanged market costs a 304 and no parsing. clock and sleep can be replaced together, e.g. by a
+    simulated clock in tests.
+    """
+
+    def __init__(self, events, cadence=None, rate_limits=None, max_workers=16, pool_size=8, timeout=5,
+                 get_lines=line_apis.get_lines_conditional, clock=time.monotonic, sleep=time.sleep):
+        self.events = dict(events)
+        self.cadence = dict(DEFAULT_CADENCE if cadence is None else cadence)
+        self.clock = clock
+        self.sleep = sleep
+        self.get_lines = get_lines
+        self.timeout = timeout
+        now = clock()
+        rate_limits = DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits
+        self.buckets = {book: TokenBucket(*rate_limits[book], now) for book in rate_limits}
+        self.sessions = {book: line_apis.make_session(pool_size=pool_size) for book in self.cadence}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.validators = {}
+        self.books = {}
+        self.errors = {}
+        self.queue = []
+        for event_key, event in self.events.items():
+            for book, event_id in event.items():
+                if book in self.cadence and event_id is not None:
+                    heapq.heappush(self.queue, (now, event_key, book))
+
+    def _poll(self, event_key, book):
+        event_id = self.events[event_key][book]
+        return self.get_lines(book, event_id, validators=self.validators.get((event_key, book)),
+                              session=self.sessions[book], timeout=self.timeout)
+
+    def _delta(self, event_key, book, teams, lines):
+        """Changed lines of a fresh ladder, None if nothing moved"""
+        new_book = LinesBook.from_lines(lines)
+        old_book = self.books.get((event_key, book))
+        self.books[(event_key, book)] = new_book
+        changed_levels = changed_line_levels(old_book, new_book)
+        if len(changed_levels) == 0:
+            return None
+        present = np.isin(changed_levels, new_book.line_levels)
+        return {
+            'event': event_key,
+            'book': book,
+            'timestamp': time.time(),
+            'teams': tuple(teams),
+            'lines': new_book,
+            'changed': new_book.take(np.searchsorted(new_book.line_levels, changed_levels[present])),
+            'removed_levels': changed_levels[~present],
+        }
+
+    def stream(self, stop=None):
+        """Yields a delta dict each time a poll finds moved lines:
+            'event', 'book', 'timestamp', 'teams'
+            'lines': the full new LinesBook
+            'changed': LinesBook of only the added or repriced levels
+            'removed_levels': levels no longer quoted
+        Runs until stop() returns True, or forever if stop is None."""
+        in_flight = {}
+        try:
+            while stop is None or not stop():
+                now = self.clock()
+                while self.queue and self.queue[0][0] <= now:
+                    due, event_key, book = heapq.heappop(self.queue)
+                    bucket = self.buckets.get(book)
+                    if bucket is not None and not bucket.take(now):
+                        heapq.heappush(self.queue, (bucket.next_available(now), event_key, book))
+                        continue
+                    future = self.executor.submit(self._poll, event_key, book)
+                    in_flight[future] = (event_key, book, now)
+
+                wait_for = max(0, self.queue[0][0] - self.clock()) if self.queue else None
+                if not in_flight:
+                    if wait_for is None:
+                        return
+                    self.sleep(wait_for)
+                    continue
+                done, _ = wait(in_flight, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    event_key, book, submitted = in_flight.pop(future)
+                    done_at = self.clock()
+                    heapq.heappush(self.queue, (done_at + self.cadence[book], event_key, book))
+                    instrumentation.observe('poll_seconds', done_at - submitted, book=book)
+                    try:
+                        teams, lines, validators = future.result()
+                    except Exception as e:
+                        self.errors[(event_key, book)] = e
+                        instrumentation.record_error('poll', e, book=book)
+                        continue
+                    self.validators[(event_key, book)] = validators
+                    if lines is None:
+                        continue
+                    delta = self._delta(event_key, book, teams, lines)
+                    if delta is not None:
+                        yield delta
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for session in self.sessions.values():
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def reprice_stream(deltas, cache=None):
+    """Fit and sweep EV stage over a delta stream. Each delta's changed and removed levels are applied to the
+    cached ladder of its (event, book), which is refitted, and only the sweep pairs with a changed leg are
+    repriced. A ladder the cache doesn't have (first seen or evicted) is applied in full from delta['lines'].
+    Yields the delta merged with the RepricingCache.apply_delta result."""
+    cache = RepricingCache() if cache is None else cache
+    for delta in deltas:
+        if cache.has_ladder(delta['event'], delta['book']):
+            result = cache.apply_delta(delta['event'], delta['book'], delta['changed'], delta['removed_levels'])
+        else:
+            result = cache.update(delta['event'], delta['book'], delta['lines'])
+        yield {**delta, **result}
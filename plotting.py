@@ -0,0 +1,109 @@
+import numpy as np
+from scipy import special
+from matplotlib.collections import LineCollection
+
+from lines_book import as_lines_book
+from tools import line_transform_array, normal_cdf_curve
+
+
+def plot_lines(ax, lines, plot_midpoint=True, color=None, label=None):
+    """lines is a LinesBook or a make_lines_dict dict.
+    Draws one LineCollection of the bound ranges and one scatter of the bound ticks (plus one of the
+    midpoints) for the whole ladder, and returns them as {'ranges', 'bounds', 'midpoints'} so they can be
+    updated in place with update_lines."""
+    ranges, bounds, midpoints = _lines_plot_data(lines)
+    artists = {
+        'ranges': ax.add_collection(LineCollection(ranges, colors=color, linewidths=2, linestyles='--', label=label)),
+        'bounds': ax.scatter(bounds[:, 0], bounds[:, 1], color=color, marker='_', s=120, linewidth=2),
+        'midpoints': None,
+    }
+    if plot_midpoint:
+        artists['midpoints'] = ax.scatter(midpoints[:, 0], midpoints[:, 1], color=color, marker='_', s=300, linewidth=2)
+    ax.autoscale_view()
+    return artists
+
+
+def _lines_plot_data(lines):
+    """(n, 2, 2) range segments, (2n, 2) bound points and (n, 2) midpoints of a ladder on the shifted axis"""
+    book = as_lines_book(lines).complete()
+    x_values = line_transform_array(book.line_levels)
+    upperbound_probs = book.upperbound_probs
+    lowerbound_probs = book.lowerbound_probs
+    midpoint_probs = (upperbound_probs + lowerbound_probs) / 2
+    ranges = np.stack([np.column_stack([x_values, lowerbound_probs]), np.column_stack([x_values, upperbound_probs])], axis=1)
+    bounds = np.column_stack([np.concatenate([x_values, x_values]), np.concatenate([upperbound_probs, lowerbound_probs])])
+    return ranges, bounds, np.column_stack([x_values, midpoint_probs])
+
+
+def update_lines(artists, lines):
+    """Moves plot_lines artists to a new ladder without creating new ones"""
+    ranges, bounds, midpoints = _lines_plot_data(lines)
+    artists['ranges'].set_segments(ranges)
+    artists['bounds'].set_offsets(bounds)
+    if artists['midpoints'] is not None:
+        artists['midpoints'].set_offsets(midpoints)
+
+
+def plot_normal_cdf(ax, model, xrange=None, plot_cov=False, cov_std_devs=2, num_points=None, color=None, label=None):
+    """Returns the cdf's Line2D (and the covariance band's PolyCollection when plot_cov) as a list"""
+    if xrange is None:
+        xrange = [-100, 100]
+    x_data, y_data = normal_cdf_curve(model, xrange, num_points)
+    artists = ax.plot(x_data, y_data, color=color, label=label)
+    if plot_cov:
+        popt = model['popt']
+        pcov = model['pcov']
+        perr = np.sqrt(np.diag(pcov))
+        (mu_low, sigma_low), (mu_high, sigma_high) = popt - cov_std_devs*perr, popt + cov_std_devs*perr
+        artists.append(ax.fill_between(x_data, special.ndtr((x_data - mu_low) / sigma_low), special.ndtr((x_data - mu_high) / sigma_high), color='gray', alpha=0.2))
+    return artists
+
+
+class Ruler:
+    def __init__(self, ax):
+        self.ax = ax
+        self.line_v = None
+        self.line_h = None
+        self.text_v = None
+        self.text_h = None
+        self.points = []
+        self.cid_press = ax.figure.canvas.mpl_connect('button_press_event', self.on_press)
+
+    def on_press(self, event):
+        if event.inaxes == self.ax:
+            rounded_x = round(event.xdata*2)/2
+            self.points.append((rounded_x, event.ydata))
+            if len(self.points) == 2:
+                self.draw_ruler()
+                self.points = []
+
+    def draw_ruler(self):
+        x1, y1 = self.points[0]
+        x2, y2 = self.points[1]
+
+        if self.line_v:
+            self.line_v.remove()
+        if self.line_h:
+            self.line_h.remove()
+        if self.text_v:
+            self.text_v.remove()
+        if self.text_h:
+            self.text_h.remove()
+
+        self.line_v, = self.ax.plot([x1, x1], [y1, y2], color='black', linestyle='--', linewidth=2)
+        self.line_h, = self.ax.plot([x1, x2], [y2, y2], color='black', linestyle='--', linewidth=2)
+
+        distance_v = abs(x2 - x1)
+        distance_h = abs(y2 - y1)
+
+        # Calculate text position for vertical distance
+        text_v_x = (x1 + x2) / 2
+        text_v_y = y2 + 0.03 * (self.ax.get_ylim()[1] - self.ax.get_ylim()[0])
+        self.text_v = self.ax.text(text_v_x, text_v_y, f'dx: {distance_v:.1f}', color='black', ha='center', va='center')
+
+        # Calculate text position for horizontal distance
+        text_h_x = x1 - 0.05 * (self.ax.get_xlim()[1] - self.ax.get_xlim()[0])
+        text_h_y = (y1 + y2) / 2
+        self.text_h = self.ax.text(text_h_x, text_h_y, f'prob: {distance_h:.3f}\nodds: {1/distance_h:.2f}', color='black', ha='center', va='center')
+
+        self.ax.figure.canvas.draw_idle()
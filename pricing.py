@@ -0,0 +1,93 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+import numpy as np
+from scipy import special
+
+
+class MarginPricer(ABC):
+    """Spread, band and push pricing from P(D <= d) at integer margins, provided by subclasses as margin_cdf.
+
+    D is the handicap the home side needs: a home bet at home_line L wins when D < L and pushes when
+    D == L. Every method takes arrays and prices them in one go.
+    """
+
+    @abstractmethod
+    def margin_cdf(self, d):
+        """P(D <= d) for integer d"""
+
+    def margin_probs(self, d):
+        """P(D == d) for integer d"""
+        d = np.asarray(d, dtype=np.int64)
+        return self.margin_cdf(d) - self.margin_cdf(d - 1)
+
+    def spread_probs(self, home_lines):
+        """(win, push, lose) probabilities of home bets at home_lines, half or whole points"""
+        home_lines = np.asarray(home_lines, dtype=float)
+        # wins when D <= ceil(L) - 1, pushes when D == L, which is empty unless L is whole
+        win = self.margin_cdf(np.ceil(home_lines) - 1)
+        push = self.margin_cdf(np.floor(home_lines)) - win
+        return win, push, 1 - win - push
+
+    def fair_odds(self, home_lines, home_side=True):
+        """No-vig decimal odds of spread bets, with pushes refunded"""
+        win, push, lose = self.spread_probs(home_lines)
+        return (1 - push) / (win if home_side else lose)
+
+    def band_probs(self, lower_lines, upper_lines):
+        """(win, push) probabilities of the SGM of the away leg at lower_lines and the home leg at upper_lines.
+        Both legs win when lower < D < upper; push is the probability that one leg pushes and the other wins."""
+        lower_lines = np.asarray(lower_lines, dtype=float)
+        upper_lines = np.asarray(upper_lines, dtype=float)
+        upper_win = self.margin_cdf(np.ceil(upper_lines) - 1)
+        upper_push = self.margin_cdf(np.floor(upper_lines)) - upper_win
+        lower_lose = self.margin_cdf(np.floor(lower_lines))
+        lower_push = lower_lose - self.margin_cdf(np.ceil(lower_lines) - 1)
+        return upper_win - lower_lose, lower_push + upper_push
+
+
+def normal_margin_cdf(d, mu, sigma):
+    """P(D <= d) for integer d under fitted normal models on the shifted axis of tools.line_transfrom,
+    broadcasting d against arrays of mu and sigma"""
+    d = np.asarray(d, dtype=np.int64)
+    return special.ndtr((d + (d < 0) - mu) / sigma)
+
+
+class NormalPricer(MarginPricer):
+    """Batch spread pricing off a fitted fit_normal_cdf model, with special.ndtr instead of stats.norm.
+
+    The model lives on the shifted axis of tools.line_transfrom, where the integer D = d covers
+    (d - 1, d] for d > 0 and (d, d + 1] for d < 0, so P(D <= d) is the fitted cdf at d for d >= 0 and at
+    d + 1 for d < 0, and D == 0 has no mass. Those cdf values at integers are precomputed into a table
+    over [-table_range, table_range], so every half or whole point line, band and push price is a lookup.
+    """
+
+    def __init__(self, mu, sigma, table_range=100):
+        self.mu = mu
+        self.sigma = sigma
+        self.table_range = table_range
+        self.cdf_table = special.ndtr((np.arange(-table_range, table_range + 1) - mu) / sigma)
+
+    def cdf(self, x):
+        """Fitted cdf on the shifted axis"""
+        return special.ndtr((np.asarray(x, dtype=float) - self.mu) / self.sigma)
+
+    def margin_cdf(self, d):
+        """P(D <= d) for integer d"""
+        d = np.asarray(d, dtype=np.int64)
+        edge = d + (d < 0)
+        index = edge + self.table_range
+        if index.min(initial=0) >= 0 and index.max(initial=0) < len(self.cdf_table):
+            return self.cdf_table[index]
+        in_table = (index >= 0) & (index < len(self.cdf_table))
+        return np.where(in_table, self.cdf_table[np.clip(index, 0, len(self.cdf_table) - 1)], self.cdf(edge))
+
+
+@lru_cache(maxsize=1024)
+def _pricer(mu, sigma, table_range):
+    return NormalPricer(mu, sigma, table_range)
+
+
+def pricer(model, table_range=100):
+    """NormalPricer for a fit_normal_cdf model, memoized per (mu, sigma)"""
+    return _pricer(float(model['mu']), float(model['sigma']), table_range)
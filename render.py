@@ -0,0 +1,165 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+
+import plotting
+import tools
+from lines_book import as_lines_book
+
+
+BOOK_STYLES = {
+    'pointsbet': ('red', 'PointsBet'),
+    'neds': ('orange', 'Neds'),
+    'tab': ('green', 'TAB'),
+}
+
+
+def _book_style(book, k):
+    color, label = BOOK_STYLES.get(book, (f'C{k}', book))
+    return color, label
+
+
+def _shifted_line_label(x, pos):
+    """Tick labels of the shifted axis in the original line values, as distribution.main draws them"""
+    if x > 0:
+        return '{:.1f}'.format(x + 0.5)
+    elif x < 0:
+        return '{:.1f}'.format(x - 0.5)
+    else:
+        return '{:.1f}'.format(x)
+
+
+def style_axes(ax, teams=None, legend=True):
+    """Ticks, labels, title and grid of the line CDF chart, and the legend if legend and there are labelled artists"""
+    ax.xaxis.set_major_formatter(FuncFormatter(_shifted_line_label))
+    current_xlim = ax.get_xlim()
+    min_tick = np.floor(current_xlim[0] / 1.5) * 1.5 - 0.5
+    max_tick = np.ceil(current_xlim[1] / 1.5) * 1.5 + 0.5
+    ax.set_xticks(np.arange(min_tick, max_tick + 0.1, 1))
+    ax.set_yticks(np.arange(0, 1+0.01, 0.05))
+    ax.set_xlabel('Home Side Handicap')
+    ax.set_ylabel('Probability')
+    if teams is not None:
+        ax.set_title(f'Handicap Line CDF: {teams[0]} (Home) vs {teams[1]} (Away)')
+    ax.minorticks_on()
+    if legend and ax.get_legend_handles_labels()[0]:
+        ax.legend(loc='upper left')
+    ax.grid(True)
+
+
+def draw_event(ax, books, models=None, teams=None):
+    """Draws every bookmaker's ladder and fitted cdf on ax, fitting the ones models doesn't have.
+    books maps bookmaker to a LinesBook, lines list or make_lines_dict dict."""
+    models = {} if models is None else models
+    books = {book: as_lines_book(lines) for book, lines in books.items()}
+    for k, (book, lines_book) in enumerate(books.items()):
+        color, _ = _book_style(book, k)
+        plotting.plot_lines(ax, lines_book, color=color)
+    # the ticks style_axes sets can widen the x limits, so the curves are drawn over the final ones
+    style_axes(ax, teams)
+    ax.set_autoscale_on(False)
+    for k, (book, lines_book) in enumerate(books.items()):
+        color, label = _book_style(book, k)
+        model = models.get(book)
+        if model is None and len(lines_book.complete()) >= 2:
+            model = tools.fit_normal_cdf(lines_book)
+        if model is not None:
+            plotting.plot_normal_cdf(ax, model, xrange=ax.get_xlim(), color=color, label=label)
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend(loc='upper left')
+
+
+def render_event(event, path, dpi=100, figsize=(12, 8)):
+    """Renders one event to path, PNG or SVG by its extension, on an Agg canvas that never touches pyplot,
+    so it runs on servers with no display and in worker processes.
+    event is a dict with 'books' ({bookmaker: lines}), and optionally 'models' ({bookmaker: fit_normal_cdf
+    model}) and 'teams' ((home, away)). Returns path."""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    draw_event(ax, event['books'], event.get('models'), event.get('teams'))
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def _render_job(job):
+    event, path, kwargs = job
+    return render_event(event, path, **kwargs)
+
+
+def render_events(events, paths, processes=None, **kwargs):
+    """render_event for many events, in a pool of processes worker processes (all cores if None,
+    in this process if 1). Returns the paths in order."""
+    jobs = [(event, path, kwargs) for event, path in zip(events, paths)]
+    if processes == 1 or len(jobs) <= 1:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as executor:
+        return list(executor.map(_render_job, jobs, chunksize=max(1, len(jobs) // (4*(processes or os.cpu_count())))))
+
+
+class LiveChart:
+    """Line CDF chart that moves its artists to each new tick instead of clearing and redrawing the axes.
+
+    Each bookmaker gets its plot_lines collections and cdf line on its first update; later updates only
+    set their data and request a redraw. The axes are only restyled when the ladders' extent moves the x
+    limits, and the legend only rebuilt when a bookmaker's curve is added. Works with pyplot (interactive) or any Figure, e.g. an Agg one
+    saved after every update.
+    """
+
+    def __init__(self, ax, teams=None, fit=True, xrange=(-100, 100)):
+        self.ax = ax
+        self.teams = teams
+        self.fit = fit
+        self.xrange = xrange
+        self.artists = {}
+        self.curves = {}
+        self.extent = {}
+        # x limits _rescale last set, style_axes widens the actual ones to whole ticks
+        self.xlim = None
+
+    def update(self, book, lines, model=None):
+        lines_book = as_lines_book(lines).complete()
+        if model is None and self.fit and len(lines_book) >= 2:
+            model = tools.fit_normal_cdf(lines_book)
+        color, label = _book_style(book, len(self.artists))
+        if book not in self.artists:
+            self.artists[book] = plotting.plot_lines(self.ax, lines_book, color=color)
+        else:
+            plotting.update_lines(self.artists[book], lines_book)
+        if model is not None:
+            x_data, y_data = tools.normal_cdf_curve(model, self.xrange)
+            if book not in self.curves:
+                self.curves[book], = self.ax.plot(x_data, y_data, color=color, label=label)
+                self.ax.legend(loc='upper left')
+            else:
+                self.curves[book].set_data(x_data, y_data)
+        if len(lines_book):
+            x_values = tools.line_transform_array(lines_book.line_levels)
+            self.extent[book] = (x_values.min(), x_values.max())
+        self._rescale()
+        self.ax.figure.canvas.draw_idle()
+
+    def update_delta(self, delta):
+        """update from a pipeline.PollingScheduler delta"""
+        if self.teams is None:
+            self.teams = delta['teams']
+            style_axes(self.ax, self.teams, legend=False)
+        self.update(delta['book'], delta['lines'])
+
+    def _rescale(self):
+        if not self.extent:
+            return
+        low = min(low for low, _ in self.extent.values())
+        high = max(high for _, high in self.extent.values())
+        margin = max(1.0, 0.05*(high - low))
+        xlim = (low - margin, high + margin)
+        if xlim != self.xlim:
+            self.xlim = xlim
+            self.ax.set_xlim(*xlim)
+            self.ax.set_ylim(-0.05, 1.05)
+            style_axes(self.ax, self.teams, legend=False)
@@ -0,0 +1,181 @@
+from collections import OrderedDict
+
+import numpy as np
+
+import tools
+from lines_book import LinesBook, as_lines_book
+
+
+def changed_line_levels(old_book, new_book):
+    """Line levels added, removed or repriced on either side between two books"""
+    if old_book is None:
+        return new_book.line_levels.copy()
+    all_levels = np.union1d(old_book.line_levels, new_book.line_levels)
+    old_prices = _prices_at(old_book, all_levels)
+    new_prices = _prices_at(new_book, all_levels)
+    same = (old_prices == new_prices) | (np.isnan(old_prices) & np.isnan(new_prices))
+    return all_levels[~same.all(axis=1)]
+
+
+def _prices_at(book, line_levels):
+    """(len(line_levels), 2) home/away prices, nan where the book has no quote"""
+    prices = np.full((len(line_levels), 2), np.nan)
+    index = np.searchsorted(book.line_levels, line_levels)
+    found = index < len(book.line_levels)
+    found[found] = book.line_levels[index[found]] == line_levels[found]
+    prices[found, 0] = book.home_prices[index[found]]
+    prices[found, 1] = book.away_prices[index[found]]
+    return prices
+
+
+def apply_changes(book, changed, removed_levels):
+    """book with the levels of the changed LinesBook replaced or added and removed_levels dropped, as
+    pipeline.PollingScheduler deltas describe a new ladder. book may be None for the first delta."""
+    if book is None:
+        return changed
+    dropped = np.union1d(changed.line_levels, removed_levels)
+    kept = book.take(~np.isin(book.line_levels, dropped))
+    columns = [np.concatenate([getattr(kept, name), getattr(changed, name)]) for name in LinesBook.__slots__]
+    return LinesBook(*columns)
+
+
+def _pairs_touching(line_levels, touched_levels, min_width=1):
+    """Sweep pairs (lower, upper) of line_levels with at least one leg in touched_levels"""
+    present = np.intersect1d(touched_levels, line_levels)
+    pairs = set()
+    for level in present.tolist():
+        for upper in line_levels[np.searchsorted(line_levels, level + min_width):].tolist():
+            pairs.add((level, upper))
+        for lower in line_levels[:np.searchsorted(line_levels, level - min_width, side='right')].tolist():
+            pairs.add((lower, level))
+    return sorted(pairs)
+
+
+def margin_theo(book, lower, upper):
+    """(lb, theo, ub) odds of the band between the away leg at lower and the home leg at upper, as in
+    distribution.main, or None when the legs don't give a positive theo probability"""
+    i = book.index(lower)
+    j = book.index(upper)
+    leg_prices = [float(book.home_prices[j]), float(book.away_prices[j]), float(book.away_prices[i]), float(book.home_prices[i])]
+    if not all(price > 1 for price in leg_prices):
+        return None
+    try:
+        odds = tools.opposing_lines_margin(*leg_prices)
+    except ZeroDivisionError:
+        return None
+    if not odds[1] > 0:
+        return None
+    return odds
+
+
+class RepricingCache:
+    """Per-event, per-bookmaker fit and sweep pricing state that is only recomputed where prices moved.
+
+    update() diffs a new ladder against the last one for the same (event, book), refits the model only
+    when something changed (warm started from the last fit), and recomputes margin theos only for sweep
+    pairs with a changed leg. EVs against quoted SGM prices are recomputed for those pairs and for pairs
+    whose SGM price changed. The least recently updated events are evicted beyond max_events.
+    """
+
+    def __init__(self, max_events=256, min_width=1):
+        self.max_events = max_events
+        self.min_width = min_width
+        self.events = OrderedDict()
+        self.fitter = tools.NormalCdfFitter()
+
+    def _state(self, event, book_name):
+        if event in self.events:
+            self.events.move_to_end(event)
+        else:
+            self.events[event] = {}
+            while len(self.events) > self.max_events:
+                evicted_event, evicted_books = self.events.popitem(last=False)
+                for evicted_book in evicted_books:
+                    self.fitter.forget((evicted_event, evicted_book))
+        return self.events[event].setdefault(book_name, {
+            'book': None,
+            'model': None,
+            'theos': {},
+            'sgm_prices': {},
+            'ev': {},
+        })
+
+    def update(self, event, book_name, lines):
+        """Applies a new ladder, returns a dict with
+            'changed_levels': line levels that moved
+            'refit': whether the model was refitted
+            'model': the current fit_normal_cdf model
+            'repriced_pairs': sweep pairs whose theo was recomputed
+            'ev': pair -> EV for every pair whose EV was recomputed
+        Quoted SGM prices and EVs of pairs with a moved or removed leg are dropped, to be requoted.
+        """
+        state = self._state(event, book_name)
+        book = as_lines_book(lines)
+        return self._apply(state, (event, book_name), book, changed_line_levels(state['book'], book))
+
+    def apply_delta(self, event, book_name, changed, removed_levels):
+        """update from only the changed levels of a ladder (a LinesBook) and the levels no longer quoted, as in
+        a pipeline.PollingScheduler delta, without diffing the whole ladder again"""
+        state = self._state(event, book_name)
+        book = apply_changes(state['book'], changed, removed_levels)
+        return self._apply(state, (event, book_name), book, np.union1d(changed.line_levels, removed_levels))
+
+    def _apply(self, state, key, book, changed):
+        state['book'] = book
+        refit = len(changed) > 0 or state['model'] is None
+        if refit:
+            state['model'] = self.fitter.fit(key, book) if len(book.complete()) >= 2 else None
+
+        theos = state['theos']
+        changed_set = set(changed.tolist())
+        # quotes and EVs of pairs with a moved or removed leg are stale along with their theo
+        for entries in (theos, state['sgm_prices'], state['ev']):
+            for pair in [pair for pair in entries if pair[0] in changed_set or pair[1] in changed_set]:
+                del entries[pair]
+        repriced_pairs = _pairs_touching(book.line_levels, changed, self.min_width)
+        for pair in repriced_pairs:
+            theos[pair] = margin_theo(book, *pair)
+
+        ev = self._reprice_ev(state, repriced_pairs)
+        return {
+            'changed_levels': changed,
+            'refit': refit,
+            'model': state['model'],
+            'repriced_pairs': repriced_pairs,
+            'ev': ev,
+        }
+
+    def update_sgm_prices(self, event, book_name, sgm_prices):
+        """Records quoted SGM prices ({(lower, upper): price}), returns pair -> EV for pairs whose price changed"""
+        state = self._state(event, book_name)
+        changed_pairs = [pair for pair, price in sgm_prices.items() if state['sgm_prices'].get(pair) != price]
+        state['sgm_prices'].update(sgm_prices)
+        return self._reprice_ev(state, changed_pairs)
+
+    def _reprice_ev(self, state, pairs):
+        ev = {}
+        for pair in pairs:
+            price = state['sgm_prices'].get(pair)
+            theo = state['theos'].get(pair)
+            if price is None or theo is None:
+                state['ev'].pop(pair, None)
+                continue
+            ev[pair] = state['ev'][pair] = price / theo[1] - 1
+        return ev
+
+    def has_ladder(self, event, book_name):
+        return self.events.get(event, {}).get(book_name, {}).get('book') is not None
+
+    def model(self, event, book_name):
+        return self.events[event][book_name]['model']
+
+    def theos(self, event, book_name):
+        return self.events[event][book_name]['theos']
+
+    def ev(self, event, book_name):
+        return self.events[event][book_name]['ev']
+
+    def finish(self, event):
+        """Drops a finished event"""
+        for book_name in self.events.pop(event, {}):
+            self.fitter.forget((event, book_name))
@@ -0,0 +1,105 @@
+import numpy as np
+
+import tools
+from lines_book import as_lines_book
+from pricing import pricer
+from multi_query_apis import TAB_ENQUIRY_URL, make_tab_session, tab_multi_margin_sweep_stream
+
+
+def model_band_probs(model, lower_levels, upper_levels):
+    """Fitted probability of the band between the away leg at each lower level and the home leg at the
+    matching upper level, i.e. both legs of the SGM winning"""
+    win, _ = pricer(model).band_probs(lower_levels, upper_levels)
+    return win
+
+
+def rank_sweep_pairs(lines, model, min_width=1):
+    """Scores every sweep pair by the EV it could have under the fitted model.
+
+    With (lb, theo, ub) the odds of opposing_lines_margin for the pair's legs:
+        best_ev = ub * model_prob - 1, the most the pair can return if the SGM is priced within the leg bounds
+        theo_ev = theo * model_prob - 1, its EV if the SGM were priced at the legs' no-vig theo
+    The upper bound is inf where the legs don't bound the SGM price, and a pair the model gives no chance
+    has best_ev -1 whatever its bound. Returns a list of dicts (pair, i, j, model_prob, odds_theo,
+    odds_upperbound, best_ev, theo_ev) sorted by best_ev, descending, ties by theo_ev. Pairs whose legs
+    don't give a positive theo probability are left out.
+    """
+    book = as_lines_book(lines)
+    line_levels = book.line_levels
+    _, odds_theo, odds_upperbound = tools.opposing_lines_margin_matrix(book, min_width)
+    i, j = np.nonzero(~np.ma.getmaskarray(odds_theo))
+    odds_theo = odds_theo.data[i, j]
+    odds_upperbound = odds_upperbound.filled(np.inf)[i, j]
+
+    model_probs = model_band_probs(model, line_levels[i], line_levels[j])
+    # an unbounded upper bound times a zero probability is nan, and such a pair can't return anything
+    best_ev = np.full(len(model_probs), -1.0)
+    possible = model_probs > 0
+    best_ev[possible] = odds_upperbound[possible]*model_probs[possible] - 1
+    theo_ev = odds_theo*model_probs - 1
+
+    order = np.lexsort((-theo_ev, -best_ev))
+    return [{
+        'pair': (float(line_levels[a]), float(line_levels[b])),
+        'i': int(a),
+        'j': int(b),
+        'model_prob': float(p),
+        'odds_theo': float(theo),
+        'odds_upperbound': float(ub),
+        'best_ev': float(ev_ub),
+        'theo_ev': float(ev_theo),
+    } for a, b, p, theo, ub, ev_ub, ev_theo in zip(i[order], j[order], model_probs[order], odds_theo[order],
+                                                   odds_upperbound[order], best_ev[order], theo_ev[order])]
+
+
+def planned_margin_sweep_stream(lines, model, min_ev=0.0, top_k=None, batch_size=16, min_width=1,
+                                price_ratio=1.0, max_workers=8, session=None, url=TAB_ENQUIRY_URL, timeout=5):
+    """Queries SGM prices only for pairs that could be +EV, most promising first, yielding results as they arrive.
+
+    Pairs come from rank_sweep_pairs, in best_ev order. A pair is never queried if even a quote at its upper
+    bound odds can't reach min_ev. Of the rest, a batch of batch_size is queried from those a quote of
+    price_ratio * their theo odds would take to min_ev, and top_k caps how many are queried in all. After
+    each batch price_ratio becomes the highest quote / theo ratio seen so far, so it can rise as well as
+    fall: pairs held back by a lower ratio are checked again and queried if they can now reach min_ev.
+    Each result is a tab_multi_margin_sweep_stream result plus 'model_prob', 'odds_theo', 'best_ev' and
+    'ev' (price * model_prob - 1). A session is created and closed here if none is passed.
+    """
+    if session is None:
+        with make_tab_session(pool_size=max_workers) as session:
+            yield from planned_margin_sweep_stream(lines, model, min_ev, top_k, batch_size, min_width, price_ratio,
+                                                   max_workers, session, url, timeout)
+        return
+    book = as_lines_book(lines)
+    # pairs not queried yet, in best_ev order, including those the current price_ratio holds back
+    pending = [candidate for candidate in rank_sweep_pairs(book, model, min_width) if candidate['best_ev'] >= min_ev]
+    remaining = len(pending) if top_k is None else top_k
+
+    observed_ratio = None
+    while remaining > 0:
+        batch = []
+        for candidate in pending:
+            if len(batch) == min(batch_size, remaining):
+                break
+            if price_ratio*candidate['odds_theo']*candidate['model_prob'] - 1 >= min_ev:
+                batch.append(candidate)
+        if not batch:
+            break
+        by_pair = {candidate['pair']: candidate for candidate in batch}
+        pending = [candidate for candidate in pending if candidate['pair'] not in by_pair]
+        remaining -= len(batch)
+
+        for result in tab_multi_margin_sweep_stream(book, pairs=list(by_pair), max_workers=max_workers,
+                                                    session=session, url=url, timeout=timeout):
+            candidate = by_pair[(result['away_line']['home_line'], result['home_line']['home_line'])]
+            ratio = result['price'] / candidate['odds_theo']
+            observed_ratio = ratio if observed_ratio is None else max(observed_ratio, ratio)
+            yield {
+                **result,
+                'model_prob': candidate['model_prob'],
+                'odds_theo': candidate['odds_theo'],
+                'best_ev': candidate['best_ev'],
+                'ev': result['price']*candidate['model_prob'] - 1,
+            }
+
+        if observed_ratio is not None:
+            price_ratio = observed_ratio
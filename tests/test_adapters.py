@@ -0,0 +1,94 @@
+import json
+
+import requests
+
+import adapters
+from benchmarks.replay import BOOKMAKER_HOSTS, ReplayAdapter
+
+
+# trimmed tab-info-service competition response, only the fields parse_discovery reads
+TAB_COMPETITION = {
+    'name': 'NBA',
+    'matches': [
+        {'name': 'Indiana v Golden State', 'startTime': '2026-10-20T23:10:00.000Z'},
+        {'name': 'LA Clippers v New Orleans', 'startTime': '2026-10-21T02:40:00.000Z'},
+    ],
+}
+
+
+def tab_session(payload):
+    session = requests.session()
+    adapter = ReplayAdapter(json.dumps(payload).encode())
+    session.mount(BOOKMAKER_HOSTS['tab'], adapter)
+    return session, adapter
+
+
+def test_tab_discovery():
+    session, replay = tab_session(TAB_COMPETITION)
+    events = adapters.TabAdapter().discover('NBA', session=session)
+    assert replay.request_count == 1
+    assert [(event['home'], event['away']) for event in events] == [('Indiana', 'Golden State'),
+                                                                    ('LA Clippers', 'New Orleans')]
+    assert events[0]['event_id'] == 'Basketball/NBA/Indiana%20v%20Golden%20State'
+    assert events[0]['start_time'] == 1792537800.0
+
+
+def test_competitions_are_per_adapter():
+    adapter = adapters.TabAdapter({'WNBA': ('Basketball', 'WNBA')})
+    assert adapter.competitions == {'WNBA': ('Basketball', 'WNBA')}
+    assert 'WNBA' not in adapters.ADAPTERS['tab'].competitions
+
+
+def test_lines_only_books_are_reported_not_skipped():
+    session, _ = tab_session(TAB_COMPETITION)
+    events, errors = adapters.discover_events(['NBA'], books=['tab', 'pointsbet', 'neds'], sessions={'tab': session})
+    assert len(events) == 2
+    assert set(errors) == {('NBA', 'pointsbet'), ('NBA', 'neds')}
+    assert all(isinstance(e, NotImplementedError) for e in errors.values())
+
+
+def test_default_books_are_the_discovering_ones():
+    session, _ = tab_session(TAB_COMPETITION)
+    events, errors = adapters.discover_events(['NBA', 'Unknown'], sessions={'tab': session})
+    assert len(events) == 2
+    assert set(errors) == {('Unknown', 'tab')}
+    assert isinstance(errors[('Unknown', 'tab')], KeyError)
+
+
+def test_matcher_joins_hand_supplied_ids():
+    session, _ = tab_session(TAB_COMPETITION)
+    events, _ = adapters.discover_events(['NBA'], sessions={'tab': session})
+    matcher = adapters.EventMatcher()
+    matched = matcher.match(events)
+    event = matcher.add({'book': 'pointsbet', 'event_id': '1764984', 'competition': 'NBA', 'home': 'Indiana Pacers',
+                         'away': 'Golden State Warriors', 'start_time': matched[0]['start_time'] + 600})
+    assert event['ids'] == {'tab': matched[0]['ids']['tab'], 'pointsbet': '1764984'}
+
+
+def _book_event(book, event_id, start_time, home='Indiana', away='Golden State'):
+    return {'book': book, 'event_id': event_id, 'competition': 'NBA', 'home': home, 'away': away,
+            'start_time': start_time}
+
+
+def test_matcher_reindexes_an_event_once_its_start_is_known():
+    matcher = adapters.EventMatcher()
+    event = matcher.add(_book_event('tab', 'a', None))
+    matcher.add(_book_event('pointsbet', 'b', 1792537800.0))
+    assert event['start_time'] == 1792537800.0
+    assert matcher._by_start['NBA'] == [(1792537800.0, event['key'])]
+    # a week later the same teams are a different event
+    rematch = matcher.add(_book_event('neds', 'c', 1792537800.0 + 7*86400))
+    assert rematch is not event
+    assert event['ids'] == {'tab': 'a', 'pointsbet': 'b'}
+
+
+def test_matcher_keys_are_unique():
+    matcher = adapters.EventMatcher()
+    first = matcher.add(_book_event('tab', 'a', None))
+    second = matcher.add(_book_event('tab', 'b', None))
+    third = matcher.add(_book_event('tab', 'c', None))
+    assert [first['key'], second['key'], third['key']] == ['NBA:tbc:indiana v golden state',
+                                                           'NBA:tbc:indiana v golden state:2',
+                                                           'NBA:tbc:indiana v golden state:3']
+    assert [matcher.events[event['key']]['ids'] for event in (first, second, third)] == [{'tab': 'a'}, {'tab': 'b'},
+                                                                                         {'tab': 'c'}]
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import backtest
+from benchmarks.fixtures import home_cover_prob
+from line_store import LineStore
+from lines_book import LinesBook
+
+# 2024-05-01 00:00 UTC
+DAY = 1714521600.0
+
+
+def make_book(line_levels, overround=0.05):
+    home_probs = home_cover_prob(line_levels, mu=-4, sigma=6)
+    return LinesBook(line_levels, np.round(1 / (home_probs*(1 + overround)), 2),
+                     np.round(1 / ((1 - home_probs)*(1 + overround)), 2))
+
+
+def whole_point_book():
+    return make_book(np.arange(-8.0, 0.0))
+
+
+def sample(book, home_margin, pairs, odds):
+    """A load_samples sample betting the given (lower, upper) pairs at the given SGM odds"""
+    i = np.array([book.index(lower) for lower, _ in pairs])
+    j = np.array([book.index(upper) for _, upper in pairs])
+    return ('tab', book, home_margin, backtest.spread_outcomes(book.line_levels, home_margin), (i, j, np.array(odds)))
+
+
+# D = -home margin = -4: the first pair's band holds it, the second's away leg pushes, the third's home leg
+# pushes and the fourth's away leg loses
+PAIRS = [(-6.0, -3.0), (-4.0, -2.0), (-6.0, -4.0), (-3.0, -1.0)]
+ODDS = [3.0, 4.0, 5.0, 6.0]
+
+
+def scored(push):
+    book = whole_point_book()
+    results = backtest.score_samples([sample(book, 4, PAIRS, ODDS)], [{}], min_ev=-1.0, push=push)
+    return book, results[(0, 'tab')]
+
+
+def test_pushed_leg_reduces_the_pair_to_the_other_leg():
+    book, stats = scored('reduce')
+    home_at_minus_2 = book.home_prices[book.index(-2.0)]
+    away_at_minus_6 = book.away_prices[book.index(-6.0)]
+    assert stats['bets'] == 4
+    assert stats['realized_pnl'] == pytest.approx((3.0 - 1) + (home_at_minus_2 - 1) + (away_at_minus_6 - 1) - 1)
+
+
+def test_pushed_leg_can_void_the_pair():
+    _, stats = scored('void')
+    assert stats['bets'] == 4
+    assert stats['realized_pnl'] == pytest.approx((3.0 - 1) + 0 + 0 - 1)
+
+
+def test_unknown_push_rule():
+    with pytest.raises(ValueError):
+        scored('refund')
+
+
+def test_predicted_ev_counts_push_settlement():
+    book = whole_point_book()
+    results = {push: backtest.score_samples([sample(book, 4, PAIRS[1:2], ODDS[1:2])], [{}], min_ev=-1.0, push=push)
+               for push in backtest.PUSH_RULES}
+    reduce_stats, void_stats = results['reduce'][(0, 'tab')], results['void'][(0, 'tab')]
+    # the away leg at -4 pushes with positive probability, which is worth more reduced to the home leg at -2
+    # (at more than evens) than refunded
+    assert book.home_prices[book.index(-2.0)] > 1
+    assert reduce_stats['predicted_ev'] > void_stats['predicted_ev']
+
+
+def test_half_point_pairs_settle_win_or_lose(tmp_path):
+    with LineStore(str(tmp_path)) as store:
+        store.append('event', 'tab', make_book(np.arange(-8.5, 0.0)), DAY)
+    rows = backtest.run_backtest(str(tmp_path), {'event': 4}, min_ev=-1.0)
+    _, snapshot, _, _, (i, j, odds_theo) = backtest.load_samples(LineStore(str(tmp_path)), 'event', 4)[0]
+    d = -4
+    lower, upper = snapshot.line_levels[i], snapshot.line_levels[j]
+    assert len(rows) == 1 and rows[0]['fit_failures'] == 0
+    assert rows[0]['bets'] == len(i)
+    assert rows[0]['realized_ev'] == pytest.approx(np.where((lower < d) & (d < upper), odds_theo - 1, -1.0).mean())
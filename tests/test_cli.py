@@ -0,0 +1,32 @@
+import json
+
+import cli
+from benchmarks.fixtures import make_lines
+
+
+def _fetched(snapshot, monkeypatch):
+    monkeypatch.setattr(cli, '_fetch_snapshot', lambda args: snapshot)
+
+
+def test_fetch_writes_nothing_when_every_book_fails(tmp_path, monkeypatch, capsys):
+    _fetched({'event': {'tab': 'x'}, 'timestamp': 0, 'teams': None, 'lines': {}, 'latency': {},
+              'errors': {'tab': TimeoutError('read timed out')}}, monkeypatch)
+    output = tmp_path / 'snapshot.json'
+    assert cli.main(['fetch', '--tab', 'x', '-o', str(output)]) == 1
+    assert not output.exists()
+    stderr = capsys.readouterr().err
+    assert "tab fetch failed: TimeoutError('read timed out')" in stderr
+    assert 'no snapshot written' in stderr
+
+
+def test_fetch_reports_failed_books_and_writes_the_rest(tmp_path, monkeypatch, capsys):
+    teams, lines = make_lines(10)
+    _fetched({'event': {'tab': 'x', 'neds': 'y'}, 'timestamp': 0, 'teams': teams, 'lines': {'tab': lines},
+              'latency': {}, 'errors': {'neds': ConnectionError('refused')}}, monkeypatch)
+    output = tmp_path / 'snapshot.json'
+    assert cli.main(['fetch', '--tab', 'x', '--neds', 'y', '-o', str(output)]) == 0
+    with open(output) as f:
+        snapshot = json.load(f)
+    assert list(snapshot['lines']) == ['tab']
+    assert snapshot['errors'] == {'neds': "ConnectionError('refused')"}
+    assert "neds fetch failed: ConnectionError('refused')" in capsys.readouterr().err
@@ -0,0 +1,47 @@
+import numpy as np
+
+import consensus
+from benchmarks.fixtures import make_lines
+from lines_book import LinesBook
+
+
+def make_book(mu=-4, overround=0.05, first_id=1000, n_levels=20, whole=False):
+    lines = make_lines(n_levels, mu=mu, overround=overround, first_id=first_id)[1]
+    if whole:
+        lines = [{**line, 'home_line': line['home_line'] + 0.5} for line in lines]
+    return LinesBook.from_lines(lines)
+
+
+def arbs(events):
+    return [opportunity for opportunity in consensus.scan(events, kinds=('arb',))]
+
+
+def test_cross_book_arb_at_the_same_half_point_level():
+    tab, neds = make_book(first_id=1000), make_book(first_id=5000)
+    i = 10
+    neds.home_prices[i] = 3.5
+    found = arbs({'event': {'tab': tab, 'neds': neds}})
+    same_level = [arb for arb in found if arb['legs'][0]['home_line'] == arb['legs'][1]['home_line']]
+    assert same_level
+    arb = same_level[0]
+    assert arb['legs'][0]['home_line'] == tab.line_levels[i]
+    cost = 1/3.5 + 1/tab.away_prices[i]
+    assert arb['return'] == np.float64(1/cost - 1)
+
+
+def test_same_whole_level_is_not_an_arb():
+    tab, neds = make_book(first_id=1000, whole=True), make_book(first_id=5000, whole=True)
+    i = 10
+    assert tab.line_levels[i] % 1 == 0
+    neds.home_prices[i] = 3.5
+    found = arbs({'event': {'tab': tab, 'neds': neds}})
+    assert all(arb['legs'][0]['home_line'] > arb['legs'][1]['home_line'] for arb in found)
+    # boosted home leg still arbs against lower away legs, where the whole level can't refund both
+    assert any(arb['legs'][0]['home_line'] == tab.line_levels[i] for arb in found)
+
+
+def test_consensus_weights_favour_the_sharper_book():
+    sharp, soft = make_book(-4, 0.02, 1000, 30), make_book(-4, 0.08, 5000, 30)
+    model = consensus.consensus_model({'sharp': sharp, 'soft': soft})
+    assert model['weights']['sharp'] > model['weights']['soft']
+    assert abs(sum(model['weights'].values()) - 1) < 1e-9
@@ -0,0 +1,32 @@
+import pytest
+
+import instrumentation
+from fetcher import LineFetcher
+
+
+@pytest.fixture
+def metrics():
+    instrumentation.enable(reset=True)
+    yield instrumentation.METRICS
+    instrumentation.disable()
+    instrumentation.METRICS.reset()
+
+
+def get_lines(event_id, session=None, timeout=None):
+    return ('Home', 'Away'), [{'home_line': -1.5, 'home_side': True, 'price': 1.9, 'id': event_id}]
+
+
+def get_no_lines(event_id, session=None, timeout=None):
+    raise KeyError('markets')
+
+
+def test_fetch_snapshots_with_per_bookmaker_latency_and_errors(metrics):
+    with LineFetcher(bookmakers={'tab': get_lines, 'neds': get_no_lines}) as fetcher:
+        snapshots = fetcher.fetch([{'tab': 1, 'neds': 'a'}, {'tab': 2}, {'neds': 'b', 'tab': None}])
+    assert [snapshot['teams'] for snapshot in snapshots] == [('Home', 'Away'), ('Home', 'Away'), None]
+    assert snapshots[1]['lines']['tab'][0]['id'] == 2
+    assert set(snapshots[0]['latency']) == {'tab'}
+    assert isinstance(snapshots[2]['errors']['neds'], KeyError)
+    assert metrics.histograms[('fetch_seconds', (('book', 'tab'),))][2] == 2
+    assert ('fetch_seconds', (('book', 'neds'),)) not in metrics.histograms
+    assert metrics.counters[('errors_total', (('book', 'neds'), ('kind', 'schema'), ('stage', 'fetch')))] == 2
@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+import line_apis
+
+
+def sent_headers(monkeypatch, book, validators):
+    sent = []
+
+    def get(session, url, headers, timeout):
+        sent.append(headers)
+        return SimpleNamespace(status_code=304)
+
+    monkeypatch.setattr(line_apis, '_get', get)
+    line_apis.get_lines_conditional(book, 'event', validators=validators)
+    return {key.lower(): value for key, value in sent[0].items()}
+
+
+def test_first_neds_request_is_unconditional(monkeypatch):
+    headers = sent_headers(monkeypatch, 'neds', None)
+    assert 'if-modified-since' not in headers and 'if-none-match' not in headers
+    assert headers['origin'] == 'https://www.neds.com.au'
+
+
+def test_later_requests_carry_the_previous_validators(monkeypatch):
+    headers = sent_headers(monkeypatch, 'neds', {'etag': '"v2"', 'last_modified': 'Sat, 17 Oct 2026 09:00:00 GMT'})
+    assert headers['if-none-match'] == '"v2"'
+    assert headers['if-modified-since'] == 'Sat, 17 Oct 2026 09:00:00 GMT'
@@ -0,0 +1,125 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+
+from benchmarks.fixtures import make_lines
+from line_store import LineStore
+from lines_book import LinesBook
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 2024-05-01 00:00 UTC
+DAY = 1714521600.0
+
+
+def _books(n):
+    return [LinesBook.from_lines(make_lines(8 + k % 3, mu=-k, first_id=1000 + 100*k)[1]) for k in range(n)]
+
+
+def _assert_same(book, expected):
+    np.testing.assert_array_equal(book.line_levels, expected.line_levels)
+    np.testing.assert_allclose(book.home_prices, expected.home_prices.astype(np.float32))
+    np.testing.assert_allclose(book.away_prices, expected.away_prices.astype(np.float32))
+
+
+def test_round_trip(tmp_path):
+    books = _books(5)
+    books[1].home_prices[0] = np.nan
+    with LineStore(str(tmp_path)) as store:
+        for k, book in enumerate(books):
+            store.append('Home v Away', 'tab', book, DAY + 30*k)
+    store = LineStore(str(tmp_path))
+    assert store.events() == ['Home v Away']
+    assert store.books('Home v Away') == ['tab']
+    snapshots = list(store.snapshots('Home v Away', 'tab', columns=['line_levels', 'home_prices', 'away_prices',
+                                                                     'home_ids', 'away_ids']))
+    assert [timestamp for timestamp, _ in snapshots] == [DAY + 30*k for k in range(5)]
+    for (_, book), expected in zip(snapshots, books):
+        _assert_same(book, expected)
+        np.testing.assert_array_equal(book.home_ids, expected.home_ids)
+        np.testing.assert_array_equal(book.away_ids, expected.away_ids)
+
+
+def test_time_range_queries(tmp_path):
+    books = _books(6)
+    # three snapshots a day over two days
+    timestamps = [DAY + 3600*k for k in range(3)] + [DAY + 86400 + 3600*k for k in range(3)]
+    with LineStore(str(tmp_path)) as store:
+        for timestamp, book in zip(timestamps, books):
+            store.append('event', 'tab', book, timestamp)
+    store = LineStore(str(tmp_path))
+    assert len(store.days('event', 'tab')) == 2
+
+    data = store.read('event', 'tab', start=timestamps[1], end=timestamps[4])
+    np.testing.assert_array_equal(data['timestamps'], timestamps[1:5])
+    np.testing.assert_array_equal(np.diff(data['offsets']), [len(book) for book in books[1:5]])
+    np.testing.assert_array_equal(data['line_levels'][data['offsets'][2]:data['offsets'][3]], books[3].line_levels)
+
+    assert len(store.read('event', 'tab', end=DAY - 1)['timestamps']) == 0
+    assert store.snapshot_at('event', 'tab', DAY - 1) is None
+    _assert_same(store.snapshot_at('event', 'tab', timestamps[4] + 10), books[4])
+    _assert_same(store.snapshot_at('event', 'tab', timestamps[3] - 10), books[2])
+
+
+def test_unflushed_appends_are_invisible(tmp_path):
+    book = _books(1)[0]
+    store = LineStore(str(tmp_path), flush_interval=None)
+    for k in range(600):
+        store.append('event', 'tab', book, DAY + k)
+    assert len(LineStore(str(tmp_path)).read('event', 'tab')['timestamps']) == 0
+    store.flush()
+    assert len(LineStore(str(tmp_path)).read('event', 'tab')['timestamps']) == 600
+    store.close()
+
+
+def test_crash_loses_only_unflushed_snapshots(tmp_path):
+    # 512 flushed snapshots then 600 more left in the writer's buffers when the process dies
+    script = textwrap.dedent(f'''
+        import os
+        from benchmarks.fixtures import make_lines
+        from line_store import LineStore
+        from lines_book import LinesBook
+
+        book = LinesBook.from_lines(make_lines(8)[1])
+        store = LineStore({str(tmp_path)!r}, flush_interval=None)
+        for k in range(1112):
+            store.append('event', 'tab', book, {DAY} + k)
+            if k == 511:
+                store.flush()
+        os._exit(0)
+    ''')
+    subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True)
+
+    book = LinesBook.from_lines(make_lines(8)[1])
+    snapshots = list(LineStore(str(tmp_path)).snapshots('event', 'tab'))
+    assert len(snapshots) == 512
+    for _, stored in snapshots:
+        _assert_same(stored, book)
+
+    with LineStore(str(tmp_path)) as store:
+        store.append('event', 'tab', book, DAY + 2000)
+    snapshots = list(LineStore(str(tmp_path)).snapshots('event', 'tab'))
+    assert len(snapshots) == 513
+    _assert_same(snapshots[-1][1], book)
+
+
+def test_reopen_drops_index_entries_past_the_columns(tmp_path):
+    books = _books(3)
+    with LineStore(str(tmp_path)) as store:
+        for k, book in enumerate(books):
+            store.append('event', 'tab', book, DAY + k)
+    partition = os.path.join(str(tmp_path), 'event', 'tab', store.days('event', 'tab')[0])
+    # a torn write: the last snapshot's levels lost and half an index entry trailing
+    levels_path = os.path.join(partition, 'line_level.i2')
+    os.truncate(levels_path, os.path.getsize(levels_path) - 2)
+    with open(os.path.join(partition, 'index.i8'), 'ab') as f:
+        f.write(b'\0' * 5)
+
+    with LineStore(str(tmp_path)) as store:
+        store.append('event', 'tab', books[0], DAY + 10)
+    snapshots = list(LineStore(str(tmp_path)).snapshots('event', 'tab'))
+    assert [timestamp for timestamp, _ in snapshots] == [DAY, DAY + 1, DAY + 10]
+    for (_, stored), expected in zip(snapshots, [books[0], books[1], books[0]]):
+        _assert_same(stored, expected)
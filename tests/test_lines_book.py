@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from line_apis import make_lines_dict
+from lines_book import LinesBook, as_lines_book
+
+
+def quote(home_line, home_side, price, id=None, market_type='Line'):
+    return {'home_line': home_line, 'home_side': home_side, 'price': price, 'id': id, 'market_type': market_type}
+
+
+LINES = [
+    quote(1.5, True, 2.2, 11), quote(1.5, False, 1.7, 12),
+    quote(-6.5, True, 1.5, 13), quote(-6.5, False, 2.6, 14),
+    quote(-2.5, True, 1.85, 15),
+    quote(4.5, False, 1.4, 16),
+]
+
+
+def test_round_trips_lines_dict():
+    lines_dict = make_lines_dict(LINES)
+    book = as_lines_book(lines_dict)
+    assert book.to_lines_dict() == dict(sorted(lines_dict.items()))
+    assert as_lines_book(book.to_lines_dict()).to_lines_dict() == book.to_lines_dict()
+
+
+def test_matches_lines_dict_and_lines_list():
+    from_dict = LinesBook.from_lines_dict(make_lines_dict(LINES))
+    from_lines = as_lines_book(LINES)
+    for name in LinesBook.__slots__:
+        np.testing.assert_array_equal(getattr(from_dict, name), getattr(from_lines, name))
+
+
+def test_sorts_unsorted_levels():
+    book = LinesBook.from_lines(LINES)
+    assert book.line_levels.tolist() == [-6.5, -2.5, 1.5, 4.5]
+    np.testing.assert_array_equal(book.home_prices, [1.5, 1.85, 2.2, np.nan])
+    np.testing.assert_array_equal(book.away_prices, [2.6, np.nan, 1.7, 1.4])
+    assert book.home_ids.tolist() == [13, 15, 11, -1]
+    assert book.away_ids.tolist() == [14, -1, 12, 16]
+
+    direct = LinesBook([1.5, -6.5], [2.2, 1.5], [1.7, 2.6], home_ids=[11, 13], away_ids=[12, 14])
+    assert direct.line_levels.tolist() == [-6.5, 1.5]
+    assert direct.home_prices.tolist() == [1.5, 2.2]
+    assert direct.away_ids.tolist() == [14, 12]
+    assert direct.index(1.5) == 1
+    with pytest.raises(KeyError):
+        direct.index(-2.5)
+
+
+def test_later_duplicate_quote_replaces_earlier():
+    lines = LINES + [quote(1.5, True, 2.3, 21, 'Alt'), quote(-6.5, False, 2.5, 22)]
+    book = LinesBook.from_lines(lines)
+    assert len(book) == 4
+    i = book.index(1.5)
+    assert book.line(i, True) == quote(1.5, True, 2.3, 21, 'Alt')
+    assert book.line(i, False) == quote(1.5, False, 1.7, 12)
+    assert book.line(book.index(-6.5), False) == quote(-6.5, False, 2.5, 22)
+    assert book.to_lines_dict() == dict(sorted(make_lines_dict(lines).items()))
+
+
+def test_keeps_non_integer_ids():
+    book = LinesBook.from_lines([quote(-1.5, True, 1.9, 'abc'), quote(-1.5, False, 1.9, 'def'), quote(2.5, True, 2.5)])
+    assert book.home_ids.dtype == object
+    assert book.line(0, False)['id'] == 'def'
+    assert book.to_lines_dict()[2.5] == [quote(2.5, True, 2.5), None]
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from benchmarks.fixtures import make_lines
+from lines_book import LinesBook
+from margin_model import fit_margin_model, margin_fit_data
+from pricing import MarginPricer
+
+
+def make_book(mu=-4, overround=0.05, first_id=1000):
+    return LinesBook.from_lines(make_lines(30, mu=mu, overround=overround, first_id=first_id)[1])
+
+
+def test_single_lines_list_is_one_ladder():
+    _, lines = make_lines(30)
+    home_lines, _, _ = margin_fit_data(lines)
+    assert len(home_lines) == 2*30
+
+
+def test_pooled_lines_books():
+    books = [make_book(-4, 0.05, 1000), make_book(-3, 0.04, 5000), make_book(-5, 0.06, 9000)]
+    home_lines, y, sigma = margin_fit_data(books)
+    assert len(home_lines) == len(y) == len(sigma) == 2*3*30
+
+    model = fit_margin_model(books)
+    single = fit_margin_model(books[0])
+    assert model is not None and single is not None
+    assert -5.5 < model.mu < -2.5
+    assert model.mu != pytest.approx(single.mu, abs=1e-6)
+
+
+def test_pooled_lines_dicts_match_lines_books():
+    books = [make_book(-4, 0.05, 1000), make_book(-3, 0.04, 5000)]
+    from_books = margin_fit_data(books)
+    from_dicts = margin_fit_data([book.to_lines_dict() for book in books])
+    for a, b in zip(from_books, from_dicts):
+        np.testing.assert_allclose(a, b)
+
+
+def test_margin_pricer_is_abstract():
+    with pytest.raises(TypeError):
+        MarginPricer()
@@ -0,0 +1,91 @@
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import make_lines
+from benchmarks.stub_tab_server import StubTabServer, default_price
+from lines_book import LinesBook
+from multi_query_apis import make_tab_session, margin_sweep_pairs, tab_multi_margin_sweep_stream
+
+
+def make_book(n_levels=8):
+    return LinesBook.from_lines(make_lines(n_levels)[1])
+
+
+def result_pair(result):
+    return result['away_line']['home_line'], result['home_line']['home_line']
+
+
+def test_results_stream_as_they_complete():
+    book = make_book()
+    pairs = margin_sweep_pairs(book)
+    slow_ids = [int(book.away_ids[0]), int(book.home_ids[1])]
+
+    def price_fn(proposition_ids):
+        if proposition_ids == slow_ids:
+            time.sleep(0.5)
+        return default_price(proposition_ids)
+
+    with StubTabServer(price_fn=price_fn) as server:
+        results = list(tab_multi_margin_sweep_stream(book, max_workers=4, url=server.url))
+    assert sorted(map(result_pair, results)) == sorted(pairs)
+    assert result_pair(results[0]) != pairs[0]
+    assert result_pair(results[-1]) == pairs[0]
+    for result in results:
+        assert result['price'] == round(default_price([result['away_line']['id'], result['home_line']['id']]), 2)
+
+
+def test_retries_503():
+    book = make_book(6)
+    pairs = margin_sweep_pairs(book)
+    with StubTabServer(fail_every=3) as server, make_tab_session(retries=3, backoff_factor=0) as session:
+        results = list(tab_multi_margin_sweep_stream(book, max_workers=2, session=session, url=server.url))
+        request_count = server.request_count
+    assert sorted(map(result_pair, results)) == sorted(pairs)
+    assert request_count > len(pairs)
+
+
+def test_503_without_retries_drops_the_pair():
+    book = make_book(6)
+    with StubTabServer(fail_every=3) as server, make_tab_session(retries=0) as session:
+        results = list(tab_multi_margin_sweep_stream(book, max_workers=1, session=session, url=server.url))
+    assert len(results) == len(margin_sweep_pairs(book)) - len(margin_sweep_pairs(book)) // 3
+
+
+def test_timeout_skips_only_the_slow_pair():
+    book = make_book(5)
+    pairs = margin_sweep_pairs(book)
+    slow_ids = [int(book.away_ids[0]), int(book.home_ids[1])]
+
+    def price_fn(proposition_ids):
+        if proposition_ids == slow_ids:
+            time.sleep(1.0)
+        return default_price(proposition_ids)
+
+    start = time.perf_counter()
+    with StubTabServer(price_fn=price_fn) as server, make_tab_session(retries=0) as session:
+        results = list(tab_multi_margin_sweep_stream(book, max_workers=4, session=session, url=server.url, timeout=0.2))
+    assert time.perf_counter() - start < 1.0
+    assert sorted(map(result_pair, results)) == sorted(pair for pair in pairs if pair != pairs[0])
+
+
+def test_missing_leg_is_never_enquired():
+    book = make_book(6)
+    book.away_prices[1] = np.nan
+    book.home_ids[3] = -1
+    line_levels = book.line_levels.tolist()
+    expected = [(lower, upper) for lower, upper in margin_sweep_pairs(book)
+                if lower != line_levels[1] and upper != line_levels[3]]
+    with StubTabServer() as server:
+        results = list(tab_multi_margin_sweep_stream(book, url=server.url))
+        request_count = server.request_count
+    assert request_count == len(expected)
+    assert sorted(map(result_pair, results)) == sorted(expected)
+
+
+def test_pairs_outside_the_ladder_are_skipped():
+    book = make_book(4)
+    pairs = margin_sweep_pairs(book)[:2] + [(100.5, 101.5)]
+    with StubTabServer() as server:
+        results = list(tab_multi_margin_sweep_stream(book, pairs=pairs, url=server.url))
+    assert sorted(map(result_pair, results)) == sorted(pairs[:2])
@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+import pytest
+import requests
+
+import instrumentation
+import line_apis
+from benchmarks.fixtures import make_lines, tab_payload
+from benchmarks.replay import BOOKMAKER_HOSTS, ReplayAdapter
+from lines_book import LinesBook
+from pipeline import PollingScheduler, reprice_stream
+from repricing import RepricingCache
+
+
+def ticks():
+    """Successive ladders of one book: a repriced level, a removed level, then an added one"""
+    book = LinesBook.from_lines(make_lines(10)[1])
+    yield book
+    moved = book.take(np.arange(len(book)))
+    moved.home_prices[4] += 0.05
+    yield moved
+    removed = moved.take(np.flatnonzero(moved.line_levels != moved.line_levels[7]))
+    yield removed
+    yield LinesBook.from_lines(make_lines(11)[1])
+
+
+def deltas(books):
+    scheduler = PollingScheduler.__new__(PollingScheduler)
+    scheduler.books = {}
+    for book in books:
+        lines = [book.line(i, side) for i in range(len(book)) for side in (True, False)]
+        delta = scheduler._delta('event', 'tab', ('Home', 'Away'), lines)
+        if delta is not None:
+            yield delta
+
+
+def test_reprice_stream_applies_only_the_changes():
+    cache = RepricingCache()
+    full = RepricingCache()
+    for delta, book in zip(reprice_stream(deltas(ticks()), cache), ticks()):
+        expected = full.update('event', 'tab', book)
+        assert delta['changed_levels'].tolist() == expected['changed_levels'].tolist()
+        assert delta['repriced_pairs'] == expected['repriced_pairs']
+        assert delta['model']['mu'] == expected['model']['mu']
+        state = cache.events['event']['tab']['book']
+        np.testing.assert_array_equal(state.line_levels, book.line_levels)
+        np.testing.assert_array_equal(state.home_prices, book.home_prices)
+        np.testing.assert_array_equal(state.away_prices, book.away_prices)
+    assert cache.theos('event', 'tab') == full.theos('event', 'tab')
+
+
+def test_reprice_stream_reloads_evicted_ladders():
+    cache = RepricingCache(max_events=1)
+    stream = reprice_stream(deltas(ticks()), cache)
+    next(stream)
+    cache.update('other', 'tab', LinesBook.from_lines(make_lines(6)[1]))
+    result = next(stream)
+    assert len(cache.events['event']['tab']['book']) == 10
+    assert len(result['repriced_pairs']) > 0
+
+
+@pytest.fixture
+def metrics():
+    instrumentation.enable(reset=True)
+    yield instrumentation.METRICS
+    instrumentation.disable()
+    instrumentation.METRICS.reset()
+
+
+class FakeClock:
+    """Simulated time that only moves when the scheduler sleeps"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_stream_polls_on_cadence_within_the_rate_limit():
+    clock = FakeClock()
+    replay = ReplayAdapter(json.dumps(tab_payload(10)).encode(), etag='"v1"')
+    polls = []
+
+    def get_lines(book, event_id, **kwargs):
+        polls.append((clock(), event_id))
+        return line_apis.get_lines_conditional(book, event_id, **kwargs)
+
+    events = {'a': {'tab': 'A%20v%20B'}, 'b': {'tab': 'C%20v%20D'}}
+    with PollingScheduler(events, cadence={'tab': 2.0}, rate_limits={'tab': (1.0, 1)}, get_lines=get_lines,
+                          clock=clock, sleep=clock.sleep) as scheduler:
+        scheduler.sessions['tab'].mount(BOOKMAKER_HOSTS['tab'], replay)
+        deltas = list(scheduler.stream(stop=lambda: clock() >= 9))
+
+    # one token a second holds the second event back a second, then each event is polled every 2 seconds
+    assert polls == [(float(t), 'A%20v%20B' if t % 2 == 0 else 'C%20v%20D') for t in range(9)]
+    # only the first response of each event is parsed, the rest are 304s
+    assert [delta['event'] for delta in deltas] == ['a', 'b']
+    assert replay.request_count == 9
+    assert scheduler.validators[('a', 'tab')]['etag'] == '"v1"'
+    assert not scheduler.errors
+
+
+def test_stream_records_failed_polls_and_keeps_polling(metrics):
+    clock = FakeClock()
+
+    def get_lines(book, event_id, **kwargs):
+        raise requests.ConnectionError('refused')
+
+    with PollingScheduler({'a': {'neds': 'x'}}, cadence={'neds': 1.0}, rate_limits={}, get_lines=get_lines,
+                          clock=clock, sleep=clock.sleep) as scheduler:
+        assert list(scheduler.stream(stop=lambda: clock() >= 3)) == []
+    assert isinstance(scheduler.errors[('a', 'neds')], requests.ConnectionError)
+    errors = metrics.counters[('errors_total', (('book', 'neds'), ('kind', 'connection'), ('stage', 'poll')))]
+    polls = metrics.histograms[('poll_seconds', (('book', 'neds'),))][2]
+    assert errors == polls == 3
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from pricing import NormalPricer, pricer
+
+MODELS = [(-4.3, 12.7), (0.0, 1.0), (17.5, 6.2), (-60.0, 20.0)]
+
+
+def home_win(line, mu, sigma):
+    """P(home covers line) straight from the fitted cdf, one line at a time"""
+    if line == np.floor(line):
+        # D <= line - 1: the fitted cdf at line - 1 above 0 and at line from 0 down
+        return stats.norm.cdf(line - 1 if line > 0 else line, mu, sigma)
+    return stats.norm.cdf(line - 0.5*np.sign(line), mu, sigma)
+
+
+def push(line, mu, sigma):
+    if line != np.floor(line) or line == 0:
+        return 0.0
+    if line > 0:
+        return stats.norm.cdf(line, mu, sigma) - stats.norm.cdf(line - 1, mu, sigma)
+    return stats.norm.cdf(line + 1, mu, sigma) - stats.norm.cdf(line, mu, sigma)
+
+
+LINES = np.array([-150.5, -101.0, -40.5, -7.0, -2.5, -1.0, -0.5, 0.5, 1.0, 3.0, 6.5, 99.5, 100.0, 120.0])
+
+
+@pytest.mark.parametrize('mu, sigma', MODELS)
+def test_spread_probs_match_scipy(mu, sigma):
+    win, push_probs, lose = NormalPricer(mu, sigma).spread_probs(LINES)
+    expected_win = [home_win(line, mu, sigma) for line in LINES]
+    expected_push = [push(line, mu, sigma) for line in LINES]
+    np.testing.assert_allclose(win, expected_win, rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(push_probs, expected_push, rtol=1e-9, atol=1e-15)
+    np.testing.assert_allclose(win + push_probs + lose, 1)
+
+
+@pytest.mark.parametrize('mu, sigma', MODELS)
+def test_band_probs_match_scipy(mu, sigma):
+    lower, upper = np.meshgrid(LINES, LINES, indexing='ij')
+    keep = lower < upper
+    lower, upper = lower[keep], upper[keep]
+    win, push_probs = NormalPricer(mu, sigma).band_probs(lower, upper)
+    # the away leg at lower wins when the home leg at lower loses, both win inside the band
+    expected_win = [home_win(u, mu, sigma) - home_win(l, mu, sigma) - push(l, mu, sigma) for l, u in zip(lower, upper)]
+    expected_push = [push(l, mu, sigma) + push(u, mu, sigma) for l, u in zip(lower, upper)]
+    np.testing.assert_allclose(win, expected_win, rtol=1e-9, atol=1e-15)
+    np.testing.assert_allclose(push_probs, expected_push, rtol=1e-9, atol=1e-15)
+
+
+def test_margin_cdf_outside_the_table_matches_scipy():
+    d = np.arange(-130, 131)
+    np.testing.assert_allclose(NormalPricer(-4.3, 12.7, table_range=50).margin_cdf(d),
+                               stats.norm.cdf(d + (d < 0), -4.3, 12.7), rtol=1e-12)
+    assert NormalPricer(0.0, 12.0).margin_probs(0) == 0
+
+
+def test_pricer_is_not_stale_across_models():
+    model = {'mu': -4.3, 'sigma': 12.7}
+    first = pricer(model)
+    assert pricer({'mu': np.float64(-4.3), 'sigma': np.float64(12.7)}) is first
+    model['mu'] = 3.1
+    moved = pricer(model)
+    assert moved is not first
+    assert moved.mu == 3.1
+    np.testing.assert_allclose(moved.spread_probs([2.5])[0], stats.norm.cdf(2, 3.1, 12.7))
+    assert pricer({'mu': 3.1, 'sigma': 20.0}).sigma == 20.0
+    assert pricer(model, table_range=10).table_range == 10
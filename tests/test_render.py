@@ -0,0 +1,58 @@
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import render
+from benchmarks.fixtures import make_lines
+from lines_book import LinesBook
+
+
+def test_curves_span_the_final_axes():
+    books = {book: LinesBook.from_lines(make_lines(60, mu=mu, first_id=first_id)[1])
+             for book, mu, first_id in (('tab', -4, 1000), ('neds', -2, 5000))}
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    render.draw_event(ax, books, teams=('Home', 'Away'))
+    fig.canvas.draw()
+    low, high = ax.get_xlim()
+    assert len(ax.lines) == 2
+    for line in ax.lines:
+        x_data = line.get_xdata()
+        assert x_data.min() == low and x_data.max() == high
+    assert [text.get_text() for text in ax.get_legend().get_texts()] == ['TAB', 'Neds']
+
+
+def test_render_event_writes_png(tmp_path):
+    event = {'books': {'tab': make_lines(20)[1]}, 'teams': ('Home', 'Away')}
+    path = render.render_event(event, str(tmp_path / 'chart.png'))
+    assert matplotlib.image.imread(path).shape[:2] == (800, 1200)
+
+
+def test_live_chart_restyles_only_when_the_extent_moves(monkeypatch):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    chart = render.LiveChart(ax, teams=('Home', 'Away'))
+    calls = {'style_axes': 0, 'legend': 0}
+    style_axes, legend = render.style_axes, ax.legend
+
+    def counting_style_axes(*args, **kwargs):
+        calls['style_axes'] += 1
+        return style_axes(*args, **kwargs)
+
+    def counting_legend(*args, **kwargs):
+        calls['legend'] += 1
+        return legend(*args, **kwargs)
+
+    monkeypatch.setattr(render, 'style_axes', counting_style_axes)
+    monkeypatch.setattr(ax, 'legend', counting_legend)
+    # ticks that reprice the same ladder
+    for overround in (0.05, 0.04, 0.06, 0.05, 0.03):
+        chart.update('tab', make_lines(20, overround=overround)[1])
+    assert calls == {'style_axes': 1, 'legend': 1}
+
+    # a wider ladder moves the limits, a second book adds a legend entry
+    chart.update('neds', make_lines(30, first_id=5000)[1])
+    assert calls == {'style_axes': 2, 'legend': 2}
+    assert [text.get_text() for text in ax.get_legend().get_texts()] == ['TAB', 'Neds']
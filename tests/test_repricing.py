@@ -0,0 +1,50 @@
+import numpy as np
+
+from benchmarks.fixtures import make_lines
+from lines_book import LinesBook
+from repricing import RepricingCache
+
+
+def make_book(n_levels=8):
+    return LinesBook.from_lines(make_lines(n_levels)[1])
+
+
+def quote_all(cache, book):
+    pairs = list(cache.theos('event', 'tab'))
+    return cache.update_sgm_prices('event', 'tab', {pair: 3.0 for pair in pairs if cache.theos('event', 'tab')[pair]})
+
+
+def test_removed_level_drops_its_quotes_and_ev():
+    cache = RepricingCache()
+    book = make_book()
+    cache.update('event', 'tab', book)
+    ev = quote_all(cache, book)
+    removed = float(book.line_levels[3])
+    assert any(removed in pair for pair in ev)
+
+    result = cache.update('event', 'tab', book.take(np.flatnonzero(book.line_levels != removed)))
+    assert result['changed_levels'].tolist() == [removed]
+    state = cache.events['event']['tab']
+    for entries in (state['theos'], state['sgm_prices'], state['ev']):
+        assert not any(removed in pair for pair in entries)
+    untouched = [pair for pair in ev if removed not in pair]
+    assert untouched and all(cache.ev('event', 'tab')[pair] == ev[pair] for pair in untouched)
+
+
+def test_repriced_level_drops_its_quotes_until_requoted():
+    cache = RepricingCache()
+    book = make_book()
+    cache.update('event', 'tab', book)
+    quote_all(cache, book)
+
+    moved = make_book()
+    moved.home_prices[2] += 0.1
+    level = float(book.line_levels[2])
+    result = cache.update('event', 'tab', moved)
+    assert result['ev'] == {}
+    assert not any(level in pair for pair in cache.ev('event', 'tab'))
+    assert any(level in pair for pair in cache.theos('event', 'tab'))
+
+    pair = next(pair for pair in cache.theos('event', 'tab') if level in pair and cache.theos('event', 'tab')[pair])
+    ev = cache.update_sgm_prices('event', 'tab', {pair: 3.0})
+    assert ev[pair] == 3.0 / cache.theos('event', 'tab')[pair][1] - 1
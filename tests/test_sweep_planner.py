@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import tools
+from benchmarks.fixtures import make_lines
+from benchmarks.stub_tab_server import StubTabServer
+from lines_book import LinesBook
+from sweep_planner import planned_margin_sweep_stream, rank_sweep_pairs
+
+
+def make_book(n_levels=30):
+    return LinesBook.from_lines(make_lines(n_levels)[1])
+
+
+def pair_ids(book, candidate):
+    return [int(book.away_ids[candidate['i']]), int(book.home_ids[candidate['j']])]
+
+
+def quoting_at(book, ranked, ratio):
+    """price_fn quoting every pair at ratio x its theo odds"""
+    prices = {tuple(pair_ids(book, candidate)): ratio*candidate['odds_theo'] for candidate in ranked}
+    return lambda proposition_ids: prices[tuple(proposition_ids)]
+
+
+def sweep(book, model, ratio, **kwargs):
+    ranked = rank_sweep_pairs(book, model)
+    with StubTabServer(price_fn=quoting_at(book, ranked, ratio)) as server:
+        results = list(planned_margin_sweep_stream(book, model, url=server.url, max_workers=4, **kwargs))
+    return ranked, results, server.request_count
+
+
+def reachable(ranked, ratio, min_ev):
+    return {candidate['pair'] for candidate in ranked
+            if candidate['best_ev'] >= min_ev and ratio*candidate['odds_theo']*candidate['model_prob'] - 1 >= min_ev}
+
+
+@pytest.mark.filterwarnings('error')
+def test_ranked_by_best_ev_without_nans():
+    book = make_book()
+    # a model that gives the bands far from its mean no chance at all
+    ranked = rank_sweep_pairs(book, {'mu': 30.0, 'sigma': 0.5})
+    best_ev = np.array([candidate['best_ev'] for candidate in ranked])
+    assert not np.isnan(best_ev).any()
+    assert (np.diff(best_ev) <= 0).all()
+    impossible = [candidate for candidate in ranked if candidate['model_prob'] == 0]
+    assert impossible and all(candidate['best_ev'] == -1 for candidate in impossible)
+
+
+def test_quotes_above_theo_bring_back_held_back_pairs():
+    book = make_book()
+    model = tools.fit_normal_cdf(book)
+    ranked, results, _ = sweep(book, model, 1.3, min_ev=0.05, batch_size=4)
+    queried = {(result['away_line']['home_line'], result['home_line']['home_line']) for result in results}
+    held_back = reachable(ranked, 1.3, 0.05) - reachable(ranked, 1.0, 0.05)
+    assert held_back
+    assert queried == reachable(ranked, 1.3, 0.05)
+    assert all(result['ev'] >= 0.05 - 0.01 for result in results)
+
+
+def test_quotes_below_theo_prune_the_rest():
+    book = make_book()
+    model = tools.fit_normal_cdf(book)
+    ranked, results, request_count = sweep(book, model, 0.9, min_ev=0.0, batch_size=4)
+    first_batch = [candidate['pair'] for candidate in ranked if candidate['pair'] in reachable(ranked, 1.0, 0.0)][:4]
+    queried = [(result['away_line']['home_line'], result['home_line']['home_line']) for result in results]
+    assert set(first_batch) <= set(queried)
+    assert set(queried) - set(first_batch) <= reachable(ranked, 0.9, 0.0)
+    assert request_count == len(queried) < len(reachable(ranked, 1.0, 0.0))
+
+
+def test_top_k_caps_the_queries():
+    book = make_book()
+    model = tools.fit_normal_cdf(book)
+    _, results, request_count = sweep(book, model, 1.3, min_ev=0.0, top_k=10, batch_size=4)
+    assert len(results) == request_count == 10
@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+import instrumentation
+import tools
+from benchmarks.fixtures import make_lines
+from lines_book import LinesBook
+
+
+# (n_levels, mu, sigma, overround): centred and off-centre ladders, narrow and wide, tight and steep
+LADDERS = [(30, -4, 12, 0.05), (10, 3, 8, 0.03), (60, -10, 15, 0.07), (6, 0, 12, 0.05), (3, 0, 12, 0.05),
+           (40, -4, 1, 0.05), (20, -40, 12, 0.05)]
+
+
+def make_book(n_levels, mu=-4, sigma=12, overround=0.05, first_id=1000):
+    return LinesBook.from_lines(make_lines(n_levels, mu=mu, sigma=sigma, overround=overround, first_id=first_id)[1])
+
+
+@pytest.mark.parametrize('n_levels, mu, sigma, overround', LADDERS)
+def test_gauss_newton_matches_curve_fit(n_levels, mu, sigma, overround):
+    book = make_book(n_levels, mu, sigma, overround)
+    model = tools.fit_normal_cdf(book)
+    # curve_fit from its [0, 1] default stalls on ladders far from 0, so it starts where Gauss-Newton does
+    p0 = tools.probit_initial_estimate(*tools.normal_cdf_fit_data(book))
+    expected = tools.fit_normal_cdf(book, p0=p0, method='curve_fit')
+    assert model['converged'] and expected['converged']
+    assert model['mu'] == pytest.approx(expected['mu'], abs=1e-5)
+    assert model['sigma'] == pytest.approx(expected['sigma'], rel=1e-5)
+    # curve_fit gives up on the covariance of an exact fit, Gauss-Newton still reports it
+    if np.isfinite(expected['pcov']).all():
+        np.testing.assert_allclose(model['pcov'], expected['pcov'], rtol=1e-3, atol=1e-12)
+    if abs(mu) < 10:
+        default = tools.fit_normal_cdf(book, method='curve_fit')
+        assert model['mu'] == pytest.approx(default['mu'], abs=1e-4)
+
+
+def test_gauss_newton_matches_curve_fit_with_one_sided_levels():
+    book = make_book(20)
+    book.home_prices[[2, 7]] = np.nan
+    model = tools.fit_normal_cdf(book)
+    expected = tools.fit_normal_cdf(book, method='curve_fit')
+    assert model['mu'] == pytest.approx(expected['mu'], abs=1e-5)
+    assert model['sigma'] == pytest.approx(expected['sigma'], rel=1e-5)
+
+
+def test_flat_ladder_does_not_converge():
+    # every level priced the same: the least squares optimum is an infinitely wide cdf
+    book = LinesBook([-3.5, -2.5, -1.5], [1.9, 1.9, 1.9], [1.9, 1.9, 1.9])
+    model = tools.fit_normal_cdf(book)
+    assert not model['converged']
+    assert model['iterations'] == 50
+    assert model['sigma'] > 1e5
+    assert tools.fit_normal_cdf(book, method='curve_fit')['sigma'] > 1e5
+
+
+def test_warm_start_converges_to_the_same_fit():
+    book = make_book(30)
+    fitter = tools.NormalCdfFitter()
+    cold = fitter.fit('event', book)
+    moved = make_book(30, mu=-4.5)
+    warm = fitter.fit('event', moved)
+    assert warm['mu'] == pytest.approx(tools.fit_normal_cdf(moved)['mu'], abs=1e-8)
+    assert warm['iterations'] < cold['iterations']
+
+
+def test_batch_fit_equals_per_ladder_fits():
+    books = [make_book(n_levels, mu, sigma, overround) for n_levels, mu, sigma, overround in LADDERS]
+    # a ladder with no level quoted on both sides can't be fitted
+    books.append(LinesBook([-2.5, -1.5], [1.9, np.nan], [np.nan, 2.1]))
+    batch = tools.fit_normal_cdf_batch(books)
+    for k, book in enumerate(books[:-1]):
+        model = tools.fit_normal_cdf(book)
+        assert batch['mu'][k] == pytest.approx(model['mu'], abs=1e-8)
+        assert batch['sigma'][k] == pytest.approx(model['sigma'], rel=1e-8)
+        np.testing.assert_allclose(batch['pcov'][k], model['pcov'], rtol=1e-6, atol=1e-12)
+        assert batch['converged'][k]
+    assert np.isnan(batch['popt'][-1]).all()
+    assert not batch['converged'][-1]
+
+
+def test_batch_fit_in_processes_equals_one_process():
+    books = [make_book(10 + k % 20, mu=k % 7 - 3) for k in range(50)]
+    one = tools.fit_normal_cdf_batch(books)
+    chunked = tools.fit_normal_cdf_batch(books, processes=2, chunk_size=16)
+    np.testing.assert_array_equal(one['popt'], chunked['popt'])
+    np.testing.assert_array_equal(one['iterations'], chunked['iterations'])
+
+
+def test_opposing_lines_margin_matrix_matches_scalar():
+    book = make_book(12)
+    book.home_prices[3] = np.nan
+    book.away_prices[8] = np.nan
+    matrices = tools.opposing_lines_margin_matrix(book, min_width=1)
+    unmasked = 0
+    for i in range(len(book)):
+        for j in range(len(book)):
+            cells = [matrix[i, j] for matrix in matrices]
+            legs = [book.home_prices[j], book.away_prices[j], book.away_prices[i], book.home_prices[i]]
+            if book.line_levels[j] - book.line_levels[i] < 1 or np.isnan([legs[0], legs[2]]).any():
+                assert all(cell is np.ma.masked for cell in cells)
+                continue
+            with np.errstate(divide='ignore'):
+                expected = tools.opposing_lines_margin(*legs)
+            for cell, odds in zip(cells, expected):
+                if odds > 0 and np.isfinite(odds):
+                    assert cell == pytest.approx(odds, rel=1e-12)
+                    unmasked += 1
+                else:
+                    assert cell is np.ma.masked
+    assert unmasked > 100
+
+
+def test_margin_ev_matrix():
+    book = make_book(6)
+    _, odds_theo, _ = tools.opposing_lines_margin_matrix(book)
+    prices = np.full(odds_theo.shape, np.nan)
+    prices[0, 3] = 5.0
+    prices[1, 0] = 5.0
+    ev = tools.margin_ev_matrix(prices, odds_theo)
+    assert ev[0, 3] == pytest.approx(5.0 / odds_theo[0, 3] - 1)
+    # unquoted pairs and cells below the diagonal are masked
+    assert ev.count() == 1
+
+
+@pytest.fixture
+def metrics():
+    instrumentation.enable(reset=True)
+    yield instrumentation.METRICS
+    instrumentation.disable()
+    instrumentation.METRICS.reset()
+
+
+def test_curve_fit_reports_convergence(metrics):
+    book = LinesBook.from_lines(make_lines(30, mu=-4)[1])
+    model = tools.fit_normal_cdf(book, method='curve_fit')
+    assert model['converged'] is True
+    assert model['mu'] == pytest.approx(tools.fit_normal_cdf(book)['mu'], abs=1e-4)
+    assert metrics.counters[('fits_total', (('method', 'curve_fit'), ('converged', 'true')))] == 1
+
+
+def test_curve_fit_hitting_maxfev_is_not_converged(monkeypatch, metrics):
+    import scipy.optimize
+
+    curve_fit = scipy.optimize.curve_fit
+    monkeypatch.setattr(scipy.optimize, 'curve_fit', lambda *args, **kwargs: curve_fit(*args, maxfev=3, **kwargs))
+    book = LinesBook.from_lines(make_lines(30, mu=-4)[1])
+    with pytest.raises(RuntimeError):
+        tools.fit_normal_cdf(book, method='curve_fit')
+    assert metrics.counters[('fits_total', (('method', 'curve_fit'), ('converged', 'false')))] == 1
@@ -1,8 +1,19 @@
 import numpy as np
 from scipy import special
-import scipy.stats as stats
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
+
+import instrumentation
+from lines_book import as_lines_book
+
+
+# plotting moved to plotting.py, which imports matplotlib; these names still resolve from tools on first use
+PLOTTING_NAMES = ('plot_lines', 'update_lines', 'plot_normal_cdf', 'Ruler')
+
+
+def __getattr__(name):
+    if name in PLOTTING_NAMES:
+        import plotting
+        return getattr(plotting, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def invert_odds(odds):
@@ -30,6 +41,41 @@ def opposing_lines_margin(home_line1, away_line1, home_line2, away_line2):
 
 
 
+def opposing_lines_margin_matrix(lines, min_width=1):
+    """opposing_lines_margin for every sweep pair of a ladder at once.
+
+    Cell [i, j] prices the band between the away leg at line_levels[i] and the home leg at line_levels[j],
+    i.e. opposing_lines_margin(home[j], away[j], away[i], home[i]). Returns masked (n, n) arrays
+    (odds_lowerbound, odds_theo, odds_upperbound). Cells below the diagonal, narrower than min_width,
+    missing a quote, or whose probability is not positive are masked."""
+    book = as_lines_book(lines)
+    line_levels = book.line_levels
+    home = book.home_prices
+    away = book.away_prices
+    home_probs = 1/home
+    away_probs = 1/away
+    prob_sum = home_probs + away_probs
+
+    # rows are the lower (away) leg i, columns the upper (home) leg j
+    prob_lowerbound = (1 - away_probs)[None, :] + (1 - home_probs)[:, None] - 1
+    prob_theo = (home_probs/prob_sum)[None, :] + (away_probs/prob_sum)[:, None] - 1
+    prob_upperbound = home_probs[None, :] + away_probs[:, None] - 1
+
+    band = (line_levels[None, :] - line_levels[:, None] >= min_width) & ~np.isnan(away)[:, None] & ~np.isnan(home)[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        odds_upperbound = np.ma.masked_array(1/prob_lowerbound, mask=~(band & (prob_lowerbound > 0)))
+        odds_theo = np.ma.masked_array(1/prob_theo, mask=~(band & (prob_theo > 0)))
+        odds_lowerbound = np.ma.masked_array(1/prob_upperbound, mask=~(band & (prob_upperbound > 0)))
+    return odds_lowerbound, odds_theo, odds_upperbound
+
+
+def margin_ev_matrix(prices, odds):
+    """EV of quoted SGM prices against margin odds from opposing_lines_margin_matrix, price / odds - 1,
+    masked where either is missing. prices is (n, n) with nan or a mask where a pair wasn't quoted."""
+    prices = np.ma.masked_invalid(prices)
+    return prices / odds - 1
+
+
 def line_transfrom(line):
     if line < 0:
         line += 0.5
@@ -46,17 +92,10 @@ def line_inverse_transform(line):
     return line
 
 
-def plot_lines(ax, lines_dict, plot_midpoint=True, color=None, label=None):
-    for line_value, lines in lines_dict.items():
-        upperbound_prob = 1 / lines[0]['price']
-        lowerbound_prob = 1 / invert_odds(lines[1]['price'])
-        ax.vlines(x=line_transfrom(line_value), ymin=lowerbound_prob, ymax=upperbound_prob,
-        color=color, linewidth=2, linestyle='--', label=label)
-        ax.scatter(x=[line_transfrom(line_value),line_transfrom(line_value)], y=[upperbound_prob, lowerbound_prob],
-                    color=color, marker='_', s=120, linewidth=2)
-        if plot_midpoint:
-            midpoint_prob = (upperbound_prob + lowerbound_prob) / 2
-            ax.scatter(x=line_transfrom(line_value), y=midpoint_prob, color=color, marker='_', s=300, linewidth=2)
+def line_transform_array(lines):
+    """Vectorized line_transfrom"""
+    lines = np.asarray(lines, dtype=float)
+    return lines - 0.5*np.sign(lines)
 
 
 def midpoint_odds(odds, opposing_odds, tail_penalty=0):
@@ -71,86 +110,298 @@ def midpoint_odds(odds, opposing_odds, tail_penalty=0):
     return 1 / adj_theo_prob
 
 
-def fit_normal_cdf(lines_dict):
-    line_values = sorted(lines_dict.keys())
-    transformed_line_values = [line_transfrom(line) for line in line_values]
-    lowerbound_probs = [1/invert_odds(lines_dict[line][1]['price']) for line in line_values]
-    upperbound_probs = [1/lines_dict[line][0]['price'] for line in line_values]
-    theo_probs = [1/midpoint_odds(lines_dict[line][0]['price'], lines_dict[line][1]['price']) for line in line_values]
-    
-    sigma_uncertainty = [abs(1/lines_dict[line][0]['price'] - 1/invert_odds(lines_dict[line][1]['price'])) for line in line_values]
-    popt, pcov = curve_fit(stats.norm.cdf, transformed_line_values + transformed_line_values, lowerbound_probs + upperbound_probs, p0=[0,1], sigma=sigma_uncertainty+sigma_uncertainty)
+def normal_cdf_fit_data(lines):
+    """(x, y, sigma) points fitted by fit_normal_cdf: each level quoted on both sides contributes its lower
+    and upper bound probability, weighted by the width between them"""
+    book = as_lines_book(lines).complete()
+    transformed_line_values = line_transform_array(book.line_levels)
+    lowerbound_probs = book.lowerbound_probs
+    upperbound_probs = book.upperbound_probs
+    sigma_uncertainty = np.abs(upperbound_probs - lowerbound_probs)
+    x = np.concatenate([transformed_line_values, transformed_line_values])
+    y = np.concatenate([lowerbound_probs, upperbound_probs])
+    return x, y, np.concatenate([sigma_uncertainty, sigma_uncertainty])
+
+
+def probit_initial_estimate(x, y, sigma):
+    """Closed form (mu, sigma) estimate from a weighted least squares line through the probits of y.
+    ndtri(y) = (x - mu) / sigma is linear in x, and an error dy moves the probit by dy / pdf(z)."""
+    z = special.ndtri(np.clip(y, 1e-6, 1 - 1e-6))
+    w = (np.exp(-z**2 / 2) / sigma)**2
+    sw = w.sum()
+    x_mean = (w*x).sum() / sw
+    z_mean = (w*z).sum() / sw
+    slope = (w*(x - x_mean)*(z - z_mean)).sum() / (w*(x - x_mean)**2).sum()
+    if not np.isfinite(slope) or slope <= 0:
+        return np.array([x_mean, 12.0])
+    return np.array([x_mean - z_mean/slope, 1/slope])
+
+
+def _normal_cdf_residuals(x, y, sigma, params):
+    """Weighted residuals and the weighted model's d/dmu and d/dsigma"""
+    mu, scale = params
+    z = (x - mu) / scale
+    residuals = (y - special.ndtr(z)) / sigma
+    jac_mu = -np.exp(-z**2 / 2) / (np.sqrt(2*np.pi) * scale * sigma)
+    return residuals, jac_mu, jac_mu * z
+
+
+def fit_normal_cdf_gauss_newton(x, y, sigma, p0=None, max_iterations=50, xtol=1e-10):
+    """Levenberg-Marquardt damped Gauss-Newton with analytic gradients, minimising the same weighted least
+    squares as curve_fit(stats.norm.cdf, x, y, sigma=sigma). pcov is scaled by the residual variance as
+    curve_fit does with absolute_sigma=False. Returns popt, pcov, iterations, converged."""
+    params = probit_initial_estimate(x, y, sigma) if p0 is None else np.array(p0, dtype=float)
+    residuals, jac_mu, jac_sigma = _normal_cdf_residuals(x, y, sigma, params)
+    cost = residuals @ residuals
+    damping = 1e-6
+    converged = False
+    iterations = 0
+    while iterations < max_iterations:
+        iterations += 1
+        # 2x2 normal equations (J'J + damping*diag(J'J)) step = J'r, solved in closed form
+        a, b, c = jac_mu @ jac_mu, jac_mu @ jac_sigma, jac_sigma @ jac_sigma
+        g_mu, g_sigma = jac_mu @ residuals, jac_sigma @ residuals
+        a_damped, c_damped = a * (1 + damping), c * (1 + damping)
+        det = a_damped*c_damped - b*b
+        if not det > 0:
+            break
+        step = np.array([(c_damped*g_mu - b*g_sigma) / det, (a_damped*g_sigma - b*g_mu) / det])
+        new_params = params + step
+        if new_params[1] <= 0:
+            damping *= 10
+            continue
+        new_residuals, new_jac_mu, new_jac_sigma = _normal_cdf_residuals(x, y, sigma, new_params)
+        new_cost = new_residuals @ new_residuals
+        if new_cost <= cost:
+            params, residuals, jac_mu, jac_sigma, cost = new_params, new_residuals, new_jac_mu, new_jac_sigma, new_cost
+            damping = max(damping / 10, 1e-12)
+            # relative to the parameter vector's norm as MINPACK does, so a mu of about 0 can still converge
+            if np.linalg.norm(step) <= xtol * (np.linalg.norm(params) + xtol):
+                converged = True
+                break
+        else:
+            damping *= 10
+            if damping > 1e12:
+                converged = True
+                break
+
+    dof = len(x) - len(params)
+    a, b, c = jac_mu @ jac_mu, jac_mu @ jac_sigma, jac_sigma @ jac_sigma
+    det = a*c - b*b
+    if dof > 0 and det > 0:
+        pcov = np.array([[c, -b], [-b, a]]) / det * cost / dof
+    else:
+        pcov = np.full((2, 2), np.inf)
+    return params, pcov, iterations, converged
+
+
+def fit_normal_cdf(lines, p0=None, method='gauss_newton'):
+    """lines is a LinesBook or a make_lines_dict dict, only levels quoted on both sides are used.
+    method='curve_fit' runs the original generic scipy fit from p0=[0,1], its iterations are function evaluations."""
+    x, y, sigma_uncertainty = normal_cdf_fit_data(lines)
+    with instrumentation.timer('fit', method=method):
+        if method == 'curve_fit':
+            import scipy.stats as stats
+            from scipy.optimize import curve_fit
+            try:
+                popt, pcov, infodict, _, ier = curve_fit(stats.norm.cdf, x, y, p0=[0,1] if p0 is None else p0,
+                                                         sigma=sigma_uncertainty, full_output=True)
+            except RuntimeError:
+                # raised when leastsq finds no solution (ier not 1 to 4), counted as a fit that didn't converge
+                instrumentation.record_fit(method, None, False)
+                raise
+            iterations = int(infodict['nfev'])
+            converged = ier in (1, 2, 3, 4)
+        elif method == 'gauss_newton':
+            popt, pcov, iterations, converged = fit_normal_cdf_gauss_newton(x, y, sigma_uncertainty, p0=p0)
+        else:
+            raise ValueError(f'Unknown fit method {method}')
+    instrumentation.record_fit(method, iterations, converged)
     mu_fit, sigma_fit = popt
     return {
         'mu': mu_fit,
         'sigma': sigma_fit,
         'popt': popt,
         'pcov': pcov,
+        'iterations': iterations,
+        'converged': converged,
     }
+
+
+class NormalCdfFitter:
+    """Refits events tick after tick, warm starting each fit from the previous fit of the same event"""
+
+    def __init__(self, method='gauss_newton'):
+        self.method = method
+        self.previous = {}
+
+    def fit(self, key, lines):
+        model = fit_normal_cdf(lines, p0=self.previous.get(key), method=self.method)
+        if model['converged']:
+            self.previous[key] = model['popt']
+        return model
+
+    def forget(self, key):
+        self.previous.pop(key, None)
     
 
-def plot_normal_cdf(ax, model, xrange=None, plot_cov=False, cov_std_devs=2, num_points=300, color=None, label=None):
+def pad_fit_data(lines_list):
+    """Stacks normal_cdf_fit_data of many ladders into (N, M) arrays padded to the longest ladder.
+    Returns x, y, sigma, mask where mask is False on padding."""
+    data = [normal_cdf_fit_data(lines) for lines in lines_list]
+    width = max([len(x) for x, _, _ in data], default=0) or 1
+    x = np.zeros((len(data), width))
+    y = np.full((len(data), width), 0.5)
+    sigma = np.ones((len(data), width))
+    mask = np.zeros((len(data), width), dtype=bool)
+    for i, (x_i, y_i, sigma_i) in enumerate(data):
+        n = len(x_i)
+        x[i, :n] = x_i
+        y[i, :n] = y_i
+        sigma[i, :n] = sigma_i
+        mask[i, :n] = True
+    return x, y, sigma, mask
+
+
+def probit_initial_estimate_batch(x, y, sigma, mask):
+    """Row-wise probit_initial_estimate of padded arrays, returns (N, 2)"""
+    z = special.ndtri(np.clip(y, 1e-6, 1 - 1e-6))
+    w = np.where(mask, (np.exp(-z**2 / 2) / sigma)**2, 0)
+    sw = w.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = (w*x).sum(axis=1) / sw
+        z_mean = (w*z).sum(axis=1) / sw
+        slope = (w*(x - x_mean[:, None])*(z - z_mean[:, None])).sum(axis=1) / (w*(x - x_mean[:, None])**2).sum(axis=1)
+        bad = ~np.isfinite(slope) | (slope <= 0)
+        mu = np.where(bad, x_mean, x_mean - z_mean/slope)
+        scale = np.where(bad, 12.0, 1/slope)
+    return np.stack([mu, scale], axis=1)
+
+
+def _normal_cdf_residuals_batch(x, y, sigma, mask, params):
+    z = (x - params[:, :1]) / params[:, 1:]
+    residuals = np.where(mask, (y - special.ndtr(z)) / sigma, 0)
+    jac_mu = np.where(mask, -np.exp(-z**2 / 2) / (np.sqrt(2*np.pi) * params[:, 1:] * sigma), 0)
+    return residuals, jac_mu, jac_mu * z
+
+
+def fit_normal_cdf_gauss_newton_batch(x, y, sigma, mask, p0=None, max_iterations=50, xtol=1e-10):
+    """fit_normal_cdf_gauss_newton over every row of padded arrays at once.
+    Each row keeps its own damping and stops updating once it has converged.
+    Returns popt (N, 2), pcov (N, 2, 2), iterations (N,), converged (N,)."""
+    n_rows = len(x)
+    params = probit_initial_estimate_batch(x, y, sigma, mask) if p0 is None else np.array(p0, dtype=float).reshape(n_rows, 2)
+    residuals, jac_mu, jac_sigma = _normal_cdf_residuals_batch(x, y, sigma, mask, params)
+    cost = (residuals**2).sum(axis=1)
+    damping = np.full(n_rows, 1e-6)
+    iterations = np.zeros(n_rows, dtype=int)
+    converged = np.zeros(n_rows, dtype=bool)
+    active = mask.sum(axis=1) >= 2
+
+    for _ in range(max_iterations):
+        rows = np.flatnonzero(active)
+        if len(rows) == 0:
+            break
+        iterations[rows] += 1
+        r, j_mu, j_sigma = residuals[rows], jac_mu[rows], jac_sigma[rows]
+        a = (j_mu*j_mu).sum(axis=1)
+        b = (j_mu*j_sigma).sum(axis=1)
+        c = (j_sigma*j_sigma).sum(axis=1)
+        g_mu = (j_mu*r).sum(axis=1)
+        g_sigma = (j_sigma*r).sum(axis=1)
+        a_damped = a * (1 + damping[rows])
+        c_damped = c * (1 + damping[rows])
+        det = a_damped*c_damped - b*b
+        singular = ~(det > 0)
+        active[rows[singular]] = False
+        with np.errstate(invalid='ignore', divide='ignore'):
+            step = np.stack([(c_damped*g_mu - b*g_sigma) / det, (a_damped*g_sigma - b*g_mu) / det], axis=1)
+        new_params = params[rows] + step
+
+        bad_scale = ~singular & ~(new_params[:, 1] > 0)
+        damping[rows[bad_scale]] *= 10
+        trial = ~singular & ~bad_scale
+        rows, step, new_params = rows[trial], step[trial], new_params[trial]
+        if len(rows) == 0:
+            continue
+
+        new_residuals, new_jac_mu, new_jac_sigma = _normal_cdf_residuals_batch(x[rows], y[rows], sigma[rows], mask[rows], new_params)
+        new_cost = (new_residuals**2).sum(axis=1)
+        accept = new_cost <= cost[rows]
+        accepted = rows[accept]
+        params[accepted] = new_params[accept]
+        residuals[accepted] = new_residuals[accept]
+        jac_mu[accepted] = new_jac_mu[accept]
+        jac_sigma[accepted] = new_jac_sigma[accept]
+        cost[accepted] = new_cost[accept]
+        damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+        small_step = np.linalg.norm(step[accept], axis=1) <= xtol * (np.linalg.norm(new_params[accept], axis=1) + xtol)
+        converged[accepted[small_step]] = True
+
+        rejected = rows[~accept]
+        damping[rejected] *= 10
+        converged[rejected[damping[rejected] > 1e12]] = True
+        active[converged] = False
+
+    dof = mask.sum(axis=1) - 2
+    a = (jac_mu*jac_mu).sum(axis=1)
+    b = (jac_mu*jac_sigma).sum(axis=1)
+    c = (jac_sigma*jac_sigma).sum(axis=1)
+    det = a*c - b*b
+    pcov = np.full((n_rows, 2, 2), np.inf)
+    ok = (dof > 0) & (det > 0)
+    scale = cost[ok] / dof[ok] / det[ok]
+    pcov[ok, 0, 0] = c[ok] * scale
+    pcov[ok, 0, 1] = pcov[ok, 1, 0] = -b[ok] * scale
+    pcov[ok, 1, 1] = a[ok] * scale
+    params[mask.sum(axis=1) < 2] = np.nan
+    return params, pcov, iterations, converged
+
+
+def _fit_padded_chunk(args):
+    return fit_normal_cdf_gauss_newton_batch(*args)
+
+
+def fit_normal_cdf_batch(lines_list, p0=None, processes=None, chunk_size=2000):
+    """Fits many ladders (LinesBooks or make_lines_dict dicts) in one call.
+    Ladders are padded into masked (N, M) arrays and fitted with vectorized Gauss-Newton iterations.
+    With processes > 1 and more than chunk_size ladders, chunks are fitted in a process pool.
+    Returns a dict of arrays: 'mu' (N,), 'sigma' (N,), 'popt' (N, 2), 'pcov' (N, 2, 2),
+    'iterations' (N,) and 'converged' (N,). Ladders with fewer than 2 points get nan parameters."""
+    x, y, sigma, mask = pad_fit_data(lines_list)
+    p0 = None if p0 is None else np.array(p0, dtype=float).reshape(len(x), 2)
+    if processes is not None and processes > 1 and len(x) > chunk_size:
+        from concurrent.futures import ProcessPoolExecutor
+        starts = range(0, len(x), chunk_size)
+        chunks = [(x[i:i+chunk_size], y[i:i+chunk_size], sigma[i:i+chunk_size], mask[i:i+chunk_size],
+                   None if p0 is None else p0[i:i+chunk_size]) for i in starts]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_fit_padded_chunk, chunks))
+        popt, pcov, iterations, converged = (np.concatenate(parts) for parts in zip(*results))
+    else:
+        popt, pcov, iterations, converged = fit_normal_cdf_gauss_newton_batch(x, y, sigma, mask, p0=p0)
+    if instrumentation.ENABLED:
+        for row_iterations, row_converged in zip(iterations.tolist(), converged.tolist()):
+            instrumentation.record_fit('gauss_newton_batch', row_iterations, row_converged)
+    return {
+        'mu': popt[:, 0],
+        'sigma': popt[:, 1],
+        'popt': popt,
+        'pcov': pcov,
+        'iterations': iterations,
+        'converged': converged,
+    }
+
+
+def normal_cdf_curve(model, xrange=(-100, 100), num_points=None):
+    """(x, y) samples of a fitted cdf over xrange. With num_points None, 150 points cover mu +- 6 sigma,
+    where the cdf moves, and the flat tails outside it get just their end points."""
     mu = model['mu']
     sigma = model['sigma']
-    if xrange is None:
-        # xrange = [mu - 1.2*sigma, mu + 1.2*sigma]
-        xrange = ax.get_xlim()
-        xrange = [-100, 100]
-    x_data = np.linspace(xrange[0], xrange[1], num_points)
-    y_data = stats.norm.cdf(x_data, mu, sigma)
-    ax.plot(x_data, y_data, color=color, label=label)
-    if plot_cov:
-        popt = model['popt']
-        pcov = model['pcov']
-        perr = np.sqrt(np.diag(pcov))
-        ax.fill_between(x_data, stats.norm.cdf(x_data, *(popt - cov_std_devs*perr)), stats.norm.cdf(x_data, *(popt + cov_std_devs*perr)), color='gray', alpha=0.2)
-
-
-class Ruler:
-    def __init__(self, ax):
-        self.ax = ax
-        self.line_v = None
-        self.line_h = None
-        self.text_v = None
-        self.text_h = None
-        self.points = []
-        self.cid_press = ax.figure.canvas.mpl_connect('button_press_event', self.on_press)
-
-    def on_press(self, event):
-        if event.inaxes == self.ax:
-            rounded_x = round(event.xdata*2)/2
-            self.points.append((rounded_x, event.ydata))
-            if len(self.points) == 2:
-                self.draw_ruler()
-                self.points = []
-
-    def draw_ruler(self):
-        x1, y1 = self.points[0]
-        x2, y2 = self.points[1]
-
-        if self.line_v:
-            self.line_v.remove()
-        if self.line_h:
-            self.line_h.remove()
-        if self.text_v:
-            self.text_v.remove()
-        if self.text_h:
-            self.text_h.remove()
-
-        self.line_v, = self.ax.plot([x1, x1], [y1, y2], color='black', linestyle='--', linewidth=2)
-        self.line_h, = self.ax.plot([x1, x2], [y2, y2], color='black', linestyle='--', linewidth=2)
-
-        distance_v = abs(x2 - x1)
-        distance_h = abs(y2 - y1)
-
-        # Calculate text position for vertical distance
-        text_v_x = (x1 + x2) / 2
-        text_v_y = y2 + 0.03 * (self.ax.get_ylim()[1] - self.ax.get_ylim()[0])
-        self.text_v = self.ax.text(text_v_x, text_v_y, f'dx: {distance_v:.1f}', color='black', ha='center', va='center')
-
-        # Calculate text position for horizontal distance
-        text_h_x = x1 - 0.05 * (self.ax.get_xlim()[1] - self.ax.get_xlim()[0])
-        text_h_y = (y1 + y2) / 2
-        self.text_h = self.ax.text(text_h_x, text_h_y, f'prob: {distance_h:.3f}\nodds: {1/distance_h:.2f}', color='black', ha='center', va='center')
-
-        plt.draw()
\ No newline at end of file
+    if num_points is not None:
+        x_data = np.linspace(xrange[0], xrange[1], num_points)
+    else:
+        low, high = max(xrange[0], mu - 6*sigma), min(xrange[1], mu + 6*sigma)
+        middle = np.linspace(low, high, 150) if low < high else np.zeros(0)
+        x_data = np.unique(np.concatenate([[xrange[0]], middle, [xrange[1]]]))
+    return x_data, special.ndtr((x_data - mu) / sigma)